@@ -9,7 +9,14 @@ Usage:
     python download_video.py "https://example.com/video.mp4"
     python download_video.py "URL" -o /output/path -n my_video
     python download_video.py "URL" -f  # Extract frames
+    python download_video.py "URL" -f --range 00:07-00:13  # Frames from a time window
     python download_video.py "URL" -i  # Get info only
+    python download_video.py "URL" --connections 8  # Parallel ranged download
+    python download_video.py "URL" -f --json --trace trace.json  # JSON result and timing trace
+    python download_video.py cache stats  # Show download cache usage
+    python download_video.py batch urls.txt -f  # Download and analyze many videos
+    python download_video.py scan ~/Videos --list  # Index a local video library
+    python download_video.py serve &  # Warm daemon that runs later invocations
 """
 
 import argparse
@@ -17,24 +24,50 @@ import os
 import sys
 import subprocess
 import json
+import math
 import shutil
+import socket
+import sqlite3
+import tempfile
+import time
+from contextlib import redirect_stdout
+from functools import partial
 from pathlib import Path
-from urllib.parse import urlparse, unquote
 
-# Try to import requests, install if not available
-try:
-    import requests
-except ImportError:
-    print("Installing requests library...")
-    subprocess.check_call([sys.executable, "-m", "pip", "install", "requests", "-q"])
-    import requests
 
-# Supported video formats
-SUPPORTED_FORMATS = {'.mp4', '.webm', '.mkv', '.avi', '.mov', '.m4v', '.wmv', '.flv'}
+# Code shared with scripts/download_video.py, kept next to this script
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import video_common
+from video_common import (
+    requests, DEFAULT_CONNECTIONS, DEFAULT_CACHE_DIR, DEFAULT_LIBRARY_INDEX, DEFAULT_CACHE_SIZE_MB,
+    DEFAULT_DAEMON_IDLE_MINUTES, DEFAULT_DAEMON_WORKERS, FRAME_FORMATS, DEFAULT_ANALYSIS_WIDTH, DEFAULT_TARGET_FPS,
+    DEFAULT_MIN_HOLD, DEFAULT_MIN_MOTION, DEFAULT_COMPARE_WIDTH, SSIM_WINDOW, DEFAULT_WORST_FRAMES, PHASH_SIZE,
+    DEFAULT_DEDUP_DISTANCE, DEFAULT_FRAME_STORE_SIZE_MB, FRAME_ARCHIVE_NAME, DEFAULT_TILE_WIDTH, DEFAULT_JOBS,
+    DEFAULT_CONNECTIONS_PER_HOST, LIBRARY_COLUMNS, RangeNotSupportedError, ProbeError, TRACE, own_peak_rss,
+    trace_connection, cache_stats, cache_prune, fetch_video, fetch_clip, is_streamable, fetch_head,
+    has_pending_download, tee_download, request_first_byte, check_ffmpeg, probe_video, invalidate_probes, prune_probes,
+    summarize_probe, parse_frame_rate, probe_url, get_filename_from_url, get_file_extension, get_total_size, parse_time,
+    parse_time_range, image_encoder_args, frame_store_prune, write_contact_sheets, write_frame_archive, export_frames,
+    decode_frames, describe_frames, format_timing, analyze_motion, compare_videos, smart_timestamps, query_library,
+    scan_library, parse_area, parse_library_filter, parse_offset, parse_grid, parse_scale, parse_crop, parse_sha256,
+    parse_frame_numbers, parse_tile_layout, check_frame_options, resolve_time_window, read_url_list, run_batch,
+    script_identity, forward_to_daemon, serve,
+)
+
+# Messages from the shared code say in words what scripts/download_video.py marks with symbols
+video_common.MESSAGE_MARKS.update(ok='', warning='Warning:', error='Error:')
 
 # Default output directory
 DEFAULT_OUTPUT_DIR = "/mnt/user-data/outputs"
 
+# Unix socket the serve command listens on
+DEFAULT_DAEMON_SOCKET = os.environ.get('VIDEO_DAEMON_SOCKET', os.path.join(DEFAULT_CACHE_DIR, 'skill-daemon.sock'))
+
+DEFAULT_FRAME_FORMAT = 'jpg'
+# Extracted and exported frames are named after their number like this
+FRAME_NAME = 'frame_{:03d}'
+
 
 def get_default_output_dir():
     """Get the default output directory, falling back to current directory if needed."""
@@ -43,106 +76,8 @@ def get_default_output_dir():
     return os.getcwd()
 
 
-def get_filename_from_url(url):
-    """Extract filename from URL."""
-    parsed = urlparse(url)
-    path = unquote(parsed.path)
-    filename = os.path.basename(path)
-
-    if not filename or not any(filename.lower().endswith(ext) for ext in SUPPORTED_FORMATS):
-        # Generate a default name if none found
-        filename = "video.mp4"
-
-    return filename
-
-
-def get_file_extension(url, content_type=None):
-    """Get file extension from URL or content type."""
-    # First try from URL
-    parsed = urlparse(url)
-    path = unquote(parsed.path)
-    _, ext = os.path.splitext(path)
-
-    if ext.lower() in SUPPORTED_FORMATS:
-        return ext.lower()
-
-    # Try from content type
-    if content_type:
-        content_type = content_type.lower()
-        if 'mp4' in content_type:
-            return '.mp4'
-        elif 'webm' in content_type:
-            return '.webm'
-        elif 'matroska' in content_type or 'mkv' in content_type:
-            return '.mkv'
-        elif 'avi' in content_type:
-            return '.avi'
-        elif 'quicktime' in content_type or 'mov' in content_type:
-            return '.mov'
-
-    # Default to mp4
-    return '.mp4'
-
-
-def download_video(url, output_dir, custom_name=None, show_progress=True):
-    """Download a video file from a URL."""
-    print(f"Downloading video from: {url}")
-
-    # Create output directory if it doesn't exist
-    os.makedirs(output_dir, exist_ok=True)
-
-    # Start download with streaming
-    response = requests.get(url, stream=True, timeout=30)
-    response.raise_for_status()
-
-    # Get content info
-    content_type = response.headers.get('Content-Type', '')
-    content_length = response.headers.get('Content-Length')
-    total_size = int(content_length) if content_length else None
-
-    # Determine filename
-    if custom_name:
-        ext = get_file_extension(url, content_type)
-        filename = f"{custom_name}{ext}"
-    else:
-        filename = get_filename_from_url(url)
-
-    output_path = os.path.join(output_dir, filename)
-
-    # Download with progress
-    downloaded = 0
-    chunk_size = 8192
-
-    with open(output_path, 'wb') as f:
-        for chunk in response.iter_content(chunk_size=chunk_size):
-            if chunk:
-                f.write(chunk)
-                downloaded += len(chunk)
-
-                if show_progress and total_size:
-                    percent = (downloaded / total_size) * 100
-                    mb_downloaded = downloaded / (1024 * 1024)
-                    mb_total = total_size / (1024 * 1024)
-                    print(f"\rProgress: {percent:.1f}% ({mb_downloaded:.1f}/{mb_total:.1f} MB)", end='', flush=True)
-
-    if show_progress:
-        print()  # New line after progress
-
-    file_size = os.path.getsize(output_path)
-    print(f"Downloaded: {output_path} ({file_size / (1024 * 1024):.2f} MB)")
-
-    return output_path
-
-
-def check_ffmpeg():
-    """Check if ffmpeg and ffprobe are available."""
-    ffmpeg_available = shutil.which('ffmpeg') is not None
-    ffprobe_available = shutil.which('ffprobe') is not None
-    return ffmpeg_available, ffprobe_available
-
-
-def get_video_info(video_path):
-    """Get video metadata using ffprobe."""
+def get_video_info(video_path, refresh=False):
+    """Get video metadata using ffprobe (cached while the file is unchanged)."""
     _, ffprobe_available = check_ffmpeg()
 
     if not ffprobe_available:
@@ -154,55 +89,18 @@ def get_video_info(video_path):
         }
 
     try:
-        cmd = [
-            'ffprobe',
-            '-v', 'quiet',
-            '-print_format', 'json',
-            '-show_format',
-            '-show_streams',
-            video_path
-        ]
-
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=30)
+        data = probe_video(video_path, refresh)
 
-        if result.returncode != 0:
-            print(f"ffprobe error: {result.stderr}")
-            return None
-
-        data = json.loads(result.stdout)
-
-        # Extract useful information
         info = {
             'filename': os.path.basename(video_path),
             'file_size': os.path.getsize(video_path)
         }
-
-        # Get format info
-        if 'format' in data:
-            fmt = data['format']
-            info['duration'] = float(fmt.get('duration', 0))
-            info['format_name'] = fmt.get('format_name', 'unknown')
-            info['bitrate'] = int(fmt.get('bit_rate', 0)) if fmt.get('bit_rate') else None
-
-        # Get video stream info
-        for stream in data.get('streams', []):
-            if stream.get('codec_type') == 'video':
-                info['width'] = stream.get('width')
-                info['height'] = stream.get('height')
-                info['video_codec'] = stream.get('codec_name')
-                info['frame_rate'] = stream.get('r_frame_rate')
-                break
-
-        # Get audio stream info
-        for stream in data.get('streams', []):
-            if stream.get('codec_type') == 'audio':
-                info['audio_codec'] = stream.get('codec_name')
-                info['audio_channels'] = stream.get('channels')
-                info['sample_rate'] = stream.get('sample_rate')
-                break
-
+        info.update(summarize_probe(data))
         return info
 
+    except ProbeError as e:
+        print(f"ffprobe error: {e}")
+        return None
     except subprocess.TimeoutExpired:
         print("ffprobe timed out")
         return None
@@ -248,8 +146,168 @@ def print_video_info(info):
     print("=" * 25)
 
 
-def extract_frames(video_path, output_dir=None, num_frames=5):
-    """Extract key frames from a video for analysis."""
+def extract_frames_at(video_path, timestamps, frames_dir, fps=None, offset=0, dedup=None, duplicates=None,
+                      scale=None, crop=None, image_format=DEFAULT_FRAME_FORMAT, quality=None, frame_shape=None,
+                      jobs=1, frame_store=None, frame_store_size_mb=DEFAULT_FRAME_STORE_SIZE_MB, source=None):
+    """Extract one image per timestamp (frame_NNN.jpg) with a single ffmpeg decode pass.
+
+    Returns (path, source_timestamp) pairs for the frames that were written.
+    offset is the source time at which video_path begins; timestamps are source times.
+    scale and crop are applied while decoding (see iter_frames()); image_format and
+    quality pick the encoder (see image_encoder_args()), and frame_shape receives the
+    shape of the decoded frames (see write_frames()).
+    With dedup=D, frames within D hash bits of the last frame kept (see dedup_frames())
+    are neither encoded nor written; kept frames are numbered consecutively and
+    (source_timestamp, path of the frame that stands in for it) is appended to
+    duplicates for every timestamp that was skipped. jobs > 1 without dedup splits the
+    pass into keyframe-aligned segments decoded by that many worker processes (see
+    extract_frames_parallel()), with the same frames and timestamps. frame_store is a
+    directory keeping frames for later runs on the same video; only the frames it
+    lacks are decoded (see stored_frames()). source is a pipe of the video's bytes to
+    decode instead of video_path (see iter_frames()); it skips the frame store and jobs.
+    """
+    # Timestamps that fall on the same source frame are decoded once
+    if fps:
+        slots = [math.ceil(ts * fps - 1e-6) for ts in timestamps]
+    else:
+        slots = list(timestamps)
+    first_for_slot = {}
+    for ts, slot in sorted(zip(timestamps, slots)):
+        first_for_slot.setdefault(slot, ts)
+    unique_timestamps = sorted(first_for_slot.values())
+    file_timestamps = [ts - offset for ts in unique_timestamps]
+
+    tmp_dir = tempfile.mkdtemp(prefix='.select-', dir=frames_dir)
+    try:
+        try:
+            # Input seeking skips everything before the first timestamp
+            first = max(0.0, file_timestamps[0])
+            dropped = []
+            frame_times, reused = decode_frames(
+                video_path, os.path.join(tmp_dir, f'%03d.{image_format}'), scale, crop, image_format, quality, jobs,
+                frame_store, frame_store_size_mb, dedup, dropped, frame_shape, source,
+                timestamps=file_timestamps, start=first
+            )
+            if reused is not None:
+                print(f"Reused {reused} frames from the frame store, decoded {len(frame_times) - reused}")
+        except RuntimeError as e:
+            print(f"  {e}")
+            frame_times = []
+
+        # Selected frames come out in timestamp order; each is the n-th encoded
+        # file, or a dropped repeat of it
+        timeline = sorted([(timestamp, n) for n, timestamp in enumerate(frame_times)] + dropped)
+        decoded = {}
+        for ts, (decoded_time, n) in zip(unique_timestamps, timeline):
+            decoded[ts] = (os.path.join(tmp_dir, f"{n + 1:03d}.{image_format}"), round(offset + decoded_time, 6))
+
+        extracted_frames = []
+        written = {}
+        for i, (timestamp, slot) in enumerate(zip(timestamps, slots)):
+            if first_for_slot[slot] not in decoded:
+                print(f"  Failed to extract frame at {timestamp:.1f}s")
+                continue
+            source, source_time = decoded[first_for_slot[slot]]
+            if dedup is not None and source in written:
+                # A repeat of a frame already written, or the same source frame again
+                if duplicates is not None:
+                    duplicates.append((source_time, written[source]))
+                continue
+            number = len(extracted_frames) + 1 if dedup is not None else i + 1
+            output_file = os.path.join(frames_dir, f"{FRAME_NAME.format(number)}.{image_format}")
+            shutil.copyfile(source, output_file)
+            written[source] = output_file
+            extracted_frames.append((output_file, source_time))
+            print(f"  Extracted: {output_file} (at {source_time:.2f}s)")
+
+        return extracted_frames
+
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def extract_contact_sheets_at(video_path, timestamps, frames_dir, grid, area=None, tile_width=DEFAULT_TILE_WIDTH,
+                              offset=0, image_format=DEFAULT_FRAME_FORMAT, quality=None, source=None):
+    """Tile the frames at the given source timestamps into sheet_NNN.jpg contact sheets.
+
+    All sheets come from a single ffmpeg decode pass (see write_contact_sheets()),
+    reading source instead of video_path when it is given.
+    Returns (path, source_timestamp, tile) triples, tile being the position of
+    the frame on its sheet, counted row by row from 0.
+    """
+    cols, rows = grid
+    file_timestamps = sorted({ts - offset for ts in timestamps})
+    try:
+        tile_times = write_contact_sheets(
+            video_path, os.path.join(frames_dir, f'sheet_%03d.{image_format}'), grid,
+            timestamps=file_timestamps, start=max(0.0, file_timestamps[0]), area=area, tile_width=tile_width,
+            label_offset=offset, encoder_args=image_encoder_args(image_format, quality), source=source,
+        )
+    except RuntimeError as e:
+        print(f"  {e}")
+        return []
+
+    tiles = []
+    for n, tile_time in enumerate(tile_times):
+        path = os.path.join(frames_dir, f"sheet_{n // (cols * rows) + 1:03d}.{image_format}")
+        tiles.append((path, round(offset + tile_time, 6), n % (cols * rows)))
+    for path in sorted({path for path, _, _ in tiles}):
+        print(f"  Created: {path}")
+    return tiles
+
+
+def write_frame_manifest(frames_dir, video_path, frames, packed=False, **details):
+    """Write manifest.json mapping every extracted frame to its source timestamp.
+
+    frames are (path, timestamp) pairs, or (path, timestamp, tile) triples for
+    contact sheets. packed=True lists them by their number in a packed frame
+    archive, from 1, instead of by file.
+    """
+    entries = []
+    for number, (path, timestamp, *tile) in enumerate(frames, start=1):
+        entry = {'frame': number} if packed else {'file': os.path.basename(path)}
+        if tile:
+            entry['tile'] = tile[0]
+        entry['timestamp'] = timestamp
+        entries.append(entry)
+    manifest = {
+        'video': str(video_path),
+        **details,
+        'frames': entries,
+    }
+    manifest_path = os.path.join(frames_dir, 'manifest.json')
+    with open(manifest_path, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    return manifest_path
+
+
+def extract_frames(video_path, output_dir=None, num_frames=5, start=None, end=None, offset=0, smart=False,
+                   dedup=None, contact_sheet=None, area=None, tile_width=DEFAULT_TILE_WIDTH,
+                   scale=None, crop=None, image_format=DEFAULT_FRAME_FORMAT, quality=None, jobs=1,
+                   frame_store=None, frame_store_size_mb=DEFAULT_FRAME_STORE_SIZE_MB, pack=False,
+                   source=None, info=None):
+    """Extract key frames from a video for analysis, optionally only between start and end seconds.
+
+    offset is the source time at which video_path begins, for clips cut out of
+    a longer video; start, end and the manifest timestamps are source times.
+    With smart=True, num_frames is a budget spent where the picture changes
+    (see smart_timestamps()) instead of on evenly spaced frames. dedup=D skips
+    frames within D hash bits of the last frame kept (see dedup_frames()).
+    contact_sheet=(cols, rows) tiles the frames into contact sheets instead,
+    optionally cropped to area; the sheet paths are returned. scale=(width, height)
+    and crop=(x, y, width, height) are applied while decoding, and frames are
+    written as image_format ('png', 'jpg', 'webp' or 'raw') at quality 1-100.
+    jobs > 1 decodes keyframe-aligned segments in that many worker processes, and
+    frame_store reuses frames extracted by earlier runs (see extract_frames_at()).
+    pack=True writes the frames into a single FRAME_ARCHIVE_NAME archive instead
+    (see write_frame_archive()), rendering them in a local scratch directory
+    first, and returns the archive path alone.
+    source is a pipe of the video's bytes to decode in one pass while video_path is
+    still being downloaded (see stream_video()), and info its get_video_info()
+    summary, read from the URL because the file cannot be probed yet. source cannot
+    be combined with smart, and it skips the frame store and jobs, which need the
+    whole file.
+    """
     ffmpeg_available, _ = check_ffmpeg()
 
     if not ffmpeg_available:
@@ -259,13 +317,16 @@ def extract_frames(video_path, output_dir=None, num_frames=5):
         return []
 
     # Get video info for duration
-    info = get_video_info(video_path)
-    if not info or 'duration' not in info:
+    if info is None:
+        info = get_video_info(video_path)
+    if info and 'duration' in info:
+        duration = info['duration']
+    elif end is not None:
+        duration = end - offset
+    else:
         print("Could not determine video duration. Extracting first frame only.")
         num_frames = 1
         duration = 1
-    else:
-        duration = info['duration']
 
     # Determine output directory for frames
     if output_dir is None:
@@ -275,141 +336,959 @@ def extract_frames(video_path, output_dir=None, num_frames=5):
     frames_dir = os.path.join(output_dir, f"{video_name}_frames")
     os.makedirs(frames_dir, exist_ok=True)
 
-    # Calculate frame timestamps
-    if duration > 0 and num_frames > 1:
-        interval = duration / (num_frames + 1)
-        timestamps = [interval * (i + 1) for i in range(num_frames)]
+    # Calculate frame timestamps, spread evenly over the requested window
+    window_start = start if start is not None else offset
+    window_end = min(end, offset + duration) if end is not None else offset + duration
+    windowed = start is not None or end is not None
+    phases = None
+    if smart:
+        print("Finding where the picture changes...")
+        try:
+            file_timestamps, phases = smart_timestamps(
+                video_path, num_frames, window_start - offset, window_end - offset
+            )
+        except RuntimeError as e:
+            print(f"Error: {e}")
+            return []
+        timestamps = [offset + ts for ts in file_timestamps]
+        transitions = sum(phase['kind'] == 'motion' for phase in phases)
+        print(f"Found {transitions} transitions and {len(phases) - transitions} holds")
+    elif window_end > window_start and (num_frames > 1 or windowed):
+        interval = (window_end - window_start) / (num_frames + 1)
+        timestamps = [window_start + interval * (i + 1) for i in range(num_frames)]
+    else:
+        timestamps = [window_start]
+
+    if windowed:
+        print(f"Extracting {len(timestamps)} frames between {window_start:.2f}s and {window_end:.2f}s...")
+    else:
+        print(f"Extracting {len(timestamps)} frames...")
+
+    fps = parse_frame_rate(info.get('frame_rate')) if info else None
+    duplicates = []
+    frame_shape = []
+    if contact_sheet:
+        frames = extract_contact_sheets_at(
+            video_path, timestamps, frames_dir, contact_sheet, area, tile_width, offset, image_format, quality,
+            source
+        )
+    elif pack:
+        scratch = tempfile.mkdtemp(prefix='frames-')
+        try:
+            frames = extract_frames_at(
+                video_path, timestamps, scratch, fps, offset, dedup, duplicates,
+                scale, crop, image_format, quality, frame_shape, jobs, frame_store, frame_store_size_mb, source
+            )
+            archive_path = os.path.join(frames_dir, FRAME_ARCHIVE_NAME)
+            write_frame_archive([path for path, _ in frames], [timestamp for _, timestamp in frames],
+                                archive_path, image_format, frame_shape)
+        finally:
+            shutil.rmtree(scratch, ignore_errors=True)
     else:
-        timestamps = [0]
+        frames = extract_frames_at(
+            video_path, timestamps, frames_dir, fps, offset, dedup, duplicates,
+            scale, crop, image_format, quality, frame_shape, jobs, frame_store, frame_store_size_mb, source
+        )
+    details = {'start': start, 'end': end, 'num_frames': num_frames}
+    if contact_sheet:
+        details['contact_sheet'] = f'{contact_sheet[0]}x{contact_sheet[1]}'
+    if pack and not contact_sheet:
+        details['archive'] = FRAME_ARCHIVE_NAME
+        details['format'] = image_format
+    describe_frames(details, image_format, frame_shape, phases, offset)
+    if dedup is not None:
+        # In an archive, a repeat points at the number of the frame standing in for it
+        numbers = {path: n for n, (path, _) in enumerate(frames, start=1)}
+        details['dedup_distance'] = dedup
+        details['duplicates'] = [
+            {'timestamp': timestamp, 'same_as': numbers[path] if pack else os.path.basename(path)}
+            for timestamp, path in duplicates
+        ]
+        print(f"Skipped {len(duplicates)} frames that repeat the previous frame")
+    write_frame_manifest(frames_dir, video_path, frames, packed=pack, **details)
+
+    if contact_sheet:
+        sheets = sorted({frame[0] for frame in frames})
+        print(f"\nTiled {len(frames)} frames into {len(sheets)} contact sheets in: {frames_dir}")
+        return sheets
+    if pack:
+        print(f"\nPacked {len(frames)} frames into: {archive_path}")
+        return [archive_path]
+    print(f"\nExtracted {len(frames)} frames to: {frames_dir}")
+    return [path for path, _ in frames]
 
-    extracted_frames = []
 
-    print(f"Extracting {len(timestamps)} frames...")
+def get_video_info_from_url(url):
+    """Get video information from URL without downloading.
 
-    for i, timestamp in enumerate(timestamps):
-        output_file = os.path.join(frames_dir, f"frame_{i + 1:03d}.jpg")
+    When the server honours range requests, ffprobe reads the stream metadata
+    straight from the URL. Otherwise only the response headers are reported.
+    """
+    print(f"Getting video info from: {url}")
 
-        cmd = [
-            'ffmpeg',
-            '-ss', str(timestamp),
-            '-i', video_path,
-            '-vframes', '1',
-            '-q:v', '2',
-            '-y',  # Overwrite
-            output_file
-        ]
+    try:
+        trace_connection(url)
+        with TRACE.span('ttfb', 'network', url=url):
+            response = request_first_byte(url)
+    except requests.exceptions.RequestException as e:
+        print(f"Error getting video info: {e}")
+        return None
 
+    content_type = response.headers.get('Content-Type', '')
+    content_length = get_total_size(response)
+
+    info = {
+        'url': url,
+        'content_type': content_type,
+        'filename': get_filename_from_url(url)
+    }
+    if content_length is not None:
+        info['file_size'] = content_length
+
+    if response.status_code != 206:
+        print("Server does not support range requests; showing header information only.")
+    elif not check_ffmpeg()[1]:
+        print("Warning: ffprobe not found. Install ffmpeg for detailed video info.")
+    else:
         try:
-            result = subprocess.run(cmd, capture_output=True, timeout=30)
-            if result.returncode == 0 and os.path.exists(output_file):
-                extracted_frames.append(output_file)
-                print(f"  Extracted: {output_file} (at {timestamp:.1f}s)")
-            else:
-                print(f"  Failed to extract frame at {timestamp:.1f}s")
+            info.update(summarize_probe(probe_url(response.url)))
+            print_video_info(info)
+            return info
+        except ProbeError as e:
+            print(f"ffprobe error: {e}")
         except subprocess.TimeoutExpired:
-            print(f"  Timeout extracting frame at {timestamp:.1f}s")
-        except Exception as e:
-            print(f"  Error extracting frame: {e}")
-
-    print(f"\nExtracted {len(extracted_frames)} frames to: {frames_dir}")
-    return extracted_frames
+            print("ffprobe timed out")
+        except json.JSONDecodeError:
+            print("Failed to parse ffprobe output")
+
+    print(f"\nFile: {info['filename']}")
+    if 'file_size' in info:
+        print(f"Size: {info['file_size'] / (1024 * 1024):.2f} MB")
+        print(f"Type: {content_type}")
+    else:
+        print(f"Type: {content_type}")
+        print("Size: Unknown (server did not provide Content-Length)")
+
+    return info
+
+
+def stream_video(url, output_dir, consume, custom_name=None, cache_dir=None, cache_size_mb=DEFAULT_CACHE_SIZE_MB,
+                 session=None, expected_size=None, expected_sha256=None):
+    """Download a video while consume(video_path, info, source) decodes it, so frames come before the download ends.
+
+    The video information (as get_video_info() reports it) is read from the
+    URL with ffprobe first, since the frame timestamps depend on the duration.
+    The file is then fetched in order over one connection and its bytes are
+    teed into a pipe that consume reads in a worker thread, e.g. by handing
+    it to extract_frames() as source; video_path is where the file will be
+    once it is complete.
+
+    Returns (video_path, info, consume's result). Returns None without
+    downloading when the file cannot be decoded as it arrives (an MP4 with
+    its moov index at the end, another container), when its duration cannot
+    be read from the URL, or when the cache or an interrupted download
+    already holds it, so the caller downloads and decodes in turn. Raises on
+    download errors like fetch_video().
+    """
+    try:
+        head, response = fetch_head(url, session=session)
+    except requests.exceptions.RequestException:
+        # The download reports the error
+        return None
 
+    if custom_name:
+        filename = f"{custom_name}{get_file_extension(url, response.headers.get('Content-Type'))}"
+    else:
+        filename = get_filename_from_url(url)
+    output_path = os.path.join(output_dir, filename)
+    if has_pending_download(url, output_path, cache_dir):
+        return None
+    if not is_streamable(head):
+        print("Warning: Only WebM and MP4 with its index at the start can be decoded while downloading; "
+              "extracting frames afterwards")
+        return None
 
-def get_video_info_from_url(url):
-    """Get video information from URL without downloading."""
-    print(f"Getting video info from: {url}")
+    if response.status_code != 206:
+        print("Warning: Server does not support range requests, so the duration cannot be read before the "
+              "download; extracting frames afterwards")
+        return None
+    if not check_ffmpeg()[1]:
+        print("Warning: ffprobe not found; extracting frames after the download")
+        return None
 
+    info = {'filename': filename}
+    total_size = get_total_size(response)
+    if total_size is not None:
+        info['file_size'] = total_size
     try:
-        # Use HEAD request first to check availability
-        response = requests.head(url, timeout=10, allow_redirects=True)
-        response.raise_for_status()
+        info.update(summarize_probe(probe_url(response.url)))
+    except ProbeError as e:
+        print(f"ffprobe error: {e}")
+    except subprocess.TimeoutExpired:
+        print("ffprobe timed out")
+    except json.JSONDecodeError:
+        print("Failed to parse ffprobe output")
+    if not info.get('duration'):
+        print("Warning: Could not read the video duration from the URL; extracting frames afterwards")
+        return None
+    print_video_info(info)
+
+    video_path, result = tee_download(url, output_dir, lambda source: consume(output_path, info, source),
+                                      custom_name, cache_dir, cache_size_mb, session=session,
+                                      expected_size=expected_size, expected_sha256=expected_sha256)
+    return video_path, info, result
+
+
+def process_video(video_path, output_dir, extract=False, num_frames=5, start=None, end=None, smart=False,
+                  refresh_probe=False, dedup=None, **frame_options):
+    """Probe a downloaded video and optionally extract frames (or contact sheets) from it."""
+    info = get_video_info(video_path, refresh_probe)
+    frames = []
+    if extract:
+        frames = extract_frames(video_path, output_dir, num_frames, start, end, smart=smart, dedup=dedup,
+                                **frame_options)
+    return info, frames
+
+
+def print_batch_summary(results):
+    """Print one line per URL with the outcome of a batch run."""
+    print("\n=== Batch Summary ===")
+    for result in results:
+        if not result['ok']:
+            print(f"FAIL  {result['url']}: {result.get('error', 'unknown error')}")
+            continue
+
+        info = result.get('info') or {}
+        details = [f"{info.get('file_size', 0) / (1024 * 1024):.1f} MB"]
+        if 'duration' in info:
+            details.append(f"{info['duration']:.1f}s")
+        if 'width' in info and 'height' in info:
+            details.append(f"{info['width']}x{info['height']}")
+        if result.get('frames'):
+            details.append(f"{len(result['frames'])} frames")
+        print(f"OK    {result['path']} ({', '.join(details)})")
+
+    failed = sum(1 for result in results if not result['ok'])
+    print(f"\n{len(results) - failed} succeeded, {failed} failed")
+    print("=" * 21)
+
+
+def frame_options(args):
+    """Collect the contact sheet, output format, frame store and archive options for extract_frames()."""
+    return {
+        'contact_sheet': args.contact_sheet,
+        'area': args.area,
+        'tile_width': args.tile_width,
+        'scale': args.scale,
+        'crop': args.crop,
+        'image_format': args.format,
+        'quality': args.quality,
+        'frame_store': os.path.join(args.cache_dir, 'frames') if args.frame_store else None,
+        'frame_store_size_mb': args.frame_store_size,
+        'pack': args.pack,
+    }
+
+
+def add_download_arguments(parser):
+    """Add the options shared by single and batch downloads."""
+    parser.add_argument('-o', '--output', help='Output directory', default=None)
+    parser.add_argument('-f', '--frames', action='store_true', help='Extract frames for analysis')
+    parser.add_argument('--num-frames', type=int, default=5, help='Number of frames to extract (default: 5)')
+    parser.add_argument('--smart', action='store_true',
+                        help='Spend the --num-frames budget where the picture changes instead of evenly')
+    parser.add_argument('--dedup', type=int, nargs='?', const=DEFAULT_DEDUP_DISTANCE, metavar='MAX_DISTANCE',
+                        help=f'Skip frames that look like the last frame kept, i.e. at most MAX_DISTANCE of '
+                             f'{PHASH_SIZE * PHASH_SIZE} hash bits differ (default: {DEFAULT_DEDUP_DISTANCE})')
+    parser.add_argument('--contact-sheet', type=parse_tile_layout, metavar='COLSxROWS',
+                        help='Tile the frames into labelled contact sheets of COLSxROWS frames each')
+    parser.add_argument('--area', type=parse_area, metavar='LEFT,TOP,WIDTH,HEIGHT',
+                        help='Crop contact sheet tiles to this part of the frame, as fractions '
+                             '(e.g. 0,0.6,1,0.4 for a lower third)')
+    parser.add_argument('--tile-width', type=int, default=DEFAULT_TILE_WIDTH,
+                        help=f'Width of one contact sheet tile in pixels (default: {DEFAULT_TILE_WIDTH})')
+    parser.add_argument('--scale', type=parse_scale, metavar='WIDTH[:HEIGHT]',
+                        help='Scale frames while decoding, -1 keeping the aspect ratio (e.g. 640 or -1:360)')
+    parser.add_argument('--crop', type=parse_crop, metavar='X:Y:WIDTH:HEIGHT',
+                        help='Crop frames to this rectangle of the source, in pixels, before scaling')
+    parser.add_argument('--format', choices=FRAME_FORMATS, default=DEFAULT_FRAME_FORMAT,
+                        help=f"Image format of the frames; 'raw' writes RGB pixels without encoding "
+                             f"(default: {DEFAULT_FRAME_FORMAT})")
+    parser.add_argument('--quality', type=int,
+                        help='Image quality from 1 to 100 for jpg/webp; for png, compression effort (lower is faster)')
+    parser.add_argument('--pack', action='store_true',
+                        help=f'Write the frames into one {FRAME_ARCHIVE_NAME} archive instead of separate files '
+                             f'(see the export command)')
+    parser.add_argument('--start', type=parse_time, help='Extract frames from this time (seconds, MM:SS or HH:MM:SS)')
+    parser.add_argument('--end', type=parse_time, help='Extract frames up to this time')
+    parser.add_argument('--range', type=parse_time_range, metavar='START-END',
+                        help='Shorthand for --start/--end, e.g. 00:07-00:13')
+    parser.add_argument('--connections', type=int, default=DEFAULT_CONNECTIONS,
+                        help=f'Parallel connections when the server supports byte ranges '
+                             f'(default: {DEFAULT_CONNECTIONS}, 1 disables)')
+    parser.add_argument('--no-cache', action='store_true', help='Always download, bypassing the local cache')
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR,
+                        help=f'Download cache directory (default: {DEFAULT_CACHE_DIR})')
+    parser.add_argument('--cache-size', type=int, default=DEFAULT_CACHE_SIZE_MB,
+                        help=f'Download cache size limit in MB (default: {DEFAULT_CACHE_SIZE_MB})')
+    parser.add_argument('--refresh-probe', action='store_true',
+                        help='Re-run ffprobe instead of using cached video information')
+    parser.add_argument('--frame-store', action='store_true',
+                        help='Keep extracted frames in the frames directory of --cache-dir and reuse them when '
+                             'later runs ask for the same frames of the same video (default: always decode)')
+    parser.add_argument('--frame-store-size', type=int, default=DEFAULT_FRAME_STORE_SIZE_MB,
+                        help=f'Frame store size limit in MB (default: {DEFAULT_FRAME_STORE_SIZE_MB})')
+
+
+def batch_main(argv):
+    """Download and analyze a list of URLs (`download_video.py batch ...`)."""
+    parser = argparse.ArgumentParser(
+        prog='download_video.py batch',
+        description='Download and analyze many videos concurrently'
+    )
+    parser.add_argument('source', help="File with one URL per line, or '-' to read from stdin")
+    add_download_arguments(parser)
+    parser.add_argument('-j', '--jobs', type=int, default=DEFAULT_JOBS,
+                        help=f'Videos downloaded at the same time (default: {DEFAULT_JOBS})')
+    parser.add_argument('--per-host', type=int, default=DEFAULT_CONNECTIONS_PER_HOST,
+                        help=f'Maximum connections to a single host (default: {DEFAULT_CONNECTIONS_PER_HOST})')
+
+    args = parser.parse_args(argv)
+    resolve_time_window(parser, args)
+    check_frame_options(parser, args)
+
+    urls = read_url_list(args.source)
+    invalid = [url for url in urls if not url.startswith(('http://', 'https://'))]
+    if invalid:
+        print(f"Error: URL must start with http:// or https://: {invalid[0]}")
+        sys.exit(1)
+    if not urls:
+        print("Error: no URLs given")
+        sys.exit(1)
 
-        content_type = response.headers.get('Content-Type', '')
-        content_length = response.headers.get('Content-Length')
+    output_dir = args.output if args.output else get_default_output_dir()
+    print(f"Processing {len(urls)} videos with {args.jobs} parallel jobs...")
 
-        info = {
-            'url': url,
-            'content_type': content_type,
-            'filename': get_filename_from_url(url)
-        }
+    try:
+        process = partial(
+            process_video,
+            output_dir=output_dir,
+            extract=args.frames,
+            num_frames=args.num_frames,
+            start=args.start,
+            end=args.end,
+            smart=args.smart,
+            refresh_probe=args.refresh_probe,
+            dedup=args.dedup,
+            **frame_options(args),
+        )
+        results = run_batch(
+            urls, output_dir, process,
+            jobs=max(1, args.jobs),
+            max_per_host=max(1, args.per_host),
+            connections=args.connections,
+            cache_dir=None if args.no_cache else args.cache_dir,
+            cache_size_mb=args.cache_size,
+        )
+    except KeyboardInterrupt:
+        print("\nBatch cancelled. Run the same command again to resume.")
+        sys.exit(1)
 
-        if content_length:
-            info['file_size'] = int(content_length)
-            print(f"\nFile: {info['filename']}")
-            print(f"Size: {int(content_length) / (1024 * 1024):.2f} MB")
-            print(f"Type: {content_type}")
-        else:
-            print(f"\nFile: {info['filename']}")
-            print(f"Type: {content_type}")
-            print("Size: Unknown (server did not provide Content-Length)")
+    print_batch_summary(results)
+    if not all(result['ok'] for result in results):
+        sys.exit(1)
 
-        return info
 
-    except requests.exceptions.RequestException as e:
-        print(f"Error getting video info: {e}")
-        return None
+def analyze_main(argv):
+    """Detect animation phases and print a Remotion TIMING table (`download_video.py analyze-motion ...`)."""
+    parser = argparse.ArgumentParser(
+        prog='download_video.py analyze-motion',
+        description='Detect motion and hold phases in a video and print them as a Remotion TIMING table',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  %(prog)s video.mp4 --range 00:07-00:13
+  %(prog)s "https://example.com/video.mp4" --area 0,0.6,1,0.4 --target-fps 60
+  %(prog)s video.mp4 --grid 3x3 --json -o timing.json
+        """
+    )
+    parser.add_argument('video', help='Video file or direct URL to analyze')
+    parser.add_argument('--start', type=parse_time, help='Analyze from this time (seconds, MM:SS or HH:MM:SS)')
+    parser.add_argument('--end', type=parse_time, help='Analyze up to this time')
+    parser.add_argument('--range', type=parse_time_range, metavar='START-END',
+                        help='Shorthand for --start/--end, e.g. 00:07-00:13')
+    parser.add_argument('--target-fps', type=int, default=DEFAULT_TARGET_FPS,
+                        help=f'Frame rate of the TIMING table (default: {DEFAULT_TARGET_FPS})')
+    parser.add_argument('--width', type=int, default=DEFAULT_ANALYSIS_WIDTH,
+                        help=f'Width frames are scaled to for analysis (default: {DEFAULT_ANALYSIS_WIDTH})')
+    parser.add_argument('--area', type=parse_area, metavar='LEFT,TOP,WIDTH,HEIGHT',
+                        help='Only measure this part of the frame, as fractions (e.g. 0,0.6,1,0.4 for the bottom 40%%)')
+    parser.add_argument('--grid', type=parse_grid, default=(1, 1), metavar='ROWSxCOLS',
+                        help='Also report motion per cell of this grid (e.g. 3x3)')
+    parser.add_argument('--threshold', type=float,
+                        help='Mean pixel change (0-255) that counts as motion (default: set from the noise floor)')
+    parser.add_argument('--min-hold', type=float, default=DEFAULT_MIN_HOLD,
+                        help=f'Shorter pauses inside an animation are ignored, '
+                             f'in seconds (default: {DEFAULT_MIN_HOLD})')
+    parser.add_argument('--min-motion', type=float, default=DEFAULT_MIN_MOTION,
+                        help=f'Shorter motion is treated as noise unless it is a scene cut, '
+                             f'in seconds (default: {DEFAULT_MIN_MOTION})')
+    parser.add_argument('--json', action='store_true', help='Print the full analysis as JSON')
+    parser.add_argument('-o', '--output', help='Write the result to this file instead of printing it')
+
+    args = parser.parse_args(argv)
+    resolve_time_window(parser, args)
+    if args.width < 1:
+        parser.error('--width must be at least 1')
+
+    # With --json, stdout carries nothing but the analysis
+    with redirect_stdout(sys.stderr if args.json else sys.stdout):
+        video_path = args.video
+        if video_path.startswith(('http://', 'https://')):
+            video_path = fetch_video(video_path, get_default_output_dir(),
+                                     cache_dir=DEFAULT_CACHE_DIR, cache_size_mb=DEFAULT_CACHE_SIZE_MB)
+
+        print(f"Analyzing motion in: {video_path}")
+        started = time.monotonic()
+        try:
+            report = analyze_motion(
+                video_path, args.start, args.end, args.target_fps, args.width,
+                args.grid, args.area, args.threshold, args.min_hold, args.min_motion,
+            )
+        except (RuntimeError, ValueError) as e:
+            print(f"Error: {e}")
+            sys.exit(1)
+        elapsed = time.monotonic() - started
+
+        seconds = report['end'] - report['start']
+        print(f"Analyzed {report['frames_analyzed']} frames ({seconds:.2f}s of video) in {elapsed:.2f}s "
+              f"({seconds / elapsed:.1f}x realtime)")
+        for phase in report['phases']:
+            print(f"  {phase['kind']:<6} {phase['start']:7.2f}s - {phase['end']:7.2f}s  "
+                  f"frames {phase['start_frame']}-{phase['end_frame']}  peak {phase['peak_energy']}"
+                  + ''.join(f"  cut at {cut:.2f}s" for cut in phase['cuts']))
+
+    if args.json:
+        result = json.dumps(report, indent=2)
+    else:
+        result = format_timing(report['timing'], (
+            f"Detected in {os.path.basename(str(video_path))} "
+            f"({report['start']:.2f}s-{report['end']:.2f}s), in frames at {args.target_fps}fps"
+        ))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(result + '\n')
+        print(f"\nSaved to: {args.output}")
+    else:
+        if not args.json:
+            print()
+        print(result)
 
 
-def main():
+def compare_main(argv):
+    """Score a Remotion render against the reference video frame by frame (`download_video.py compare ...`)."""
     parser = argparse.ArgumentParser(
-        description='Download and analyze video files from direct URLs',
+        prog='download_video.py compare',
+        description='Decode a reference video and a render side by side, score every render frame against '
+                    'the reference frame shown at the same time (PSNR, SSIM, difference inside an area), and '
+                    'save the score curve and the worst-matching frames',
         formatter_class=argparse.RawDescriptionHelpFormatter,
         epilog="""
 Examples:
-  %(prog)s "https://example.com/video.mp4"
-  %(prog)s "https://example.com/video.mp4" -o /output/path
-  %(prog)s "https://example.com/video.mp4" -n my_video
-  %(prog)s "https://example.com/video.mp4" -f  # Extract frames
-  %(prog)s "https://example.com/video.mp4" -i  # Get info only
+  %(prog)s reference.mp4 out/lower-third-1.mp4 --offset 00:07
+  %(prog)s reference.mp4 out/text-animation-2.mp4 --offset 7.2 --area 0,0.6,1,0.4 --min-ssim 0.9
+  %(prog)s "https://example.com/video.mp4" out/text-animation-1.mp4 --ratio 0.5 --json
         """
     )
+    parser.add_argument('reference', help='Reference video file or direct URL')
+    parser.add_argument('render', help='Rendered video file')
+    parser.add_argument('--offset', type=parse_offset, default=0.0,
+                        help='Reference time the render starts at (seconds, MM:SS or HH:MM:SS, negative if '
+                             'the render starts earlier; default: 0)')
+    parser.add_argument('--ratio', type=float, default=1.0,
+                        help='Reference seconds per render second, e.g. 0.5 if the render plays the animation '
+                             'at half speed (default: 1)')
+    parser.add_argument('--fps', type=float, help='Compare this many render frames per second (default: every frame)')
+    parser.add_argument('--width', type=int, default=DEFAULT_COMPARE_WIDTH,
+                        help=f'Width both videos are scaled to, 0 for the render\'s own (default: {DEFAULT_COMPARE_WIDTH})')
+    parser.add_argument('--area', type=parse_area, metavar='LEFT,TOP,WIDTH,HEIGHT',
+                        help='Also measure the difference inside this part of the frame, as fractions '
+                             '(e.g. 0,0.6,1,0.4 for a lower third), and rank the worst frames by it')
+    parser.add_argument('--worst', type=int, default=DEFAULT_WORST_FRAMES,
+                        help=f'Worst-matching frames to save (default: {DEFAULT_WORST_FRAMES})')
+    parser.add_argument('-o', '--output',
+                        help='Directory for scores.csv and the worst frames (default: <render>_compare '
+                             'in the output directory)')
+    parser.add_argument('--min-ssim', type=float, metavar='SSIM',
+                        help='Exit with status 1 if the mean SSIM is below this (0-1)')
+    parser.add_argument('--json', action='store_true',
+                        help='Print the report as JSON on stdout; messages go to stderr')
+
+    args = parser.parse_args(argv)
+    if args.ratio <= 0:
+        parser.error('--ratio must be positive')
+    if args.fps is not None and args.fps <= 0:
+        parser.error('--fps must be positive')
+    if args.width < 0 or 0 < args.width < SSIM_WINDOW:
+        parser.error(f'--width must be 0 or at least {SSIM_WINDOW}')
+    if args.worst < 0:
+        parser.error('--worst must not be negative')
+
+    # With --json, stdout carries nothing but the report
+    with redirect_stdout(sys.stderr if args.json else sys.stdout):
+        reference = args.reference
+        if reference.startswith(('http://', 'https://')):
+            reference = fetch_video(reference, get_default_output_dir(),
+                                    cache_dir=DEFAULT_CACHE_DIR, cache_size_mb=DEFAULT_CACHE_SIZE_MB)
+        render = args.render
+        output_dir = args.output or os.path.join(
+            get_default_output_dir(), os.path.splitext(os.path.basename(render))[0] + '_compare')
+
+        print(f"Comparing {render} with {reference} (offset {args.offset:g}s, ratio {args.ratio:g})")
+        started = time.monotonic()
+        try:
+            report = compare_videos(reference, render, output_dir, args.offset, args.ratio, args.fps,
+                                    args.width or None, args.area, args.worst)
+        except FileNotFoundError:
+            print("Error: ffmpeg not found. Install ffmpeg to compare videos.")
+            sys.exit(1)
+        except (RuntimeError, ValueError) as e:
+            print(f"Error: {e}")
+            sys.exit(1)
+        elapsed = time.monotonic() - started
+
+        print(f"Compared {report['frames']} frames in {elapsed:.2f}s ({report['frames'] / elapsed:.1f} frames/s)")
+        print(f"  PSNR: mean {report['psnr']['mean']:.2f} dB, min {report['psnr']['min']:.2f} dB")
+        print(f"  SSIM: mean {report['ssim']['mean']:.4f}, min {report['ssim']['min']:.4f}")
+        if report['area_diff']:
+            print(f"  Area difference: mean {report['area_diff']['mean']:.2f}, max {report['area_diff']['max']:.2f}")
+        if report['worst']:
+            print("  Worst frames (reference | render | difference):")
+        for frame in report['worst']:
+            detail = f", area difference {frame['area_diff']:.2f}" if frame['area_diff'] is not None else ''
+            print(f"    frame {frame['frame']} at {frame['render_time']:.2f}s (reference {frame['reference_time']:.2f}s): "
+                  f"SSIM {frame['ssim']:.4f}, PSNR {frame['psnr']:.2f} dB{detail} -> {frame['image']}")
+        print(f"Scores saved to: {report['scores']}")
+
+        passed = args.min_ssim is None or report['ssim']['mean'] >= args.min_ssim
+        if not passed:
+            print(f"FAIL: mean SSIM {report['ssim']['mean']:.4f} is below --min-ssim {args.min_ssim:g}")
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    if not passed:
+        sys.exit(1)
 
-    parser.add_argument('url', help='Direct URL to the video file')
-    parser.add_argument('-o', '--output', help='Output directory', default=None)
-    parser.add_argument('-n', '--name', help='Custom filename (without extension)', default=None)
-    parser.add_argument('-f', '--frames', action='store_true', help='Extract frames for analysis')
-    parser.add_argument('-i', '--info', action='store_true', help='Get video info only (no download)')
-    parser.add_argument('--num-frames', type=int, default=5, help='Number of frames to extract (default: 5)')
 
-    args = parser.parse_args()
+def export_main(argv):
+    """Write frames of a packed frame archive out as images (`download_video.py export ...`)."""
+    parser = argparse.ArgumentParser(
+        prog='download_video.py export',
+        description=f'Write frames of a {FRAME_ARCHIVE_NAME} archive made with --pack out as image files',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog=f"""
+Examples:
+  %(prog)s video_frames/{FRAME_ARCHIVE_NAME} -o frames
+  %(prog)s video_frames/{FRAME_ARCHIVE_NAME} -o frames --frames 1-10,25
+  %(prog)s video_frames/{FRAME_ARCHIVE_NAME} -o frames --range 00:07-00:13 --format jpg
+"""
+    )
+    parser.add_argument('archive', help=f'{FRAME_ARCHIVE_NAME} archive written by --pack')
+    parser.add_argument('-o', '--output', required=True, help='Directory for the images')
+    parser.add_argument('--frames', type=parse_frame_numbers, metavar='N[-M],...',
+                        help='Export only these frames, numbered from 1 (e.g. 1-10,25)')
+    parser.add_argument('--start', type=parse_time, help='Export frames from this source time')
+    parser.add_argument('--end', type=parse_time, help='Export frames before this source time')
+    parser.add_argument('--range', type=parse_time_range, metavar='START-END',
+                        help='Shorthand for --start/--end, e.g. 00:07-00:13')
+    parser.add_argument('--format', choices=FRAME_FORMATS,
+                        help='Image format for frames of a raw archive (default: png); '
+                             'encoded frames are written as stored')
+    parser.add_argument('--quality', type=int, help='Image quality from 1 to 100 when encoding raw frames')
+    args = parser.parse_args(argv)
+    resolve_time_window(parser, args)
+    if args.quality is not None and not 1 <= args.quality <= 100:
+        parser.error('--quality must be between 1 and 100')
 
-    # Validate URL
-    if not args.url.startswith(('http://', 'https://')):
-        print("Error: URL must start with http:// or https://")
+    try:
+        paths = export_frames(args.archive, args.output, args.frames, args.start, args.end, args.format, args.quality,
+                              FRAME_NAME)
+    except (OSError, ValueError, RuntimeError) as e:
+        print(f"Error exporting frames: {e}")
         sys.exit(1)
+    print(f"Exported {len(paths)} frames to: {args.output}")
 
+
+def cache_main(argv):
+    """Inspect or prune the download cache (`download_video.py cache ...`)."""
+    parser = argparse.ArgumentParser(
+        prog='download_video.py cache',
+        description='Manage the local download cache'
+    )
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR,
+                        help=f'Cache directory (default: {DEFAULT_CACHE_DIR})')
+    subparsers = parser.add_subparsers(dest='action', required=True)
+    subparsers.add_parser('stats', help='Show cache size and entry count')
+    prune_parser = subparsers.add_parser('prune', help='Evict least recently used videos')
+    prune_parser.add_argument('--max-size', type=int, default=DEFAULT_CACHE_SIZE_MB,
+                              help=f'Size to shrink the cache to, in MB (default: {DEFAULT_CACHE_SIZE_MB})')
+    prune_parser.add_argument('--frame-store-size', type=int, default=DEFAULT_FRAME_STORE_SIZE_MB,
+                              help=f'Size to shrink the frame store to, in MB (default: {DEFAULT_FRAME_STORE_SIZE_MB})')
+    prune_parser.add_argument('--all', action='store_true',
+                              help='Remove every cached video, stored frame and all cached video information')
+
+    args = parser.parse_args(argv)
+
+    if args.action == 'stats':
+        stats = cache_stats(args.cache_dir)
+        print("\n=== Download Cache ===")
+        print(f"Directory: {stats['cache_dir']}")
+        print(f"URLs: {stats['entries']}")
+        print(f"Files: {stats['objects']}")
+        print(f"Size: {stats['total_size'] / (1024 * 1024):.2f} MB (limit {DEFAULT_CACHE_SIZE_MB} MB)")
+        if stats['oldest_access']:
+            print(f"Least recently used: {time.strftime('%Y-%m-%d %H:%M', time.localtime(stats['oldest_access']))}")
+        print(f"Probed files: {stats['probes']}")
+        print(f"Stored frames: {stats['frames']} from {stats['frame_videos']} videos, "
+              f"{stats['frames_size'] / (1024 * 1024):.2f} MB (limit {DEFAULT_FRAME_STORE_SIZE_MB} MB)")
+        print("=" * 22)
+    else:
+        max_size = 0 if args.all else args.max_size * 1024 * 1024
+        removed, freed = cache_prune(args.cache_dir, max_size)
+        print(f"Removed {removed} cached files ({freed / (1024 * 1024):.2f} MB freed)")
+        probes = invalidate_probes(args.cache_dir) if args.all else prune_probes(args.cache_dir)
+        print(f"Removed {probes} cached video information entries")
+        max_frames = 0 if args.all else args.frame_store_size * 1024 * 1024
+        removed, freed = frame_store_prune(os.path.join(args.cache_dir, 'frames'), max_frames)
+        print(f"Removed {removed} stored frames ({freed / (1024 * 1024):.2f} MB freed)")
+
+
+def scan_main(argv):
+    """Probe and index the video files under a directory (`download_video.py scan ...`)."""
+    parser = argparse.ArgumentParser(
+        prog='download_video.py scan',
+        description='Find the video files under a directory, probe and hash them in parallel, and keep the '
+                    'results in a SQLite index; files unchanged since the last scan are skipped',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  %(prog)s ~/Videos
+  %(prog)s ~/Videos --list --where "height>=1080" --where codec=h264
+  %(prog)s ~/Videos --list --json > library.json
+  sqlite3 ~/.cache/video-viewing/library.sqlite "SELECT path FROM videos WHERE duration > 600"
+        """
+    )
+    parser.add_argument('directory', help='Directory to scan, recursively')
+    parser.add_argument('--index', default=DEFAULT_LIBRARY_INDEX,
+                        help=f'SQLite index to update (default: {DEFAULT_LIBRARY_INDEX})')
+    parser.add_argument('-j', '--jobs', type=int,
+                        help='Files probed and hashed at the same time, one ffprobe each (default: one per CPU)')
+    parser.add_argument('--rescan', action='store_true', help='Probe and hash every file again, even unchanged ones')
+    parser.add_argument('--list', action='store_true', help='Print the indexed videos under the directory')
+    parser.add_argument('--where', type=parse_library_filter, action='append', default=[],
+                        metavar='COLUMN OP VALUE',
+                        help=f'With --list, only the videos where a column ({", ".join(LIBRARY_COLUMNS)}) compares '
+                             f'to a value with =, !=, <, <=, >, >= or ~ (contains), e.g. "height>=1080"; '
+                             f'repeat to combine')
+    parser.add_argument('--json', action='store_true', help='With --list, print the videos as JSON')
+
+    args = parser.parse_args(argv)
+    if args.jobs is not None and args.jobs < 1:
+        parser.error('--jobs must be at least 1')
+    if (args.where or args.json) and not args.list:
+        parser.error('--where and --json need --list')
+    if not os.path.isdir(args.directory):
+        print(f"Error: not a directory: {args.directory}")
+        sys.exit(1)
+    if not check_ffmpeg()[1]:
+        print("Error: ffprobe not found. Install ffmpeg to scan videos.")
+        sys.exit(1)
+
+    # With --json, stdout carries nothing but the video list
+    with redirect_stdout(sys.stderr if args.json else sys.stdout):
+        print(f"Scanning {args.directory}...")
+        try:
+            scanned, unchanged, removed, failed = scan_library(args.directory, args.index, args.jobs, args.rescan)
+        except KeyboardInterrupt:
+            print("\nScan cancelled. Run the same command again to continue.")
+            sys.exit(1)
+        print(f"Indexed {scanned} files ({unchanged} unchanged, {removed} removed, {failed} unreadable) "
+              f"in {args.index}")
+
+    if not args.list:
+        return
+    try:
+        videos = query_library(args.index, args.directory, args.where)
+    except sqlite3.Error as e:
+        print(f"Error: could not read the index {args.index}: {e}")
+        sys.exit(1)
+    if args.json:
+        print(json.dumps(videos, indent=2))
+        return
+    for video in videos:
+        if video['error']:
+            print(f"FAIL  {video['path']}: {video['error']}")
+            continue
+        fps = f"{video['fps']:.3f}".rstrip('0').rstrip('.') if video['fps'] else '?'
+        print(f"OK    {video['path']}  {video['duration'] or 0:.2f}s  {video['width']}x{video['height']}  "
+              f"{video['codec']}  {fps} fps  {video['size'] / (1024 * 1024):.1f} MB")
+    print(f"{len(videos)} videos")
+
+
+def serve_main(argv):
+    """Keep a warm process that runs the commands of later invocations (`download_video.py serve`)."""
+
+    parser = argparse.ArgumentParser(
+        prog='download_video.py serve',
+        description='Run commands sent by later invocations of this script in one warm process: they share '
+                    'a keep-alive HTTP session, the ffprobe results and a pool of frame extraction processes'
+    )
+    parser.add_argument('--socket', default=DEFAULT_DAEMON_SOCKET,
+                        help=f'Unix socket to listen on (default: {DEFAULT_DAEMON_SOCKET}, or $VIDEO_DAEMON_SOCKET)')
+    parser.add_argument('--idle-timeout', type=float, default=DEFAULT_DAEMON_IDLE_MINUTES,
+                        help=f'Exit after this many minutes without a command, 0 for never '
+                             f'(default: {DEFAULT_DAEMON_IDLE_MINUTES})')
+    parser.add_argument('--max-per-host', type=int, default=DEFAULT_CONNECTIONS_PER_HOST,
+                        help=f'Connections kept open to each host (default: {DEFAULT_CONNECTIONS_PER_HOST})')
+    parser.add_argument('--workers', type=int, default=max(os.cpu_count() or 1, DEFAULT_DAEMON_WORKERS),
+                        help='Frame extraction processes kept running; commands with a larger --jobs start their '
+                             f'own (default: the CPU count, at least {DEFAULT_DAEMON_WORKERS})')
+    args = parser.parse_args(argv)
+    if args.workers < 1:
+        parser.error('--workers must be at least 1')
+
+    if not hasattr(socket, 'AF_UNIX'):
+        parser.error('serve needs Unix domain sockets, which this platform lacks')
+    serve(args.socket, main, script_identity(__file__), args.idle_timeout, args.max_per_host, args.workers)
+
+
+# Subcommands that replace the single-URL command line
+COMMANDS = {
+    'analyze-motion': analyze_main,
+    'batch': batch_main,
+    'cache': cache_main,
+    'compare': compare_main,
+    'export': export_main,
+    'scan': scan_main,
+    'serve': serve_main,
+}
+
+
+def run_pipeline(args, result):
+    """Download, probe and extract frames as the command line asks, filling in result for --json.
+
+    Raises on download errors; returns False when the video information or
+    the frames could not be extracted.
+    """
     # Info only mode
     if args.info:
-        get_video_info_from_url(args.url)
-        sys.exit(0)
+        with TRACE.span('probe', 'stage'):
+            result['info'] = get_video_info_from_url(args.url)
+        return result['info'] is not None
 
     # Determine output directory
     output_dir = args.output if args.output else get_default_output_dir()
 
-    try:
-        # Download the video
-        video_path = download_video(args.url, output_dir, args.name)
-
-        # Get and display video info
-        info = get_video_info(video_path)
+    def extract(video_path, info=None, source=None):
+        with TRACE.span('extract', 'stage'):
+            return extract_frames(
+                video_path, output_dir, args.num_frames, args.start, args.end, offset, args.smart, args.dedup,
+                jobs=args.jobs, source=source, info=info, **frame_options(args)
+            )
+
+    # Download only the requested window, or the whole video, extracting frames
+    # from its bytes as they arrive with --stream
+    video_path = None
+    info = None
+    frames = None
+    offset = 0
+    with TRACE.span('download', 'stage'):
+        if args.partial:
+            try:
+                video_path, offset = fetch_clip(args.url, output_dir, args.start, args.end, args.name)
+            except RangeNotSupportedError:
+                print("Server does not support range requests; downloading the whole video instead.")
+        elif args.stream:
+            streamed = stream_video(
+                args.url, output_dir, extract, args.name,
+                cache_dir=None if args.no_cache else args.cache_dir,
+                cache_size_mb=args.cache_size,
+                expected_size=args.expected_size,
+                expected_sha256=args.expected_sha256,
+            )
+            if streamed:
+                video_path, info, frames = streamed
+                if not frames:
+                    print("Extracting frames from the downloaded file instead.")
+                    frames = None
+        if video_path is None:
+            video_path = fetch_video(
+                args.url, output_dir, args.name,
+                connections=args.connections,
+                cache_dir=None if args.no_cache else args.cache_dir,
+                cache_size_mb=args.cache_size,
+                expected_size=args.expected_size,
+                expected_sha256=args.expected_sha256,
+            )
+    result['video'] = {'path': video_path, 'size': os.path.getsize(video_path)}
+
+    # Get and display video info, unless it was read from the URL before a streamed download
+    if info is None:
+        with TRACE.span('probe', 'stage'):
+            info = get_video_info(video_path, args.refresh_probe)
         print_video_info(info)
+    else:
+        info['file_size'] = os.path.getsize(video_path)
+    result['info'] = info
+
+    # Extract frames if requested
+    completed = True
+    if args.frames:
+        if frames is None:
+            frames = extract(video_path)
+        if frames:
+            print("\nFrames extracted successfully. You can now analyze these images.")
+            manifest_path = os.path.join(os.path.dirname(frames[0]), 'manifest.json')
+            with open(manifest_path) as f:
+                manifest = json.load(f)
+            result['frames'] = {
+                'dir': os.path.dirname(frames[0]),
+                'manifest': manifest_path,
+                'count': len(manifest['frames']),
+            }
+        completed = bool(frames)
+
+    print(f"\nVideo saved to: {video_path}")
+    return completed
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    # Hand the command to a warm daemon when one is running; a daemon never forwards to itself
+    if argv[:1] != ['serve'] and video_common.SHARED_SESSION is None:
+        code = forward_to_daemon(argv, __file__, DEFAULT_DAEMON_SOCKET)
+        if code is not None:
+            sys.exit(code)
+
+    if argv and argv[0] in COMMANDS:
+        COMMANDS[argv[0]](argv[1:])
+        return
 
-        # Extract frames if requested
-        if args.frames:
-            frames = extract_frames(video_path, output_dir, args.num_frames)
-            if frames:
-                print("\nFrames extracted successfully. You can now analyze these images.")
+    parser = argparse.ArgumentParser(
+        description='Download and analyze video files from direct URLs',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  %(prog)s "https://example.com/video.mp4"
+  %(prog)s "https://example.com/video.mp4" -o /output/path
+  %(prog)s "https://example.com/video.mp4" -n my_video
+  %(prog)s "https://example.com/video.mp4" -f  # Extract frames
+  %(prog)s "https://example.com/video.mp4" -f --range 00:07-00:13 --num-frames 12
+  %(prog)s "https://example.com/video.mp4" -f --range 00:07-00:13 --partial  # Download that part only
+  %(prog)s "https://example.com/video.webm" -f --stream  # Extract frames while the video downloads
+  %(prog)s "https://example.com/video.mp4" -f --smart --num-frames 20  # Frames around every transition
+  %(prog)s "https://example.com/video.mp4" -f --num-frames 100 --dedup  # Skip repeated frames
+  %(prog)s "https://example.com/video.mp4" -f --num-frames 24 --contact-sheet 6x4 --area 0,0.6,1,0.4
+  %(prog)s "https://example.com/video.mp4" -f --scale 640 --format webp --quality 80  # Small frames
+  %(prog)s "https://example.com/video.mp4" -f --num-frames 300 --jobs 4  # Decode in 4 processes
+  %(prog)s "https://example.com/video.mp4" -f --num-frames 1000 --pack  # One frames.pack archive
+  %(prog)s export video_frames/frames.pack -o frames --frames 1-10  # Archive frames as images
+  %(prog)s "https://example.com/video.mp4" -i  # Get info only
+  %(prog)s "https://example.com/video.mp4" --connections 8
+  %(prog)s "https://example.com/video.mp4" --expected-sha256 9f86d081884c7d65...  # Verify the download
+  %(prog)s "https://example.com/video.mp4" -f --json --trace trace.json  # Result document and timing trace
+  %(prog)s "https://example.com/video.mp4" --no-cache
+  %(prog)s cache stats  # Show download cache usage
+  %(prog)s cache prune --max-size 500
+  %(prog)s batch urls.txt -f -j 8  # Download and analyze a list of URLs
+  cat urls.txt | %(prog)s batch -
+  %(prog)s analyze-motion video.mp4 --range 00:07-00:13  # Print a Remotion TIMING table
+  %(prog)s compare reference.mp4 out/lower-third-1.mp4 --offset 00:07  # Score a render against the reference
+  %(prog)s scan ~/Videos --list --where "height >= 1080"  # Index local videos, then query them
+  %(prog)s serve &  # Keep a warm daemon; later invocations hand their commands to it
+        """
+    )
 
-        print(f"\nVideo saved to: {video_path}")
+    parser.add_argument('url', help='Direct URL to the video file')
+    parser.add_argument('-n', '--name', help='Custom filename (without extension)', default=None)
+    parser.add_argument('-i', '--info', action='store_true', help='Get video info only (no download)')
+    parser.add_argument('--partial', action='store_true',
+                        help='Download only the --start/--end window as a small clip (needs server range support)')
+    parser.add_argument('--stream', action='store_true',
+                        help='Extract frames while the video downloads, over one connection, when its container '
+                             'allows (WebM, or MP4 with the index at the start); otherwise one after the other')
+    parser.add_argument('--jobs', type=int, default=1,
+                        help='Extract frames in this many keyframe-aligned segments at once, one process each '
+                             '(default: 1)')
+    parser.add_argument('--expected-sha256', type=parse_sha256, metavar='HEX',
+                        help='Fail unless the downloaded file has this SHA-256')
+    parser.add_argument('--expected-size', type=int, metavar='BYTES',
+                        help='Fail, as soon as the server or the data shows otherwise, unless the file has this size')
+    parser.add_argument('--json', action='store_true',
+                        help='Print a JSON result document with per-stage timings on stdout; messages go to stderr')
+    parser.add_argument('--trace', metavar='FILE',
+                        help='Write the DNS, connect, transfer, write and ffmpeg/ffprobe spans of the run to FILE '
+                             'as Chrome trace-event JSON (chrome://tracing, ui.perfetto.dev)')
+    add_download_arguments(parser)
+
+    args = parser.parse_args(argv)
+    resolve_time_window(parser, args)
+    check_frame_options(parser, args)
+    if args.partial and args.start is None and args.end is None:
+        parser.error('--partial needs --start/--end or --range')
+    if args.partial and (args.expected_sha256 or args.expected_size is not None):
+        parser.error('--expected-sha256 and --expected-size cannot be combined with --partial')
+    if args.jobs < 1:
+        parser.error('--jobs must be at least 1')
+    if args.jobs > 1 and (args.dedup is not None or args.contact_sheet):
+        parser.error('--jobs cannot be combined with --dedup or --contact-sheet')
+    if args.stream and not args.frames:
+        parser.error('--stream needs -f')
+    if args.stream and (args.partial or args.smart or args.jobs > 1):
+        parser.error('--stream cannot be combined with --partial, --smart or --jobs')
 
-    except requests.exceptions.RequestException as e:
-        print(f"Error downloading video: {e}")
-        sys.exit(1)
-    except KeyboardInterrupt:
-        print("\nDownload cancelled.")
+    # Validate URL
+    if not args.url.startswith(('http://', 'https://')):
+        print("Error: URL must start with http:// or https://")
         sys.exit(1)
-    except Exception as e:
-        print(f"Error: {e}")
+    if args.json or args.trace:
+        TRACE.start()
+
+    result = {'url': args.url}
+    completed = False
+    error = None
+    # With --json, stdout carries nothing but the result document
+    with redirect_stdout(sys.stderr if args.json else sys.stdout):
+        try:
+            completed = run_pipeline(args, result)
+        except requests.exceptions.RequestException as e:
+            error = f"Error downloading video: {e}"
+        except KeyboardInterrupt:
+            print()
+            error = "Download cancelled. Run the same command again to resume."
+        except Exception as e:
+            error = f"Error: {e}"
+        if error:
+            print(error)
+        if args.trace:
+            with open(args.trace, 'w') as f:
+                json.dump(TRACE.chrome_trace(), f)
+            print(f"Trace written to: {args.trace}")
+
+    if args.json:
+        ok = completed and error is None
+        document = {
+            'ok': ok,
+            'error': None if ok else error or 'No video information or frames could be extracted',
+            **result,
+            'seconds': time.perf_counter() - TRACE.origin,
+            'stages': TRACE.totals(),
+            'processes': TRACE.processes(),
+            'peak_rss': own_peak_rss(),
+        }
+        print(json.dumps(document, indent=2))
+        sys.exit(0 if ok else 1)
+    if error:
         sys.exit(1)
 
 
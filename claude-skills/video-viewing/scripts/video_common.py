@@ -0,0 +1,3451 @@
+"""
+Code shared by the video download scripts
+
+Both scripts/download_video.py and the video-viewing skill's
+download_video.py import this module from the skill's scripts directory, so
+the skill stays self-contained. It holds everything that does not depend
+on either command line: downloading (ranged, resumed, streamed, clipped,
+batched) and the download cache, the ffmpeg and ffprobe helpers and the
+probe cache, frame decoding and writing (parallel too), the frame store and
+archives, motion analysis, deduplication and comparison, the library
+index, the serve daemon and its shared state, and the option parsers. Each
+script keeps only its argparse command line and the messages it prints;
+status() marks the messages printed here as MESSAGE_MARKS says.
+"""
+
+import argparse
+import bisect
+import csv
+import errno
+import hashlib
+import heapq
+import importlib
+import io
+import json
+import math
+import mmap
+import os
+import queue
+import re
+import shutil
+import signal
+import socket
+import socketserver
+import sqlite3
+import struct
+import sys
+import subprocess
+import tempfile
+import threading
+import time
+import traceback
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from fractions import Fraction
+from contextlib import closing, contextmanager, nullcontext, redirect_stderr, redirect_stdout
+from pathlib import Path
+from urllib.parse import unquote, urlparse
+
+
+def import_package(name):
+    """Import a third-party package, installing it with pip first if needed."""
+    try:
+        return importlib.import_module(name)
+    except ImportError:
+        print(f"Installing required package: {name}")
+        subprocess.check_call([sys.executable, "-m", "pip", "install", name])
+        return importlib.import_module(name)
+
+
+class LazyModule:
+    """Stands in for a third-party package, which is imported (and installed) on first use.
+
+    Commands that never download, and the client of a serve daemon, then
+    start without paying for the import, and nothing is installed at import time.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.module = None
+
+    def __getattr__(self, attr):
+        if self.module is None:
+            self.module = import_package(self.name)
+        return getattr(self.module, attr)
+
+
+requests = LazyModule('requests')
+
+# How the messages printed here are marked; scripts/download_video.py keeps
+# these symbols, the skill's copy replaces them with words
+MESSAGE_MARKS = {'ok': '✓', 'warning': '⚠', 'error': '✗'}
+
+
+def status(kind, message, **kwargs):
+    """Print a message marked as MESSAGE_MARKS says for kind ('ok', 'warning' or 'error')."""
+    mark = MESSAGE_MARKS.get(kind)
+    print(f"{mark} {message}" if mark else message, **kwargs)
+
+
+# Network reads start at MIN_CHUNK_SIZE and grow or shrink towards the size
+# that arrives in about CHUNK_TARGET_SECONDS, up to MAX_CHUNK_SIZE
+MIN_CHUNK_SIZE = 64 * 1024
+MAX_CHUNK_SIZE = 4 * 1024 * 1024
+CHUNK_TARGET_SECONDS = 0.05
+# Seconds between progress lines
+PROGRESS_INTERVAL = 0.5
+DEFAULT_CONNECTIONS = 4
+# Files are never split into segments smaller than this
+MIN_SEGMENT_SIZE = 4 * 1024 * 1024
+MAX_RETRIES = 5
+# Seconds to wait before the first retry, doubled after every failed attempt
+RETRY_BACKOFF = 1.0
+# Seconds between updates of the resume sidecar
+STATE_SAVE_INTERVAL = 1.0
+
+# Downloads are written to <name>.part and described by <name>.part.json
+PART_SUFFIX = '.part'
+STATE_SUFFIX = '.part.json'
+
+# Download cache, shared by every run on this machine, and the SQLite index
+# the scan command keeps local video files in
+DEFAULT_CACHE_DIR = os.environ.get(
+    'VIDEO_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'video-viewing')
+)
+DEFAULT_LIBRARY_INDEX = os.path.join(DEFAULT_CACHE_DIR, 'library.sqlite')
+# Size limit of the download cache, shared by every run on this machine
+DEFAULT_CACHE_SIZE_MB = int(os.environ.get('VIDEO_CACHE_SIZE_MB', 2048))
+# Linux ioctl that clones a file as a copy-on-write reflink
+FICLONE = 0x40049409
+
+# Warm daemon (serve command): the minutes it waits for a command before
+# exiting, and the fewest extraction workers it keeps
+DEFAULT_DAEMON_IDLE_MINUTES = 30
+DEFAULT_DAEMON_WORKERS = 4
+
+# Seconds ffprobe may spend reading the header and index of a remote file
+URL_PROBE_TIMEOUT = 30
+
+# Streamed extraction (--stream): the leading bytes fetched to tell whether a
+# file can be decoded while it downloads, and the Matroska/WebM signature
+STREAM_HEAD_SIZE = 64 * 1024
+MATROSKA_MAGIC = b'\x1a\x45\xdf\xa3'
+
+# Channels per pixel of the raw frame formats iter_frames() can produce
+RAW_PIX_FMTS = {'gray': 1, 'rgb24': 3}
+
+# Formats extracted frames can be written in; 'raw' stores the decoded
+# pixels as they are, without running an encoder
+FRAME_FORMATS = ('png', 'jpg', 'webp', 'raw')
+DEFAULT_WEBP_QUALITY = 90
+
+# Motion analysis
+DEFAULT_ANALYSIS_WIDTH = 160
+DEFAULT_TARGET_FPS = 30
+# Frames differenced per NumPy operation
+MOTION_BATCH_SIZE = 64
+# Shorter pauses inside an animation, and shorter motion, are ignored (seconds)
+DEFAULT_MIN_HOLD = 0.2
+DEFAULT_MIN_MOTION = 0.1
+# The automatic threshold is the noise floor of the quietest fifth of the
+# frames plus MOTION_NOISE_SIGMAS times their spread (from the median absolute
+# deviation), but at least MIN_MOTION_ENERGY above the floor (pixel values 0-255)
+QUIET_PERCENTILE = 20
+MOTION_NOISE_SIGMAS = 5
+MIN_MOTION_ENERGY = 0.25
+# A frame that changes this much (pixel values 0-255) is a scene cut, which
+# always bounds a phase however short
+SCENE_CUT_ENERGY = 20
+
+# Render-vs-reference comparison: the width both videos are scaled to, the
+# side of the square SSIM windows (pixels), the PSNR reported for identical
+# frames (dB), the worst frames saved, and how much their difference images
+# are amplified
+DEFAULT_COMPARE_WIDTH = 640
+SSIM_WINDOW = 8
+MAX_PSNR = 100.0
+DEFAULT_WORST_FRAMES = 5
+DIFF_GAIN = 4
+
+# Perceptual-hash deduplication: a frame is a PHASH_SIZE x PHASH_SIZE bit dHash,
+# and frames at most this many bits away from the last kept frame are dropped
+PHASH_SIZE = 16
+DEFAULT_DEDUP_DISTANCE = 3
+# dHash ignores brightness and colour, so a repeat must also keep every
+# averaged cell within this many pixel values (0-255) of the kept frame
+DEDUP_MAX_CELL_CHANGE = 12
+
+# Frame store: frames extracted from a video, kept by its content hash for later runs
+DEFAULT_FRAME_STORE_SIZE_MB = int(os.environ.get('VIDEO_FRAME_STORE_SIZE_MB', 1024))
+# Missing frames further apart than this (seconds) are decoded in separate passes
+FRAME_STORE_GAP = 5.0
+
+# Packed frame archive (--pack): a header, the frame records back to back, then
+# count + 1 record offsets (uint64) and count source timestamps (float64), all
+# little-endian; the header is magic, format, width and height (0 if not known),
+# channels of raw records, reserved, count and the file offset of the record offsets
+FRAME_ARCHIVE_NAME = 'frames.pack'
+FRAME_ARCHIVE_MAGIC = b'VIDFRAME'
+FRAME_ARCHIVE_HEADER = struct.Struct('<8s8sIIIIQQ')
+
+# Contact sheets: width of one tile, and the gap around tiles (pixels)
+DEFAULT_TILE_WIDTH = 320
+TILE_PADDING = 4
+
+# Batch mode
+DEFAULT_JOBS = 4
+DEFAULT_CONNECTIONS_PER_HOST = 8
+
+# Local files the scan command indexes
+SUPPORTED_FORMATS = {'.mp4', '.webm', '.mkv', '.avi', '.mov', '.m4v', '.wmv', '.flv'}
+# Rows written between commits while scanning
+SCAN_COMMIT_INTERVAL = 100
+# Columns scan --list prints and --where filters on, and the operators it takes
+LIBRARY_COLUMNS = ('path', 'size', 'sha256', 'duration', 'width', 'height', 'codec', 'fps', 'error')
+LIBRARY_NUMERIC_COLUMNS = {'size', 'duration', 'width', 'height', 'fps'}
+LIBRARY_OPERATORS = {'=', '!=', '<', '<=', '>', '>=', '~'}
+
+
+class RangeNotSupportedError(Exception):
+    """Raised when a server ignores a byte-range request."""
+
+
+class IncompleteDownloadError(IOError):
+    """Raised when fewer bytes arrive than the server announced."""
+
+
+class VerificationError(IOError):
+    """Raised when a download does not have the expected size or SHA-256."""
+
+
+class ProbeError(Exception):
+    """Raised when ffprobe cannot read a file."""
+
+
+# In-process ffprobe results, keyed like the on-disk probe cache
+PROBE_MEMO = {}
+
+# Set by the serve command: the keep-alive session and process pool every command it runs shares
+SHARED_SESSION = None
+SHARED_POOL = None
+SHARED_POOL_WORKERS = 0
+
+
+class Trace:
+    """Timed spans of the work a run does, for --trace and --json.
+
+    Nothing is recorded until start() is called. Span times are
+    perf_counter() readings, a clock every process on the machine shares,
+    so spans recorded in worker processes can be merged into the parent's.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.origin = 0.0
+        self.spans = []
+        self.lock = threading.Lock()
+
+    def start(self):
+        """Start recording, dropping any spans recorded before."""
+        self.enabled = True
+        self.origin = time.perf_counter()
+        self.spans = []
+
+    def stop(self):
+        """Stop recording and drop the spans."""
+        self.enabled = False
+        self.spans = []
+
+    def add(self, name, category, started, ended=None, **args):
+        """Record a span from started to ended (default: now), in perf_counter() seconds."""
+        if not self.enabled:
+            return
+        ended = time.perf_counter() if ended is None else ended
+        span = {
+            'name': name, 'cat': category, 'start': started, 'duration': ended - started,
+            'pid': os.getpid(), 'tid': threading.get_ident(), 'thread': threading.current_thread().name,
+            'args': args,
+        }
+        with self.lock:
+            self.spans.append(span)
+
+    @contextmanager
+    def span(self, name, category, **args):
+        """Record the enclosed block as a span; the yielded dict takes more args, such as bytes."""
+        started = time.perf_counter()
+        try:
+            yield args
+        except BaseException as e:
+            args['error'] = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            self.add(name, category, started, **args)
+
+    def merge(self, spans):
+        """Add spans recorded by another process."""
+        with self.lock:
+            self.spans.extend(spans)
+
+    def totals(self):
+        """Sum the spans by name: {name: {'count', 'seconds', 'bytes'}}, bytes only where recorded."""
+        totals = {}
+        for span in self.spans:
+            total = totals.setdefault(span['name'], {'category': span['cat'], 'count': 0, 'seconds': 0.0})
+            total['count'] += 1
+            total['seconds'] += span['duration']
+            if 'bytes' in span['args']:
+                total['bytes'] = total.get('bytes', 0) + span['args']['bytes']
+        return totals
+
+    def processes(self):
+        """List every ffmpeg/ffprobe run with its duration, exit code and peak memory."""
+        return [
+            {'name': span['name'], 'seconds': span['duration'], **span['args']}
+            for span in self.spans if span['cat'] == 'process'
+        ]
+
+    def chrome_trace(self):
+        """The spans as a Chrome trace-event document, for chrome://tracing or ui.perfetto.dev."""
+        events = []
+        threads = {}
+        for span in self.spans:
+            threads[span['pid'], span['tid']] = span['thread']
+            events.append({
+                'name': span['name'], 'cat': span['cat'], 'ph': 'X',
+                'ts': round((span['start'] - self.origin) * 1e6, 3), 'dur': round(span['duration'] * 1e6, 3),
+                'pid': span['pid'], 'tid': span['tid'], 'args': span['args'],
+            })
+        for (pid, tid), name in threads.items():
+            events.append({'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid, 'args': {'name': name}})
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+
+TRACE = Trace()
+
+
+def peak_rss(usage):
+    """Peak resident memory in bytes of a resource usage record, or None."""
+    if usage is None:
+        return None
+    # ru_maxrss is in KiB, except on macOS
+    return usage.ru_maxrss * (1 if sys.platform == 'darwin' else 1024)
+
+
+def own_peak_rss():
+    """Peak resident memory in bytes of this process, or None where the platform cannot tell."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    return peak_rss(resource.getrusage(resource.RUSAGE_SELF))
+
+
+class TracedPopen(subprocess.Popen):
+    """A Popen that records the process as a trace span once it is waited for.
+
+    The span holds the command, exit code and, where os.wait4() exists, the
+    peak resident memory of the process. Linux counts the memory the child
+    shared with this process before it ran the command, so small commands
+    report at least this process's size at the time.
+    """
+
+    def __init__(self, args, **kwargs):
+        self.started = time.perf_counter()
+        self.usage = None
+        self.traced = False
+        super().__init__(args, **kwargs)
+
+    def _try_wait(self, wait_flags):
+        # Reap with wait4() instead of waitpid() to get the resource usage too
+        if not hasattr(os, 'wait4'):
+            return super()._try_wait(wait_flags)
+        try:
+            pid, status, usage = os.wait4(self.pid, wait_flags)
+        except ChildProcessError:
+            return self.pid, 0
+        if pid == self.pid:
+            self.usage = usage
+        return pid, status
+
+    def wait(self, timeout=None):
+        returncode = super().wait(timeout)
+        if not self.traced:
+            self.traced = True
+            TRACE.add(os.path.basename(self.args[0]), 'process', self.started, command=[str(arg) for arg in self.args],
+                      exit_code=returncode, peak_rss=peak_rss(self.usage))
+        return returncode
+
+
+def run_process(cmd, capture_output=False, check=False, timeout=None, **kwargs):
+    """subprocess.run() through TracedPopen, so the process shows up in the trace."""
+    if capture_output:
+        kwargs.update(stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    with TracedPopen(cmd, **kwargs) as process:
+        try:
+            stdout, stderr = process.communicate(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            raise
+    result = subprocess.CompletedProcess(cmd, process.returncode, stdout, stderr)
+    if check:
+        result.check_returncode()
+    return result
+
+
+def trace_connection(url):
+    """Record DNS resolution and a TCP connect to the host of url as trace spans.
+
+    requests does not time these phases of its own connections, so when
+    tracing is on, a separate connection is opened and closed right away.
+    """
+    parsed = urlparse(url)
+    if not TRACE.enabled or not parsed.hostname:
+        return
+    port = parsed.port or (443 if parsed.scheme == 'https' else 80)
+    try:
+        with TRACE.span('dns', 'network', host=parsed.hostname) as span:
+            addresses = socket.getaddrinfo(parsed.hostname, port, type=socket.SOCK_STREAM)
+            span['addresses'] = len(addresses)
+        family, kind, proto, _, address = addresses[0]
+        with TRACE.span('connect', 'network', address=address[0], port=port), \
+                socket.socket(family, kind, proto) as sock:
+            sock.settimeout(10)
+            sock.connect(address)
+    except OSError:
+        # The download itself reports the error
+        pass
+
+
+def split_ranges(total_size, connections):
+    """Split a file into at most `connections` inclusive (start, end) byte ranges."""
+    count = max(1, min(connections, total_size // MIN_SEGMENT_SIZE))
+    segment_size = total_size // count
+
+    ranges = []
+    for i in range(count):
+        start = i * segment_size
+        end = total_size - 1 if i == count - 1 else start + segment_size - 1
+        ranges.append((start, end))
+
+    return ranges
+
+
+def is_retryable(error):
+    """Check whether a failed request is worth retrying."""
+    if isinstance(error, requests.exceptions.HTTPError):
+        return error.response is not None and error.response.status_code >= 500
+    return isinstance(error, (
+        requests.exceptions.ConnectionError,
+        requests.exceptions.Timeout,
+        requests.exceptions.ChunkedEncodingError,
+        IncompleteDownloadError,
+    ))
+
+
+def iter_chunks(response):
+    """Yield the body of a streamed response in chunks sized to the connection's throughput.
+
+    A chunk size doubles after a full read that took under half of
+    CHUNK_TARGET_SECONDS and halves after one that took over twice as long,
+    within MIN_CHUNK_SIZE and MAX_CHUNK_SIZE, so fast connections are read
+    with few large writes while slow ones still report progress.
+    """
+    from urllib3 import exceptions as urllib3_exceptions
+
+    size = MIN_CHUNK_SIZE
+    while True:
+        started = time.monotonic()
+        try:
+            chunk = response.raw.read(size, decode_content=True)
+        except urllib3_exceptions.ProtocolError as e:
+            raise requests.exceptions.ChunkedEncodingError(e)
+        except urllib3_exceptions.ReadTimeoutError as e:
+            raise requests.exceptions.ConnectionError(e)
+        if not chunk:
+            return
+        elapsed = time.monotonic() - started
+        if len(chunk) == size and elapsed < CHUNK_TARGET_SECONDS / 2:
+            size = min(size * 2, MAX_CHUNK_SIZE)
+        elif elapsed > CHUNK_TARGET_SECONDS * 2:
+            size = max(size // 2, MIN_CHUNK_SIZE)
+        yield chunk
+
+
+class StreamingSha256:
+    """SHA-256 of a file computed from its data while it is written, in file order.
+
+    update(offset, data) hashes data written at offset when it continues
+    the bytes hashed so far. Data that arrives out of order (from parallel
+    byte ranges, or written before a resume) is skipped, and hexdigest()
+    reads only that part back from the file.
+    """
+
+    def __init__(self):
+        self._sha256 = hashlib.sha256()
+        self._lock = threading.Lock()
+        self.position = 0
+
+    def update(self, offset, data):
+        with self._lock:
+            if offset <= self.position < offset + len(data):
+                self._sha256.update(memoryview(data)[self.position - offset:])
+                self.position = offset + len(data)
+
+    def hexdigest(self, path, size):
+        """Hash whatever of the first size bytes of path was not hashed in flight, and return the digest."""
+        with self._lock, open(path, 'rb') as f:
+            f.seek(self.position)
+            while self.position < size:
+                block = f.read(min(MAX_CHUNK_SIZE, size - self.position))
+                if not block:
+                    break
+                self._sha256.update(block)
+                self.position += len(block)
+            return self._sha256.hexdigest()
+
+
+def get_if_range(state):
+    """Get the If-Range validator for a resume state (weak ETags are not allowed)."""
+    etag = state.get('etag')
+    if etag and not etag.startswith('W/'):
+        return etag
+    return state.get('last_modified')
+
+
+def create_session(max_per_host=DEFAULT_CONNECTIONS_PER_HOST):
+    """Create a keep-alive session that opens at most max_per_host connections to each host."""
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_maxsize=max_per_host, pool_block=True)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def file_sha256(path):
+    """Compute the SHA-256 of a file."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def supports_ranges(response):
+    """Check whether a response advertises byte-range support and a known size."""
+    accept_ranges = response.headers.get('Accept-Ranges', '').lower()
+    return 'bytes' in accept_ranges and response.headers.get('Content-Length') is not None
+
+
+def progress_printer(total_size, done=0, enabled=True):
+    """Get a report(done, final=False) callback that prints progress at most every PROGRESS_INTERVAL seconds.
+
+    done is the number of bytes already on disk before this run; the
+    rate counts only the bytes downloaded since.
+    """
+    started = last = time.monotonic()
+    initial = done
+
+    def report(done, final=False):
+        nonlocal last
+        now = time.monotonic()
+        if not enabled or (not final and now - last < PROGRESS_INTERVAL):
+            return
+        last = now
+        print_progress(done, total_size, (done - initial) / max(now - started, 1e-6) / (1024 * 1024))
+
+    return report
+
+
+def print_progress(downloaded, total_size, rate=None):
+    """Print a single-line download progress indicator, with the rate in MB/s if given."""
+    mb_downloaded = downloaded / (1024 * 1024)
+    speed = f", {rate:.1f} MB/s" if rate is not None else ""
+    if total_size:
+        percent = (downloaded / total_size) * 100
+        mb_total = total_size / (1024 * 1024)
+        print(f"\rProgress: {percent:.1f}% ({mb_downloaded:.1f}/{mb_total:.1f} MB{speed})", end='', flush=True)
+    else:
+        print(f"\rProgress: {mb_downloaded:.1f} MB{speed}", end='', flush=True)
+
+
+def preallocate(f, size):
+    """Reserve size bytes on disk for a file about to be written, failing now if they do not fit."""
+    if not size:
+        return
+    try:
+        os.posix_fallocate(f.fileno(), 0, size)
+    except AttributeError:
+        f.truncate(size)
+    except OSError as e:
+        if e.errno == errno.ENOSPC:
+            raise
+        # The filesystem cannot reserve space; a sparse file of the right size still works
+        f.truncate(size)
+
+
+def wait_before_retry(attempt, error):
+    """Sleep with exponential backoff, or re-raise once retries are exhausted."""
+    if attempt > MAX_RETRIES or not is_retryable(error):
+        raise error
+    delay = RETRY_BACKOFF * 2 ** (attempt - 1)
+    print()
+    status('warning', f"Download interrupted ({error}), retrying in {delay:.0f}s ({attempt}/{MAX_RETRIES})...")
+    time.sleep(delay)
+
+
+def get_validators(response):
+    """Get the headers that identify this version of the remote file."""
+    return {
+        'etag': response.headers.get('ETag'),
+        'last_modified': response.headers.get('Last-Modified'),
+    }
+
+
+def new_resume_state(url, total_size, validators, connections):
+    """Create the sidecar contents for a fresh ranged download."""
+    return {
+        'url': url,
+        'etag': validators['etag'],
+        'last_modified': validators['last_modified'],
+        'total_size': total_size,
+        'bytes_written': 0,
+        # Each segment is [start, end, bytes written so far]
+        'segments': [[start, end, 0] for start, end in split_ranges(total_size, connections)],
+    }
+
+
+def load_resume_state(state_path, part_path, url, total_size, validators):
+    """Load the sidecar of an interrupted download if it still matches the remote file."""
+    try:
+        with open(state_path) as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    if state.get('url') != url or state.get('total_size') != total_size:
+        return None
+    for key in ('etag', 'last_modified'):
+        if state.get(key) != validators[key]:
+            return None
+    if not get_if_range(state):
+        # Without a validator there is no way to tell whether the file changed
+        return None
+    if not os.path.exists(part_path) or os.path.getsize(part_path) != total_size:
+        return None
+
+    return state
+
+
+def save_resume_state(state_path, state):
+    """Atomically write the resume sidecar."""
+    state['bytes_written'] = sum(segment[2] for segment in state['segments'])
+    tmp_path = f'{state_path}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f)
+    os.replace(tmp_path, state_path)
+
+
+def discard_partial(*paths):
+    """Remove the leftovers of an abandoned download."""
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def download_stream(url, part_path, response=None, total_size=None, show_progress=True, session=None,
+                    hasher=None, expected_size=None, tee=None):
+    """Download over a single connection, restarting from zero on retryable errors.
+
+    The file is preallocated when total_size is known, and every chunk is
+    passed to hasher (a StreamingSha256) as it is written. More bytes than
+    expected_size abort the download with VerificationError. tee, a binary
+    file such as a pipe into ffmpeg, receives every byte once and in order,
+    even across restarts; once its reader goes away it is no longer fed.
+    Returns the number of bytes written.
+    """
+    http = session or SHARED_SESSION or requests
+    attempt = 0
+    teed = 0
+
+    while True:
+        try:
+            if response is None:
+                with TRACE.span('ttfb', 'network', url=url) as span:
+                    response = http.get(url, stream=True, timeout=30, headers={'Accept-Encoding': 'identity'})
+                    span['status'] = response.status_code
+                response.raise_for_status()
+
+            downloaded = 0
+            report = progress_printer(total_size, enabled=show_progress)
+            with response, open(part_path, 'wb') as f, TRACE.span('transfer', 'network', bytes=0) as span:
+                preallocate(f, total_size)
+                for chunk in iter_chunks(response):
+                    write_started = time.perf_counter()
+                    f.write(chunk)
+                    TRACE.add('write', 'disk', write_started, bytes=len(chunk))
+                    if hasher:
+                        hasher.update(downloaded, chunk)
+                    if tee and downloaded + len(chunk) > teed:
+                        # A restarted download sends the bytes the reader already has again
+                        try:
+                            tee.write(memoryview(chunk)[max(0, teed - downloaded):])
+                        except BrokenPipeError:
+                            tee = None
+                        teed = downloaded + len(chunk)
+                    downloaded += len(chunk)
+                    span['bytes'] = downloaded
+                    if expected_size is not None and downloaded > expected_size:
+                        raise VerificationError(f"got more than the expected {expected_size} bytes")
+                    report(downloaded)
+            report(downloaded, final=True)
+
+            if total_size and downloaded != total_size:
+                raise IncompleteDownloadError(f"got {downloaded} of {total_size} bytes")
+
+            return downloaded
+
+        except (requests.exceptions.RequestException, IncompleteDownloadError) as e:
+            response = None
+            attempt += 1
+            wait_before_retry(attempt, e)
+
+
+def download_segment(url, part_path, segment, if_range=None, on_progress=None, cancel=None, session=None):
+    """Download the missing tail of a [start, end, written] segment, retrying with backoff.
+
+    on_progress(offset, chunk) is called after every chunk written at offset.
+    """
+    http = session or SHARED_SESSION or requests
+    start, end, _ = segment
+    length = end - start + 1
+    attempt = 0
+
+    while segment[2] < length:
+        offset = start + segment[2]
+        headers = {'Range': f'bytes={offset}-{end}', 'Accept-Encoding': 'identity'}
+        if if_range:
+            headers['If-Range'] = if_range
+
+        try:
+            requested = time.perf_counter()
+            with http.get(url, headers=headers, stream=True, timeout=30) as response:
+                TRACE.add('ttfb', 'network', requested, range=headers['Range'], status=response.status_code)
+                response.raise_for_status()
+                if response.status_code != 206:
+                    # Either ranges are ignored or If-Range no longer matches
+                    raise RangeNotSupportedError(f"Server ignored range request (HTTP {response.status_code})")
+
+                # Unbuffered, so the sidecar never records bytes that are not in the file
+                with open(part_path, 'r+b', buffering=0) as f, \
+                        TRACE.span('transfer', 'network', range=headers['Range'], bytes=0) as span:
+                    f.seek(offset)
+                    for chunk in iter_chunks(response):
+                        if cancel is not None and cancel.is_set():
+                            return
+                        chunk = chunk[:length - segment[2]]
+                        write_started = time.perf_counter()
+                        f.write(chunk)
+                        TRACE.add('write', 'disk', write_started, bytes=len(chunk))
+                        segment[2] += len(chunk)
+                        span['bytes'] += len(chunk)
+                        if on_progress:
+                            on_progress(start + segment[2] - len(chunk), chunk)
+
+            if segment[2] < length:
+                raise IncompleteDownloadError(
+                    f"segment {start}-{end} got {segment[2]} of {length} bytes"
+                )
+
+        except (requests.exceptions.RequestException, IncompleteDownloadError) as e:
+            attempt += 1
+            wait_before_retry(attempt, e)
+
+
+def download_ranges(url, part_path, state_path, state, show_progress=True, session=None, hasher=None):
+    """Download the pending segments of a .part file concurrently, recording progress in its sidecar.
+
+    Chunks are passed to hasher (a StreamingSha256) as they are written.
+    """
+    total_size = state['total_size']
+    pending = [segment for segment in state['segments'] if segment[2] < segment[1] - segment[0] + 1]
+    if len(pending) > 1:
+        print(f"Using {len(pending)} parallel connections")
+
+    if not os.path.exists(part_path):
+        # Preallocate so every segment can write at its own offset
+        with open(part_path, 'wb') as f:
+            preallocate(f, total_size)
+    save_resume_state(state_path, state)
+
+    if_range = get_if_range(state)
+    lock = threading.Lock()
+    cancel = threading.Event()
+    downloaded = state['bytes_written']
+    report = progress_printer(total_size, downloaded, show_progress)
+    last_save = time.monotonic()
+
+    def on_progress(offset, chunk):
+        nonlocal downloaded, last_save
+        if hasher:
+            hasher.update(offset, chunk)
+        with lock:
+            downloaded += len(chunk)
+            report(downloaded)
+            if time.monotonic() - last_save >= STATE_SAVE_INTERVAL:
+                save_resume_state(state_path, state)
+                last_save = time.monotonic()
+
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, len(pending))) as pool:
+            futures = [
+                pool.submit(download_segment, url, part_path, segment, if_range, on_progress, cancel, session)
+                for segment in pending
+            ]
+            try:
+                for future in as_completed(futures):
+                    future.result()
+            except BaseException:
+                # Stop the other segments so they record their progress and exit
+                cancel.set()
+                raise
+    finally:
+        with lock:
+            save_resume_state(state_path, state)
+    report(downloaded, final=True)
+
+    if state['bytes_written'] != total_size:
+        raise IncompleteDownloadError(f"got {state['bytes_written']} of {total_size} bytes")
+
+
+def open_cache(cache_dir):
+    """Open the SQLite index of a download cache, creating it if needed."""
+    os.makedirs(os.path.join(cache_dir, 'objects'), exist_ok=True)
+    db = sqlite3.connect(os.path.join(cache_dir, 'index.sqlite'), timeout=30)
+    db.execute(
+        'CREATE TABLE IF NOT EXISTS entries ('
+        'url TEXT PRIMARY KEY, sha256 TEXT NOT NULL, size INTEGER NOT NULL, '
+        'etag TEXT, last_modified TEXT, content_type TEXT, last_access REAL NOT NULL)'
+    )
+    return db
+
+
+def cache_object_path(cache_dir, digest):
+    """Get the path of a content-addressed cache object."""
+    return os.path.join(cache_dir, 'objects', digest[:2], digest)
+
+
+def link_or_copy(src, dst):
+    """Place a copy of src at dst, sharing data blocks when the filesystem allows it."""
+    if os.path.exists(dst) and os.path.samefile(src, dst):
+        # Already a hard link to src, from an earlier run; replacing a name
+        # with another link to the same file would leave the temporary behind
+        return
+    tmp_path = f'{dst}.tmp'
+    discard_partial(tmp_path)
+
+    try:
+        # Copy-on-write reflink (btrfs, XFS), safe even if either copy is edited later
+        import fcntl
+        with open(src, 'rb') as s, open(tmp_path, 'wb') as d:
+            fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+    except (ImportError, OSError):
+        discard_partial(tmp_path)
+        try:
+            os.link(src, tmp_path)
+        except OSError:
+            shutil.copyfile(src, tmp_path)
+
+    os.replace(tmp_path, dst)
+
+
+def cache_lookup(cache_dir, url):
+    """Get the cache entry for a URL, or None if it is missing or its object is gone."""
+    with closing(open_cache(cache_dir)) as db:
+        row = db.execute(
+            'SELECT sha256, size, etag, last_modified, content_type FROM entries WHERE url = ?', (url,)
+        ).fetchone()
+
+    if row is None:
+        return None
+
+    entry = dict(zip(('sha256', 'size', 'etag', 'last_modified', 'content_type'), row))
+    entry['path'] = cache_object_path(cache_dir, entry['sha256'])
+    if not os.path.exists(entry['path']) or os.path.getsize(entry['path']) != entry['size']:
+        return None
+
+    return entry
+
+
+def conditional_headers(entry):
+    """Build If-None-Match / If-Modified-Since headers for revalidating a cache entry."""
+    headers = {}
+    if entry['etag']:
+        headers['If-None-Match'] = entry['etag']
+    if entry['last_modified']:
+        headers['If-Modified-Since'] = entry['last_modified']
+    return headers
+
+
+def is_cache_hit(entry, response):
+    """Check whether a response shows that the cached copy is still current."""
+    if response.status_code == 304:
+        return True
+    if not response.ok:
+        return False
+
+    etag = response.headers.get('ETag')
+    if etag or entry['etag']:
+        return etag == entry['etag']
+
+    # Without an ETag the file is identified by Last-Modified and Content-Length
+    content_length = response.headers.get('Content-Length')
+    return (
+        content_length is not None
+        and int(content_length) == entry['size']
+        and response.headers.get('Last-Modified') == entry['last_modified']
+    )
+
+
+def cache_touch(cache_dir, url):
+    """Mark a cache entry as recently used."""
+    with closing(open_cache(cache_dir)) as db, db:
+        db.execute('UPDATE entries SET last_access = ? WHERE url = ?', (time.time(), url))
+
+
+def cache_store(cache_dir, url, path, response_headers, max_size, digest=None):
+    """Add a downloaded file to the cache, then evict old entries beyond max_size bytes.
+
+    digest is the file's SHA-256 when it is already known.
+    """
+    digest = digest or file_sha256(path)
+    object_path = cache_object_path(cache_dir, digest)
+    if not os.path.exists(object_path):
+        os.makedirs(os.path.dirname(object_path), exist_ok=True)
+        link_or_copy(path, object_path)
+
+    with closing(open_cache(cache_dir)) as db, db:
+        db.execute(
+            'INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?)',
+            (
+                url, digest, os.path.getsize(object_path),
+                response_headers.get('ETag'), response_headers.get('Last-Modified'),
+                response_headers.get('Content-Type'), time.time(),
+            )
+        )
+
+    cache_evict(cache_dir, max_size)
+
+
+def cache_evict(cache_dir, max_size):
+    """Delete least recently used objects until the cache fits in max_size bytes."""
+    with closing(open_cache(cache_dir)) as db, db:
+        rows = db.execute(
+            'SELECT sha256, MAX(size), MAX(last_access) FROM entries GROUP BY sha256 ORDER BY 3'
+        ).fetchall()
+
+        total = sum(size for _, size, _ in rows)
+        evicted = 0
+        freed = 0
+        for digest, size, _ in rows:
+            if total <= max_size:
+                break
+            db.execute('DELETE FROM entries WHERE sha256 = ?', (digest,))
+            discard_partial(cache_object_path(cache_dir, digest))
+            total -= size
+            evicted += 1
+            freed += size
+
+    return evicted, freed
+
+
+def cache_stats(cache_dir):
+    """Summarize the contents of a download cache, with its probe cache and frame store."""
+    with closing(open_cache(cache_dir)) as db:
+        entries = db.execute('SELECT COUNT(*) FROM entries').fetchone()[0]
+        objects, total = db.execute(
+            'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM (SELECT DISTINCT sha256, size FROM entries)'
+        ).fetchone()
+        oldest = db.execute('SELECT MIN(last_access) FROM entries').fetchone()[0]
+    with closing(open_probe_cache(cache_dir)) as db:
+        probes = db.execute('SELECT COUNT(*) FROM probes').fetchone()[0]
+    with closing(open_frame_store(os.path.join(cache_dir, 'frames'))) as db:
+        frames, frame_videos, frames_size = db.execute(
+            'SELECT COUNT(*), COUNT(DISTINCT sha256), COALESCE(SUM(size), 0) FROM frames'
+        ).fetchone()
+
+    return {
+        'cache_dir': cache_dir, 'entries': entries, 'objects': objects, 'total_size': total, 'oldest_access': oldest,
+        'probes': probes, 'frames': frames, 'frame_videos': frame_videos, 'frames_size': frames_size,
+    }
+
+
+def cache_prune(cache_dir, max_size):
+    """Evict down to max_size bytes and drop entries and objects that no longer match."""
+    with closing(open_cache(cache_dir)) as db, db:
+        digests = {row[0] for row in db.execute('SELECT DISTINCT sha256 FROM entries')}
+        for digest in list(digests):
+            if not os.path.exists(cache_object_path(cache_dir, digest)):
+                db.execute('DELETE FROM entries WHERE sha256 = ?', (digest,))
+                digests.discard(digest)
+
+    # Objects left behind by an interrupted store
+    orphans = 0
+    objects_dir = os.path.join(cache_dir, 'objects')
+    for root, _, files in os.walk(objects_dir):
+        for name in files:
+            if name not in digests:
+                os.remove(os.path.join(root, name))
+                orphans += 1
+
+    evicted, freed = cache_evict(cache_dir, max_size)
+    return evicted + orphans, freed
+
+
+def video_filename(url, name=None, content_type=None):
+    """Pick the local filename for a URL: name, given a video extension unless it has one, or the URL's own."""
+    if not name:
+        return get_filename_from_url(url)
+    if os.path.splitext(name)[1].lower() in SUPPORTED_FORMATS:
+        return name
+    return f"{name}{get_file_extension(url, content_type)}"
+
+
+def fetch_video(url, output_dir, name=None, connections=DEFAULT_CONNECTIONS, cache_dir=None,
+                cache_size_mb=DEFAULT_CACHE_SIZE_MB, show_progress=True, session=None,
+                expected_size=None, expected_sha256=None, tee=None):
+    """Download a video into output_dir, reusing a cached copy or resuming an interrupted download when possible.
+
+    name is the filename to use (see video_filename()). The SHA-256 of the
+    file is computed while it downloads. expected_size and expected_sha256
+    raise VerificationError as soon as the server's Content-Length, the bytes
+    received or the finished file contradict them; a file that fails is
+    deleted rather than left to resume. tee receives the bytes in file order
+    as they arrive (see download_stream()), which takes a single connection;
+    a cached copy is not passed to it. Returns the path of the file and
+    raises on failure.
+    """
+    print(f"Downloading video from: {url}")
+    expected_sha256 = expected_sha256.lower() if expected_sha256 else None
+    os.makedirs(output_dir, exist_ok=True)
+
+    # Revalidate a cached copy with the same request that starts the download
+    entry = cache_lookup(cache_dir, url) if cache_dir else None
+    headers = {'Accept-Encoding': 'identity'}
+    if entry:
+        headers.update(conditional_headers(entry))
+
+    http = session or SHARED_SESSION or requests
+    trace_connection(url)
+    with TRACE.span('ttfb', 'network', url=url) as span:
+        response = http.get(url, stream=True, timeout=30, headers=headers)
+        span['status'] = response.status_code
+    cache_hit = entry is not None and is_cache_hit(entry, response)
+    if not cache_hit:
+        response.raise_for_status()
+
+    response_headers = response.headers
+    content_type = response.headers.get('Content-Type') or (entry['content_type'] if entry else '') or ''
+    content_length = response.headers.get('Content-Length')
+    total_size = int(content_length) if content_length else None
+    if not cache_hit and expected_size is not None and total_size and total_size != expected_size:
+        response.close()
+        raise VerificationError(f"server reports {total_size} bytes, expected {expected_size}")
+
+    output_path = os.path.join(output_dir, video_filename(url, name, content_type))
+    part_path = output_path + PART_SUFFIX
+    state_path = output_path + STATE_SUFFIX
+
+    if cache_hit:
+        response.close()
+        if expected_size is not None and entry['size'] != expected_size:
+            raise VerificationError(f"cached copy has {entry['size']} bytes, expected {expected_size}")
+        if expected_sha256 and entry['sha256'] != expected_sha256:
+            raise VerificationError(f"cached copy has SHA-256 {entry['sha256']}, expected {expected_sha256}")
+        link_or_copy(entry['path'], output_path)
+        cache_touch(cache_dir, url)
+        status('ok', f"Using cached copy: {output_path} ({entry['size'] / (1024 * 1024):.2f} MB)")
+        return output_path
+
+    # Large files are fetched as byte ranges so they can be split and resumed
+    use_ranges = False
+    if supports_ranges(response) and tee is None:
+        validators = get_validators(response)
+        state = load_resume_state(state_path, part_path, url, total_size, validators)
+        if state:
+            print(f"Resuming download at {state['bytes_written'] / (1024 * 1024):.1f} MB")
+            use_ranges = True
+        elif total_size >= MIN_SEGMENT_SIZE:
+            discard_partial(part_path, state_path)
+            state = new_resume_state(url, total_size, validators, max(1, connections))
+            use_ranges = True
+
+    hasher = StreamingSha256()
+    if use_ranges:
+        response.close()
+        try:
+            download_ranges(url, part_path, state_path, state, show_progress, session, hasher)
+        except RangeNotSupportedError as e:
+            if show_progress:
+                print()
+            status('warning', f"{e}, restarting over a single connection")
+            discard_partial(part_path, state_path)
+            use_ranges = False
+            response = None
+            hasher = StreamingSha256()
+
+    if use_ranges:
+        file_size = state['bytes_written']
+    else:
+        try:
+            file_size = download_stream(url, part_path, response, total_size, show_progress, session,
+                                        hasher, expected_size, tee)
+        except VerificationError:
+            discard_partial(part_path, state_path)
+            raise
+
+    if show_progress:
+        print()  # New line after progress
+
+    # Only a complete, verified file is moved to its final name
+    if total_size and file_size != total_size:
+        raise IncompleteDownloadError(f"{part_path} has {file_size} of {total_size} bytes")
+    with TRACE.span('hash', 'disk', bytes=file_size):
+        digest = hasher.hexdigest(part_path, file_size)
+    if expected_size is not None and file_size != expected_size:
+        discard_partial(part_path, state_path)
+        raise VerificationError(f"got {file_size} bytes, expected {expected_size}")
+    if expected_sha256 and digest != expected_sha256:
+        discard_partial(part_path, state_path)
+        raise VerificationError(f"SHA-256 is {digest}, expected {expected_sha256}")
+    os.replace(part_path, output_path)
+    discard_partial(state_path)
+
+    status('ok', f"Downloaded: {output_path} ({file_size / (1024 * 1024):.2f} MB)")
+    if expected_sha256 or expected_size is not None:
+        status('ok', f"Verified {file_size} bytes, SHA-256 {digest}")
+
+    if cache_dir:
+        try:
+            cache_store(cache_dir, url, output_path, response_headers, cache_size_mb * 1024 * 1024, digest)
+        except (OSError, sqlite3.Error) as e:
+            status('warning', f"Could not add video to cache: {e}")
+
+    return output_path
+
+
+def first_packet_time(path, start=None):
+    """Return the pts in seconds of the first video packet of a file or URL, from the keyframe before start if given.
+
+    ffprobe seeks to start like an ffmpeg input -ss does, so this is the
+    keyframe a clip cut there with stream copy begins with.
+    """
+    cmd = ['ffprobe', '-v', 'error', '-select_streams', 'v:0',
+           '-read_intervals', f'{start:.6f}%+#1' if start else '%+#1',
+           '-show_entries', 'packet=pts_time', '-of', 'csv=p=0', str(path)]
+    result = run_process(cmd, capture_output=True, text=True, timeout=URL_PROBE_TIMEOUT)
+    if result.returncode != 0:
+        raise ProbeError(result.stderr.strip() or f"ffprobe exited with code {result.returncode}")
+    try:
+        return float(result.stdout.split()[0])
+    except (IndexError, ValueError):
+        raise ProbeError(f"no video packet in {path}") from None
+
+
+def fetch_clip(url, output_dir, start=None, end=None, name=None, session=None):
+    """Download only the part of a remote video between start and end seconds.
+
+    ffmpeg reads the container index (MP4 moov atom, WebM cues) with range
+    requests, fetches just the samples from the keyframe before start up to
+    end, and stream-copies them into a small standalone clip. Returns
+    (clip path, the source time of the clip's time zero). That is start for
+    an MP4, whose edit list hides the frames before it, but the keyframe
+    for a WebM, which cannot start at a negative time; it is measured by
+    matching the clip's first packet with the source's keyframe before
+    start. Raises RangeNotSupportedError when the server ignores byte
+    ranges.
+    """
+    trace_connection(url)
+    with TRACE.span('ttfb', 'network', url=url):
+        response = request_first_byte(url, session)
+    if response.status_code != 206:
+        raise RangeNotSupportedError(f"{url} does not support byte-range requests")
+
+    os.makedirs(output_dir, exist_ok=True)
+
+    stem, ext = os.path.splitext(video_filename(url, name, response.headers.get('Content-Type')))
+    first = start or 0
+    window = f"{first:g}-{end:g}s" if end is not None else f"{first:g}s-end"
+    output_path = os.path.join(output_dir, f"{stem}_{window}{ext}")
+
+    print(f"Downloading {window} of: {url}")
+
+    cmd = ['ffmpeg']
+    if first:
+        cmd += ['-ss', f'{first:.6f}']
+    if end is not None:
+        cmd += ['-t', f'{end - first:.6f}']
+    cmd += [
+        '-i', response.url,
+        '-c', 'copy',  # No re-encoding; the clip starts at the keyframe before start
+        '-y',
+        output_path
+    ]
+
+    result = run_process(cmd, capture_output=True, text=True)
+    if result.returncode != 0:
+        discard_partial(output_path)
+        raise RuntimeError(f"ffmpeg could not cut the clip: {result.stderr.strip().splitlines()[-1:]}")
+
+    clip_size = os.path.getsize(output_path)
+    total_size = get_total_size(response)
+    of_total = f" of {total_size / (1024 * 1024):.2f} MB" if total_size else ""
+    status('ok', f"Downloaded clip: {output_path} ({clip_size / (1024 * 1024):.2f} MB{of_total})")
+
+    offset = first
+    if first:
+        try:
+            offset = first_packet_time(response.url, first) - first_packet_time(output_path)
+        except (ProbeError, subprocess.TimeoutExpired, FileNotFoundError) as e:
+            status('warning', f"Could not read where the clip starts ({e}); assuming {first:g}s")
+    return output_path, round(offset, 6)
+
+
+def is_streamable(head):
+    """Tell from the first bytes of a file whether ffmpeg can decode it from a pipe as it arrives.
+
+    Matroska/WebM is always read front to back. MP4/MOV is only when its moov
+    index comes before the media data (a "faststart" file); otherwise ffmpeg
+    needs the end of the file before it can decode the first frame.
+    """
+    if head.startswith(MATROSKA_MAGIC):
+        return True
+    offset = 0
+    while offset + 8 <= len(head):
+        size, kind = struct.unpack_from('>I4s', head, offset)
+        if size == 1 and offset + 16 <= len(head):
+            # A 64-bit size follows the box type
+            size = struct.unpack_from('>Q', head, offset + 8)[0]
+        if kind == b'moov':
+            return True
+        if kind == b'mdat' or size < 8:
+            # The media data comes first, or a box runs to the end of the file
+            return False
+        offset += size
+    # No moov among the boxes that start in the head, or not an MP4 at all
+    return False
+
+
+def fetch_head(url, size=STREAM_HEAD_SIZE, session=None):
+    """Fetch the first size bytes of a URL, returning them and the (closed) response.
+
+    A status of 206 tells that the server honoured the range.
+    """
+    http = session or SHARED_SESSION or requests
+    trace_connection(url)
+    with TRACE.span('ttfb', 'network', url=url) as span:
+        response = http.get(url, headers={'Range': f'bytes=0-{size - 1}', 'Accept-Encoding': 'identity'},
+                            stream=True, timeout=10)
+        span['status'] = response.status_code
+    with response:
+        response.raise_for_status()
+        return response.raw.read(size), response
+
+
+def has_pending_download(url, output_path, cache_dir=None):
+    """Tell whether the cache or an interrupted download already holds part of a URL, so it is not streamed."""
+    return bool(cache_dir and cache_lookup(cache_dir, url)) or os.path.exists(f'{output_path}{STATE_SUFFIX}')
+
+
+def tee_download(url, output_dir, consume, name=None, cache_dir=None, cache_size_mb=DEFAULT_CACHE_SIZE_MB,
+                 session=None, expected_size=None, expected_sha256=None):
+    """Download a video over one connection while consume(source) reads its bytes from a pipe in a worker thread.
+
+    Returns (video_path, consume's result or None). Raises on download errors
+    like fetch_video(); the pipe is closed either way, so consume sees the
+    end of the file (or a short read) and the worker always finishes.
+    """
+    read_fd, write_fd = os.pipe()
+    source, sink = os.fdopen(read_fd, 'rb'), os.fdopen(write_fd, 'wb')
+    consumed = []
+
+    def run():
+        try:
+            consumed.append(consume(source))
+        finally:
+            # Unblocks the download if consume never handed the pipe to ffmpeg
+            source.close()
+
+    worker = threading.Thread(target=run, name='stream-extract')
+    worker.start()
+    try:
+        video_path = fetch_video(url, output_dir, name, connections=1, cache_dir=cache_dir,
+                                 cache_size_mb=cache_size_mb, session=session, expected_size=expected_size,
+                                 expected_sha256=expected_sha256, tee=sink)
+    finally:
+        try:
+            sink.close()
+        except BrokenPipeError:
+            pass
+        worker.join()
+    return video_path, consumed[0] if consumed else None
+
+
+def probe_key(video_path):
+    """Identify a file version by (realpath, size, mtime_ns)."""
+    stat = os.stat(video_path)
+    return os.path.realpath(video_path), stat.st_size, stat.st_mtime_ns
+
+
+def request_first_byte(url, session=None):
+    """Request the first byte of a URL to learn its size and whether ranges are honoured.
+
+    The body is never read, so a server that ignores the range costs nothing.
+    """
+    http = session or SHARED_SESSION or requests
+    response = http.get(url, headers={'Range': 'bytes=0-0', 'Accept-Encoding': 'identity'},
+                        stream=True, timeout=10, allow_redirects=True)
+    response.close()
+    response.raise_for_status()
+    return response
+
+
+def check_ffmpeg():
+    """Check if ffmpeg and ffprobe are available."""
+    ffmpeg_available = shutil.which('ffmpeg') is not None
+    ffprobe_available = shutil.which('ffprobe') is not None
+    return ffmpeg_available, ffprobe_available
+
+
+def open_probe_cache(cache_dir):
+    """Open the SQLite store of ffprobe results, creating it if needed."""
+    os.makedirs(cache_dir, exist_ok=True)
+    db = sqlite3.connect(os.path.join(cache_dir, 'probe.sqlite'), timeout=30)
+    db.execute(
+        'CREATE TABLE IF NOT EXISTS probes ('
+        'path TEXT PRIMARY KEY, size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL, data TEXT NOT NULL)'
+    )
+    return db
+
+
+def probe_video(video_path, refresh=False, cache_dir=DEFAULT_CACHE_DIR):
+    """Get the full ffprobe format/stream data of a file.
+
+    Results are memoized in-process and persisted under cache_dir, so an
+    unchanged file is only ever probed once. Use refresh=True to re-probe.
+    """
+    key = probe_key(video_path)
+
+    if not refresh:
+        if key in PROBE_MEMO:
+            return PROBE_MEMO[key]
+        try:
+            with closing(open_probe_cache(cache_dir)) as db:
+                row = db.execute(
+                    'SELECT data FROM probes WHERE path = ? AND size = ? AND mtime_ns = ?', key
+                ).fetchone()
+        except (OSError, sqlite3.Error):
+            row = None
+        if row:
+            PROBE_MEMO[key] = json.loads(row[0])
+            return PROBE_MEMO[key]
+
+    cmd = [
+        'ffprobe',
+        '-v', 'quiet',
+        '-print_format', 'json',
+        '-show_format',
+        '-show_streams',
+        str(video_path)
+    ]
+
+    result = run_process(cmd, capture_output=True, text=True, timeout=30)
+
+    if result.returncode != 0:
+        raise ProbeError(result.stderr.strip() or f"ffprobe exited with code {result.returncode}")
+
+    data = json.loads(result.stdout)
+    PROBE_MEMO[key] = data
+
+    try:
+        with closing(open_probe_cache(cache_dir)) as db, db:
+            db.execute('INSERT OR REPLACE INTO probes VALUES (?, ?, ?, ?)', (*key, result.stdout))
+    except (OSError, sqlite3.Error) as e:
+        status('warning', f"Could not save ffprobe result: {e}")
+
+    return data
+
+
+def invalidate_probes(cache_dir=DEFAULT_CACHE_DIR, video_path=None):
+    """Forget cached ffprobe results for one file, or for every file when video_path is None."""
+    if video_path is None:
+        PROBE_MEMO.clear()
+    else:
+        path = os.path.realpath(video_path)
+        for key in [key for key in PROBE_MEMO if key[0] == path]:
+            del PROBE_MEMO[key]
+
+    with closing(open_probe_cache(cache_dir)) as db, db:
+        if video_path is None:
+            removed = db.execute('DELETE FROM probes').rowcount
+        else:
+            removed = db.execute('DELETE FROM probes WHERE path = ?', (path,)).rowcount
+
+    return removed
+
+
+def prune_probes(cache_dir=DEFAULT_CACHE_DIR):
+    """Drop cached ffprobe results for files that were deleted or modified."""
+    with closing(open_probe_cache(cache_dir)) as db, db:
+        stale = []
+        for path, size, mtime_ns in db.execute('SELECT path, size, mtime_ns FROM probes').fetchall():
+            try:
+                stat = os.stat(path)
+                if (stat.st_size, stat.st_mtime_ns) == (size, mtime_ns):
+                    continue
+            except OSError:
+                pass
+            stale.append((path,))
+        db.executemany('DELETE FROM probes WHERE path = ?', stale)
+
+    return len(stale)
+
+
+def summarize_probe(data):
+    """Pick the useful fields out of ffprobe format/stream data."""
+    info = {}
+
+    # Get format info
+    if 'format' in data:
+        fmt = data['format']
+        info['duration'] = float(fmt.get('duration', 0))
+        info['format_name'] = fmt.get('format_name', 'unknown')
+        info['bitrate'] = int(fmt.get('bit_rate', 0)) if fmt.get('bit_rate') else None
+
+    # Get video stream info
+    for stream in data.get('streams', []):
+        if stream.get('codec_type') == 'video':
+            info['width'] = stream.get('width')
+            info['height'] = stream.get('height')
+            info['video_codec'] = stream.get('codec_name')
+            info['frame_rate'] = stream.get('r_frame_rate')
+            break
+
+    # Get audio stream info
+    for stream in data.get('streams', []):
+        if stream.get('codec_type') == 'audio':
+            info['audio_codec'] = stream.get('codec_name')
+            info['audio_channels'] = stream.get('channels')
+            info['sample_rate'] = stream.get('sample_rate')
+            break
+
+    return info
+
+
+def parse_frame_rate(rate):
+    """Convert an ffprobe rate such as '30000/1001' to frames per second."""
+    try:
+        num, _, den = str(rate).partition('/')
+        value = float(num) / float(den or 1)
+    except (ValueError, ZeroDivisionError):
+        return None
+    return value if value > 0 else None
+
+
+def probe_url(url):
+    """Get ffprobe format/stream data for a remote file.
+
+    ffprobe seeks with HTTP range requests, so only the container header and
+    index (MP4 moov atom, WebM cues) are transferred, not the whole video.
+    """
+    cmd = [
+        'ffprobe',
+        '-v', 'quiet',
+        '-print_format', 'json',
+        '-show_format',
+        '-show_streams',
+        url
+    ]
+
+    result = run_process(cmd, capture_output=True, text=True, timeout=URL_PROBE_TIMEOUT)
+
+    if result.returncode != 0:
+        raise ProbeError(result.stderr.strip() or f"ffprobe exited with code {result.returncode}")
+
+    return json.loads(result.stdout)
+
+
+def get_filename_from_url(url):
+    """Extract filename from URL."""
+    parsed = urlparse(url)
+    path = unquote(parsed.path)
+    filename = os.path.basename(path)
+
+    if not filename or not any(filename.lower().endswith(ext) for ext in SUPPORTED_FORMATS):
+        # Generate a default name if none found
+        filename = "video.mp4"
+
+    return filename
+
+
+def get_file_extension(url, content_type=None):
+    """Get file extension from URL or content type."""
+    # First try from URL
+    parsed = urlparse(url)
+    path = unquote(parsed.path)
+    _, ext = os.path.splitext(path)
+
+    if ext.lower() in SUPPORTED_FORMATS:
+        return ext.lower()
+
+    # Try from content type
+    if content_type:
+        content_type = content_type.lower()
+        if 'mp4' in content_type:
+            return '.mp4'
+        elif 'webm' in content_type:
+            return '.webm'
+        elif 'matroska' in content_type or 'mkv' in content_type:
+            return '.mkv'
+        elif 'avi' in content_type:
+            return '.avi'
+        elif 'quicktime' in content_type or 'mov' in content_type:
+            return '.mov'
+
+    # Default to mp4
+    return '.mp4'
+
+
+def get_total_size(response):
+    """Get the full size of a remote file from a (possibly ranged) response, or None."""
+    content_range = response.headers.get('Content-Range', '')
+    if response.status_code == 206 and '/' in content_range:
+        size = content_range.rsplit('/', 1)[1]
+    else:
+        size = response.headers.get('Content-Length')
+    return int(size) if size and size.isdigit() else None
+
+
+def parse_time(value):
+    """Parse a time given as seconds, MM:SS or HH:MM:SS (fractions allowed)."""
+    try:
+        seconds = 0.0
+        for part in value.strip().split(':'):
+            seconds = seconds * 60 + float(part)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid time: {value!r} (use seconds, MM:SS or HH:MM:SS)")
+    if seconds < 0:
+        raise argparse.ArgumentTypeError(f"time must not be negative: {value!r}")
+    return seconds
+
+
+def parse_time_range(value):
+    """Parse a time window such as '00:07-00:13' into (start, end) seconds."""
+    start, sep, end = value.partition('-')
+    if not sep:
+        raise argparse.ArgumentTypeError(f"invalid range: {value!r} (use START-END, e.g. 00:07-00:13)")
+    return parse_time(start), parse_time(end)
+
+
+def parse_showinfo_line(line, time_base=None):
+    """Parse one line of ffmpeg's showinfo log into (time_base, frame time).
+
+    showinfo logs the time base of its input once, then the integer pts of
+    every frame; their product is the exact frame time, as a Fraction. The
+    printed pts_time is only a fallback, since ffmpeg rounds it to as few as
+    six significant digits. The frame time is None on other lines.
+    """
+    match = re.search(r'config in time_base: (\d+)/(\d+)', line)
+    if match:
+        return Fraction(int(match.group(1)), int(match.group(2))), None
+    match = re.search(r'\bpts:\s*(-?\d+)\s+pts_time:\s*(-?[\d.]+)', line)
+    if not match:
+        return time_base, None
+    if time_base:
+        return time_base, int(match.group(1)) * time_base
+    return time_base, Fraction(match.group(2))
+
+
+def parse_showinfo_times(stderr):
+    """Get the exact time of every frame reported by ffmpeg's showinfo filter."""
+    times = []
+    time_base = None
+    for line in stderr.splitlines():
+        time_base, pts_time = parse_showinfo_line(line, time_base)
+        if pts_time is not None:
+            times.append(pts_time)
+    return times
+
+
+def to_microseconds(seconds):
+    """Round a time in seconds to whole microseconds, the unit ffmpeg parses -ss and -t in."""
+    return round(seconds * 1_000_000)
+
+
+def seek_args(start=None, end=None):
+    """Build the ffmpeg input options that decode only from start to end seconds.
+
+    Both ends are rounded to whole microseconds first, so every caller
+    seeking to the same point hands ffmpeg the same value.
+    """
+    first_us = to_microseconds(start or 0)
+    args = []
+    if first_us > 0:
+        # Input seeking jumps to the keyframe before start; timestamps then restart at zero
+        args += ['-ss', f'{first_us / 1e6:.6f}']
+    if end is not None:
+        args += ['-t', f'{(to_microseconds(end) - first_us) / 1e6:.6f}']
+    return args
+
+
+def frame_time(start, pts_time):
+    """Turn the showinfo time of a frame decoded from start into file seconds, to the microsecond."""
+    return float(round(Fraction(to_microseconds(start or 0), 1_000_000) + pts_time, 6))
+
+
+def build_select_expr(timestamps):
+    """Build a select filter expression keeping the first frame at or after each timestamp."""
+    # The tenth of a microsecond absorbs float error for frames exactly at a timestamp
+    return '+'.join(
+        f"gte(t,{ts:.6f}-1e-7)*(lt(prev_pts*TB,{ts:.6f}-1e-7)+isnan(prev_pts))"
+        for ts in timestamps
+    )
+
+
+def sampling_filter(fps=None, timestamps=None, fps_origin=0):
+    """Build the select filter that keeps the requested frames, or None to keep every frame.
+
+    timestamps keeps the first frame at or after each time; fps keeps the
+    first frame of every 1/fps slot, so each output is a real source frame.
+    Slots are counted from fps_origin seconds before the point decoding starts at.
+    """
+    if timestamps is not None:
+        return f"select='{build_select_expr(timestamps)}'"
+    if fps:
+        shift = f'{fps_origin:+.6f}' if fps_origin else ''
+        slot = f'floor((t{shift})*{fps}+1e-6)'
+        return f"select='isnan(prev_selected_t)+gte({slot},{slot.replace('(t', '(prev_selected_t')}+1)'"
+    return None
+
+
+def start_filter(start):
+    """Build the select filter that drops frames before start seconds, for input that cannot seek."""
+    return f"select='gte(t,{start:.6f}-1e-7)'"
+
+
+def end_filter(start, end):
+    """Build the select filter that drops frames at or after end seconds, decoding from start.
+
+    ffmpeg's -t counts from the first frame after the seek point rather than
+    from the seek point itself, so the exact end is enforced on the integer
+    pts here, where both ends of a window are the same for every seek point.
+    """
+    duration = (to_microseconds(end) - to_microseconds(start or 0)) / 1e6
+    return f"select='lt(pts,floor({duration:.6f}/TB+0.5))'"
+
+
+def crop_filter(area):
+    """Build a crop filter for LEFT,TOP,WIDTH,HEIGHT fractions of the frame."""
+    left, top, width, height = area
+    return f'crop=iw*{width:g}:ih*{height:g}:iw*{left:g}:ih*{top:g}'
+
+
+@lru_cache(maxsize=None)
+def has_ffmpeg_filter(name):
+    """Check whether the installed ffmpeg was built with a filter (drawtext needs libfreetype)."""
+    result = run_process(['ffmpeg', '-hide_banner', '-filters'], capture_output=True, text=True)
+    return any(line.split()[1:2] == [name] for line in result.stdout.splitlines())
+
+
+def import_numpy():
+    """Import NumPy, installing it first if needed (only the frame iterator uses it)."""
+    return import_package('numpy')
+
+
+def read_ffmpeg_log(stream, sizes, times, log):
+    """Follow ffmpeg's log, reporting the raw output size and the exact time of every frame."""
+    in_output = False
+    time_base = None
+    for line in iter(stream.readline, b''):
+        line = line.decode(errors='replace').rstrip()
+        log.append(line)
+        if line.startswith('Output #'):
+            in_output = True
+        elif in_output and 'Video:' in line:
+            match = re.search(r', (\d+)x(\d+)', line)
+            if match:
+                sizes.put((int(match.group(1)), int(match.group(2))))
+        time_base, pts_time = parse_showinfo_line(line, time_base)
+        if pts_time is not None:
+            times.put(pts_time)
+    # Unblock the reader when ffmpeg ends early
+    sizes.put(None)
+    times.put(None)
+
+
+def read_exactly(stream, view):
+    """Fill a memoryview from a stream; False at end of stream."""
+    filled = 0
+    while filled < len(view):
+        count = stream.readinto(view[filled:])
+        if not count:
+            return False
+        filled += count
+    return True
+
+
+def iter_frames(video_path, fps=None, size=None, pix_fmt='rgb24', start=None, end=None, timestamps=None, crop=None,
+                fps_origin=None, source=None):
+    """Decode a video into NumPy arrays, yielding (timestamp, frame) pairs.
+
+    Frames are read from an ffmpeg rawvideo pipe straight into one reused
+    buffer, so memory stays flat however long the video is. Each yielded
+    array is overwritten by the next frame; copy it to keep it.
+
+    fps keeps the first frame of every 1/fps slot (default: every frame) and
+    timestamps instead keeps the first frame at or after each given time.
+    size=(width, height) scales the frames, with -1 keeping the aspect ratio,
+    and crop=(x, y, width, height) in source pixels cuts them out first; both
+    run inside ffmpeg's filter graph, so only the result crosses the pipe.
+    pix_fmt is 'gray' for (height, width) or 'rgb24' for (height, width, 3)
+    arrays. start/end limit decoding to a window, using input seeking, and
+    fps slots are counted from fps_origin (default: start), so windows cut
+    out of a longer one keep its sampling. All times are in seconds from the
+    start of the file; frame times are exact to the microsecond.
+
+    source, a binary file such as a pipe, is decoded instead of opening
+    video_path, which then only names the video in errors. ffmpeg gets it as
+    its stdin, and it is closed here once ffmpeg has it. A pipe cannot seek,
+    so the frames before start are decoded and dropped.
+    """
+    np = import_numpy()
+    if pix_fmt not in RAW_PIX_FMTS:
+        raise ValueError(f"pix_fmt must be one of: {', '.join(RAW_PIX_FMTS)}")
+
+    first = to_microseconds(start or 0) / 1e6
+    seek = 0.0 if source else first
+    filters = [start_filter(first)] if seek < first else []
+    if end is not None:
+        filters.append(end_filter(seek, end))
+    if timestamps is not None:
+        timestamps = sorted(set(timestamps))
+        filters.append(sampling_filter(timestamps=[ts - seek for ts in timestamps]))
+    elif fps:
+        origin = first if fps_origin is None else to_microseconds(fps_origin) / 1e6
+        filters.append(sampling_filter(fps, fps_origin=seek - origin))
+    if crop:
+        filters.append('crop={2}:{3}:{0}:{1}'.format(*crop))
+    if size:
+        filters.append(f'scale={size[0]}:{size[1]}')
+    filters.append('showinfo')
+
+    cmd = ['ffmpeg', '-hide_banner', '-nostdin', '-nostats', *seek_args(seek, end)]
+    cmd += ['-i', 'pipe:0' if source else str(video_path), '-vf', ','.join(filters), '-vsync', 'vfr']
+    if timestamps is not None:
+        # Stop decoding as soon as the last requested frame is out
+        cmd += ['-frames:v', str(len(timestamps))]
+    cmd += ['-f', 'rawvideo', '-pix_fmt', pix_fmt, '-']
+
+    process = TracedPopen(cmd, stdin=source, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if source:
+        # Only ffmpeg may hold the pipe open, so its writer notices when ffmpeg stops reading
+        source.close()
+    sizes, times, log = queue.Queue(), queue.Queue(), []
+    reader = threading.Thread(target=read_ffmpeg_log, args=(process.stderr, sizes, times, log), daemon=True)
+    reader.start()
+
+    try:
+        output_size = sizes.get()
+        if output_size is not None:
+            width, height = output_size
+            channels = RAW_PIX_FMTS[pix_fmt]
+            buffer = bytearray(width * height * channels)
+            view = memoryview(buffer)
+            frame = np.frombuffer(buffer, dtype=np.uint8).reshape(
+                (height, width) if channels == 1 else (height, width, channels)
+            )
+            while read_exactly(process.stdout, view):
+                pts_time = times.get()
+                yield frame_time(seek, pts_time if pts_time is not None else 0), frame
+
+        if process.wait() != 0:
+            raise RuntimeError(f"ffmpeg could not decode {video_path}: {log[-1:]}")
+    finally:
+        process.stdout.close()
+        if process.poll() is None:
+            process.kill()
+        process.wait()
+        reader.join()
+
+
+def image_encoder_args(image_format, quality=None):
+    """Get the ffmpeg output options for frames written as image_format.
+
+    quality runs from 1 to 100 (None for the format's default). PNG is
+    lossless, so for PNG it sets the zlib effort instead: lower is faster.
+    """
+    if image_format == 'jpg':
+        # mjpeg's qscale runs from 2 (best) to 31
+        qscale = 2 if quality is None else round(31 - (quality - 1) * 29 / 99)
+        return ['-q:v', str(qscale), '-pix_fmt', 'yuvj420p']
+    if image_format == 'webp':
+        return ['-c:v', 'libwebp', '-quality', str(DEFAULT_WEBP_QUALITY if quality is None else quality)]
+    if image_format == 'png' and quality is not None:
+        return ['-compression_level', str(round(quality * 9 / 100))]
+    return []
+
+
+def write_frames(frames, output_pattern, encoder_args=(), frame_shape=None):
+    """Encode (timestamp, frame) pairs from iter_frames() into numbered image files.
+
+    One ffmpeg process encodes every frame; output_pattern is an image2
+    pattern such as 'frame_%03d.jpg'. A '.raw' pattern skips encoding and
+    writes each frame's pixels as they are. frame_shape, if given, is a list
+    that receives the array shape of the frames. Returns the timestamps of
+    the frames written, in order.
+    """
+    raw = output_pattern.endswith('.raw')
+    writer = None
+    written = []
+    try:
+        for timestamp, frame in frames:
+            if frame_shape is not None and not frame_shape:
+                frame_shape.extend(frame.shape)
+            if raw:
+                written.append(timestamp)
+                with open(output_pattern % len(written), 'wb') as f:
+                    f.write(frame)
+                continue
+            if writer is None:
+                height, width = frame.shape[:2]
+                pix_fmt = 'gray' if frame.ndim == 2 else 'rgb24'
+                writer = TracedPopen([
+                    'ffmpeg', '-v', 'error',
+                    '-f', 'rawvideo', '-pix_fmt', pix_fmt, '-s', f'{width}x{height}', '-i', '-',
+                    *encoder_args,
+                    '-y',
+                    output_pattern
+                ], stdin=subprocess.PIPE, stderr=subprocess.PIPE)
+            writer.stdin.write(frame)
+            written.append(timestamp)
+    finally:
+        if writer:
+            writer.stdin.close()
+            errors = writer.stderr.read().decode(errors='replace').strip()
+            writer.wait()
+
+    if writer and writer.returncode != 0:
+        raise RuntimeError(f"ffmpeg could not write frames: {errors.splitlines()[-1:]}")
+    return written
+
+
+def segment_starts(video_path, jobs, start=None, end=None):
+    """Split the start-end window into at most jobs segments that each begin at a keyframe.
+
+    Returns (starts, time_base): the start of every segment in whole
+    microseconds, the first being start itself, and the time base of the
+    video stream. Every later start is rounded up from its keyframe onto the
+    grid of times that are whole microseconds and whole time base ticks at
+    once, counted from start; ffmpeg then rounds each seek by the same amount,
+    so frames decoded after any of them get the times a decode from start gives.
+    """
+    first_us = to_microseconds(start or 0)
+    keyframes, time_base = keyframe_index(video_path, start, end)
+    if jobs < 2 or not keyframes or time_base is None:
+        return [first_us], time_base
+
+    ticks = time_base.numerator * 1_000_000
+    step_us = ticks // math.gcd(time_base.denominator, ticks)
+    keyframes_us = [to_microseconds(t) for t in keyframes]
+    last_us = to_microseconds(end) if end is not None else keyframes_us[-1]
+    starts = [first_us]
+    for k in range(1, jobs):
+        target = first_us + (last_us - first_us) * k // jobs
+        index = bisect.bisect_left(keyframes_us, target)
+        if index == len(keyframes_us):
+            break
+        seek_us = first_us + -(-(keyframes_us[index] - first_us) // step_us) * step_us
+        if starts[-1] < seek_us < last_us:
+            starts.append(seek_us)
+    return starts, time_base
+
+
+def extract_segment(video_path, output_pattern, fps, timestamps, start, end, fps_origin, size, crop, encoder_args,
+                    trace=False):
+    """Decode and write the frames of one segment; runs in an extract_frames_parallel() worker.
+
+    Returns the timestamps written, the array shape of the frames and, with
+    trace=True, the trace spans recorded in the worker.
+    """
+    if trace:
+        TRACE.start()
+    frames = iter_frames(video_path, fps, size, start=start, end=end, timestamps=timestamps, crop=crop,
+                         fps_origin=fps_origin)
+    frame_shape = []
+    written = write_frames(frames, output_pattern, encoder_args, frame_shape)
+    return written, frame_shape, TRACE.spans if trace else []
+
+
+def extract_frames_parallel(video_path, output_pattern, jobs, fps=None, timestamps=None, start=None, end=None,
+                            size=None, crop=None, encoder_args=(), frame_shape=None):
+    """Write the frames write_frames(iter_frames()) would, decoding jobs segments at once.
+
+    segment_starts() cuts the window at keyframes and a process pool runs one
+    ffmpeg decoder and encoder pair per segment, each into its own scratch
+    directory. The files are then renamed into one output_pattern sequence.
+    Every segment counts fps slots from start, and a segment's first frame
+    is dropped when it repeats the last frame kept before it (the same slot,
+    or the same frame picked for a timestamp), so the files, their numbering
+    and their timestamps match the sequential path. frame_shape is filled
+    as by write_frames(). Returns the timestamps of the frames written, in order.
+    """
+    first = start or 0
+    if timestamps is not None:
+        timestamps = sorted(set(timestamps))
+        if not timestamps:
+            return []
+        starts, time_base = segment_starts(video_path, jobs, first, timestamps[-1])
+    else:
+        starts, time_base = segment_starts(video_path, jobs, first, end)
+
+    segments = []
+    for index, start_us in enumerate(starts):
+        segment_start = start_us / 1e6
+        segment_end = starts[index + 1] / 1e6 if index + 1 < len(starts) else end
+        picked = None
+        if timestamps is not None:
+            # A timestamp belongs to the segment it falls in, earlier ones to the first;
+            # the frame picked for it may lie beyond
+            picked = [ts for ts in timestamps if (index == 0 or to_microseconds(ts) >= start_us)
+                      and (segment_end is None or to_microseconds(ts) < to_microseconds(segment_end))]
+            if not picked:
+                continue
+            segment_end = None
+        segments.append((start_us, segment_start, segment_end, picked))
+
+    def slot(timestamp, start_us):
+        # Snap back to the exact frame time, as ffmpeg sees it, before counting slots
+        origin = Fraction(start_us, 1_000_000)
+        exact = origin + round((Fraction(timestamp) - origin) / time_base) * time_base
+        return math.floor((exact - Fraction(to_microseconds(first), 1_000_000)) * Fraction(fps) + Fraction(1e-6))
+
+    # Workers keep the working directory they started in, which under serve is the
+    # daemon's and not the client's, so they only get absolute paths
+    video_path = os.path.abspath(video_path)
+    output_pattern = Path(output_pattern).absolute()
+    scratch = [output_pattern.parent / f'.segment-{index:03d}' for index in range(len(segments))]
+    written = []
+    try:
+        workers = max(1, min(jobs, len(segments)))
+        shared = SHARED_POOL is not None and workers <= SHARED_POOL_WORKERS
+        with nullcontext(SHARED_POOL) if shared else ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = []
+            for directory, (_, segment_start, segment_end, picked) in zip(scratch, segments):
+                directory.mkdir(exist_ok=True)
+                futures.append(pool.submit(
+                    extract_segment, video_path, str(directory / output_pattern.name), fps, picked,
+                    segment_start, segment_end, first, size, crop, tuple(encoder_args), TRACE.enabled
+                ))
+            results = [future.result() for future in futures]
+
+        last_slot = None
+        for directory, (start_us, *_), (times, shape, spans) in zip(scratch, segments, results):
+            TRACE.merge(spans)
+            if frame_shape is not None and not frame_shape:
+                frame_shape.extend(shape)
+            for number, timestamp in enumerate(times, start=1):
+                path = directory / (output_pattern.name % number)
+                if timestamps is None and fps and time_base is not None:
+                    current = slot(timestamp, start_us)
+                    repeat = number == 1 and current == last_slot
+                    last_slot = current
+                else:
+                    repeat = number == 1 and bool(written) and timestamp == written[-1]
+                if repeat:
+                    continue
+                written.append(timestamp)
+                os.replace(path, str(output_pattern) % len(written))
+    finally:
+        for directory in scratch:
+            shutil.rmtree(directory, ignore_errors=True)
+    return written
+
+
+def video_digest(db, video_path):
+    """Get the SHA-256 of a video, hashing it again only when the file changed."""
+    key = probe_key(video_path)
+    row = db.execute('SELECT sha256 FROM videos WHERE path = ? AND size = ? AND mtime_ns = ?', key).fetchone()
+    if row:
+        return row[0]
+    digest = file_sha256(video_path)
+    with db:
+        db.execute('INSERT OR REPLACE INTO videos VALUES (?, ?, ?, ?)', (*key, digest))
+    return digest
+
+
+def read_frame_index(video_path):
+    """List the pts of every video frame by demuxing the file, without decoding it.
+
+    Returns (pts, time_base): the sorted pts in ticks of the Fraction
+    time_base, as showinfo reports them when decoding from the start.
+    """
+    result = run_process(
+        ['ffmpeg', '-v', 'error', '-nostdin', '-i', str(video_path), '-map', '0:v:0', '-c', 'copy',
+         '-f', 'framecrc', '-'],
+        capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"ffmpeg could not index the frames of {video_path}: {result.stderr.strip()[-200:]}")
+
+    time_base = None
+    pts = []
+    for line in result.stdout.splitlines():
+        if line.startswith('#tb 0:'):
+            num, den = line.split(':', 1)[1].strip().split('/')
+            time_base = Fraction(int(num), int(den))
+        elif line and not line.startswith('#'):
+            # stream, dts, pts, duration, size, checksum
+            pts.append(int(line.split(',')[2]))
+    if time_base is None:
+        raise RuntimeError(f"{video_path} has no video stream")
+    return sorted(pts), time_base
+
+
+def select_indexed_frames(pts, time_base, fps=None, timestamps=None, start=None, end=None):
+    """Work out the frames iter_frames() would yield, from the frame index alone.
+
+    The seek rounding, end cut and sampling of ffmpeg are replayed in exact
+    arithmetic on the pts of read_frame_index(). Returns (pts, timestamp)
+    pairs, with the timestamps iter_frames() reports for them.
+    """
+    first_us = to_microseconds(start or 0)
+    # ffmpeg moves timestamps back by the seek point, rounded to whole ticks
+    offset = math.floor(Fraction(first_us, 1_000_000) / time_base + Fraction(1, 2)) if first_us > 0 else 0
+    limit = None
+    if end is not None:
+        duration = Fraction(to_microseconds(end) - first_us, 1_000_000)
+        limit = math.floor(duration / time_base + Fraction(1, 2))
+    decoded = [p - offset for p in pts if p >= offset and (limit is None or p - offset < limit)]
+
+    picked = []
+    if timestamps is not None:
+        times = [ticks * time_base for ticks in decoded]
+        for ts in sorted(set(timestamps)):
+            threshold = Fraction(to_microseconds(ts) - first_us, 1_000_000) - Fraction(1, 10_000_000)
+            index = bisect.bisect_left(times, threshold)
+            if index < len(decoded) and (not picked or picked[-1] != decoded[index]):
+                picked.append(decoded[index])
+    elif fps:
+        last_slot = None
+        for ticks in decoded:
+            slot = math.floor(ticks * time_base * Fraction(fps) + Fraction(1e-6))
+            if last_slot is None or slot > last_slot:
+                picked.append(ticks)
+                last_slot = slot
+    else:
+        picked = decoded
+    return [(ticks + offset, frame_time(start, ticks * time_base)) for ticks in picked]
+
+
+def frame_signature(frame, hash_size=PHASH_SIZE):
+    """Reduce a frame to its difference hash (dHash) and the cells it is built from.
+
+    The frame is averaged down to hash_size rows of hash_size + 1 cells with
+    two vectorized reductions; each bit tells whether a cell is brighter than
+    the cell to its right, so the hash ignores noise and overall brightness.
+    Returns (bits, cells): hash_size**2 booleans and the mean value of every
+    cell, per channel for RGB frames.
+    """
+    np = import_numpy()
+    height, width = frame.shape[:2]
+    row_edges = np.linspace(0, height, hash_size + 1).astype(int)
+    col_edges = np.linspace(0, width, hash_size + 2).astype(int)
+    cells = np.add.reduceat(frame, row_edges[:-1], axis=0, dtype=np.float64)
+    cells = np.add.reduceat(cells, col_edges[:-1], axis=1)
+    areas = np.outer(np.maximum(np.diff(row_edges), 1), np.maximum(np.diff(col_edges), 1))
+    cells /= areas if cells.ndim == 2 else areas[:, :, None]
+    brightness = cells if cells.ndim == 2 else cells.sum(axis=2)
+    return (brightness[:, 1:] > brightness[:, :-1]).ravel(), cells
+
+
+def dedup_frames(frames, max_distance=DEFAULT_DEDUP_DISTANCE, dropped=None):
+    """Skip (timestamp, frame) pairs that look the same as the last frame kept.
+
+    Frames whose dHash is at most max_distance bits away from the last kept
+    frame, with no averaged cell changed by more than DEDUP_MAX_CELL_CHANGE,
+    are not yielded, so they are never encoded. Each dropped frame is
+    appended to dropped as (timestamp, index of the kept frame it matches).
+    """
+    np = import_numpy()
+    kept_bits = kept_cells = None
+    kept = -1
+    for timestamp, frame in frames:
+        bits, cells = frame_signature(frame)
+        if (
+            kept_bits is not None
+            and np.count_nonzero(bits != kept_bits) <= max_distance
+            and np.abs(cells - kept_cells).max() <= DEDUP_MAX_CELL_CHANGE
+        ):
+            if dropped is not None:
+                dropped.append((timestamp, kept))
+            continue
+        kept_bits, kept_cells = bits, cells
+        kept += 1
+        yield timestamp, frame
+
+
+def open_frame_store(store_dir):
+    """Open the SQLite index of a frame store, creating it if needed."""
+    os.makedirs(store_dir, exist_ok=True)
+    db = sqlite3.connect(os.path.join(store_dir, 'index.sqlite'), timeout=30)
+    db.executescript(
+        'CREATE TABLE IF NOT EXISTS videos ('
+        'path TEXT PRIMARY KEY, size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL, sha256 TEXT NOT NULL);'
+        'CREATE TABLE IF NOT EXISTS frame_index ('
+        'sha256 TEXT PRIMARY KEY, time_base TEXT NOT NULL, pts TEXT NOT NULL);'
+        'CREATE TABLE IF NOT EXISTS frames ('
+        'sha256 TEXT NOT NULL, variant TEXT NOT NULL, pts INTEGER NOT NULL, file TEXT NOT NULL, '
+        'size INTEGER NOT NULL, last_access REAL NOT NULL, PRIMARY KEY (sha256, variant, pts))'
+    )
+    return db
+
+
+def stored_frames(video_path, store_dir, output_pattern, variant, size=None, crop=None, encoder_args=(),
+                  fps=None, timestamps=None, start=None, end=None, max_size=DEFAULT_FRAME_STORE_SIZE_MB * 1024 * 1024,
+                  jobs=1):
+    """Write the frames write_frames(iter_frames()) would, reusing frames kept by earlier runs.
+
+    The store under store_dir keeps every frame it has written, keyed by the
+    SHA-256 of the video, the variant (a string naming the size, crop,
+    format and quality) and the frame's pts. The frames a request needs are
+    worked out from a frame index of the video (see select_indexed_frames()),
+    only those missing from the store are decoded, and all of them are then
+    linked into output_pattern. Least recently used frames are evicted
+    beyond max_size bytes. Returns (timestamps written, frames reused).
+    """
+    extension = os.path.splitext(output_pattern)[1]
+    with closing(open_frame_store(store_dir)) as db:
+        digest = video_digest(db, video_path)
+        row = db.execute('SELECT time_base, pts FROM frame_index WHERE sha256 = ?', (digest,)).fetchone()
+        if row:
+            time_base, pts = Fraction(row[0]), json.loads(row[1])
+        else:
+            pts, time_base = read_frame_index(video_path)
+            with db:
+                db.execute('INSERT OR REPLACE INTO frame_index VALUES (?, ?, ?)',
+                           (digest, str(time_base), json.dumps(pts)))
+        stored = dict(db.execute(
+            'SELECT pts, file FROM frames WHERE sha256 = ? AND variant = ?', (digest, variant)
+        ).fetchall())
+
+    wanted = select_indexed_frames(pts, time_base, fps, timestamps, start, end)
+    variant_dir = os.path.join(digest[:2], digest, hashlib.sha256(variant.encode()).hexdigest()[:16])
+    os.makedirs(os.path.join(store_dir, variant_dir), exist_ok=True)
+    missing = [
+        ticks for ticks, _ in wanted
+        if ticks not in stored or not os.path.exists(os.path.join(store_dir, stored[ticks]))
+    ]
+
+    # Decode the missing frames in passes that each seek to their first frame
+    runs = []
+    for ticks in missing:
+        if runs and (ticks - runs[-1][-1]) * time_base <= FRAME_STORE_GAP:
+            runs[-1].append(ticks)
+        else:
+            runs.append([ticks])
+    added = []
+    for run in runs:
+        first_us = math.floor(run[0] * time_base * 1_000_000)
+        first = first_us / 1e6
+        offset = math.floor(Fraction(first_us, 1_000_000) / time_base + Fraction(1, 2)) if first_us > 0 else 0
+        # Half a tick before each frame picks exactly that frame
+        targets = [first + float((ticks - offset - Fraction(1, 2)) * time_base) for ticks in run]
+        scratch = tempfile.mkdtemp(prefix='.decode-', dir=os.path.join(store_dir, variant_dir))
+        try:
+            pattern = os.path.join(scratch, f'%06d{extension}')
+            if jobs > 1:
+                times = extract_frames_parallel(video_path, pattern, jobs, timestamps=targets, start=first,
+                                                size=size, crop=crop, encoder_args=encoder_args)
+            else:
+                frames = iter_frames(video_path, size=size, crop=crop, start=first, timestamps=targets)
+                times = write_frames(frames, pattern, encoder_args)
+            for number, timestamp in enumerate(times, start=1):
+                ticks = offset + round((Fraction(timestamp) - Fraction(first_us, 1_000_000)) / time_base)
+                file = os.path.join(variant_dir, f'{ticks}{extension}')
+                os.replace(pattern % number, os.path.join(store_dir, file))
+                stored[ticks] = file
+                size_on_disk = os.path.getsize(os.path.join(store_dir, file))
+                added.append((digest, variant, ticks, file, size_on_disk, time.time()))
+        finally:
+            shutil.rmtree(scratch, ignore_errors=True)
+
+    written = []
+    for ticks, timestamp in wanted:
+        if ticks not in stored or not os.path.exists(os.path.join(store_dir, stored[ticks])):
+            continue
+        written.append(timestamp)
+        link_or_copy(os.path.join(store_dir, stored[ticks]), output_pattern % len(written))
+
+    with closing(open_frame_store(store_dir)) as db, db:
+        db.executemany('INSERT OR REPLACE INTO frames VALUES (?, ?, ?, ?, ?, ?)', added)
+        db.executemany(
+            'UPDATE frames SET last_access = ? WHERE sha256 = ? AND variant = ? AND pts = ?',
+            [(time.time(), digest, variant, ticks) for ticks, _ in wanted]
+        )
+    frame_store_evict(store_dir, max_size)
+    return written, len(wanted) - len(missing)
+
+
+def frame_store_evict(store_dir, max_size):
+    """Delete least recently used frames until the frame store fits in max_size bytes."""
+    with closing(open_frame_store(store_dir)) as db, db:
+        total = db.execute('SELECT COALESCE(SUM(size), 0) FROM frames').fetchone()[0]
+        evicted = 0
+        freed = 0
+        if total > max_size:
+            rows = db.execute('SELECT sha256, variant, pts, file, size FROM frames ORDER BY last_access').fetchall()
+            for digest, variant, ticks, file, size in rows:
+                if total <= max_size:
+                    break
+                db.execute('DELETE FROM frames WHERE sha256 = ? AND variant = ? AND pts = ?', (digest, variant, ticks))
+                discard_partial(os.path.join(store_dir, file))
+                total -= size
+                evicted += 1
+                freed += size
+    return evicted, freed
+
+
+def frame_store_prune(store_dir, max_size):
+    """Evict stored frames down to max_size bytes, after dropping entries whose files are gone."""
+    with closing(open_frame_store(store_dir)) as db, db:
+        rows = db.execute('SELECT sha256, variant, pts, file FROM frames').fetchall()
+        gone = [
+            (digest, variant, ticks) for digest, variant, ticks, file in rows
+            if not os.path.exists(os.path.join(store_dir, file))
+        ]
+        db.executemany('DELETE FROM frames WHERE sha256 = ? AND variant = ? AND pts = ?', gone)
+        # Forget videos that have no stored frames left
+        db.execute('DELETE FROM videos WHERE sha256 NOT IN (SELECT sha256 FROM frames)')
+        db.execute('DELETE FROM frame_index WHERE sha256 NOT IN (SELECT sha256 FROM frames)')
+
+    evicted, freed = frame_store_evict(store_dir, max_size)
+    return evicted + len(gone), freed
+
+
+def write_contact_sheets(video_path, output_pattern, grid, fps=None, timestamps=None, start=None, end=None,
+                         area=None, tile_width=DEFAULT_TILE_WIDTH, label_offset=0, encoder_args=(), source=None):
+    """Tile the sampled frames of a video into contact sheets in one ffmpeg decode pass.
+
+    Frames are picked as in iter_frames(), cropped to area (LEFT,TOP,WIDTH,HEIGHT
+    fractions), scaled to tile_width and laid out cols x rows per sheet by the
+    tile filter; output_pattern is an image2 pattern such as 'sheet_%03d.jpg'.
+    Each tile is labelled with its source time (file time plus label_offset)
+    when ffmpeg has the drawtext filter. Returns the file times of the tiles,
+    in order; the last sheet may be partly empty. source is decoded instead
+    of video_path, as in iter_frames().
+    """
+    cols, rows = grid
+    first = to_microseconds(start or 0) / 1e6
+    seek = 0.0 if source else first
+    filters = [start_filter(first)] if seek < first else []
+    if end is not None:
+        filters.append(end_filter(seek, end))
+    if timestamps is not None:
+        filters.append(sampling_filter(timestamps=[ts - seek for ts in sorted(set(timestamps))]))
+    elif fps:
+        filters.append(sampling_filter(fps, fps_origin=seek - first))
+    if area:
+        filters.append(crop_filter(area))
+    filters += [f'scale={tile_width}:-2', 'showinfo']
+    if has_ffmpeg_filter('drawtext'):
+        filters.append(
+            f"drawtext=text='%{{pts\\:hms\\:{seek + label_offset:.6f}}}':x=4:y=h-th-4"
+            f":fontsize={max(12, tile_width // 20)}:fontcolor=white:box=1:boxcolor=black@0.6:boxborderw=3"
+        )
+    else:
+        status('warning', "ffmpeg has no drawtext filter; tile timestamps are only listed in manifest.json")
+    filters.append(f'tile={cols}x{rows}:padding={TILE_PADDING}:margin={TILE_PADDING}')
+
+    cmd = ['ffmpeg', '-hide_banner', '-nostdin', '-nostats', *seek_args(seek, end)]
+    cmd += ['-i', 'pipe:0' if source else str(video_path), '-vf', ','.join(filters), '-vsync', 'vfr',
+            *encoder_args, '-y', output_pattern]
+
+    result = run_process(cmd, capture_output=True, text=True, stdin=source)
+    if result.returncode != 0:
+        raise RuntimeError(f"ffmpeg could not build contact sheets: {result.stderr.strip().splitlines()[-1:]}")
+    return [frame_time(seek, pts_time) for pts_time in parse_showinfo_times(result.stderr)]
+
+
+def write_frame_archive(files, timestamps, archive_path, image_format, frame_shape=None):
+    """Pack frame files into one archive (see FRAME_ARCHIVE_HEADER), removing each file once it is copied.
+
+    files are the records in order and timestamps their source times.
+    frame_shape is the (height, width[, channels]) shape of the decoded
+    frames, which raw records need to be read back. The archive is written
+    under a temporary name and renamed into place when complete.
+    """
+    height, width, *channels = frame_shape or (0, 0)
+    channels = channels[0] if channels else (1 if frame_shape else 0)
+    partial = f'{archive_path}.tmp'
+    with open(partial, 'wb') as archive:
+        archive.write(bytes(FRAME_ARCHIVE_HEADER.size))
+        offsets = [archive.tell()]
+        for path in files:
+            with open(path, 'rb') as record:
+                shutil.copyfileobj(record, archive)
+            os.remove(path)
+            offsets.append(archive.tell())
+        # Align the tables so a reader can use them in place
+        archive.write(bytes(-archive.tell() % 8))
+        index_offset = archive.tell()
+        archive.write(struct.pack(f'<{len(offsets)}Q', *offsets))
+        archive.write(struct.pack(f'<{len(timestamps)}d', *timestamps))
+        archive.seek(0)
+        archive.write(FRAME_ARCHIVE_HEADER.pack(
+            FRAME_ARCHIVE_MAGIC, image_format.encode(), width, height, channels, 0, len(timestamps), index_offset
+        ))
+    os.replace(partial, archive_path)
+
+
+class FrameArchive:
+    """Random access to a packed frame archive (see write_frame_archive()) through a memory map.
+
+    archive[n] is the record of frame n, counted from 0, as a memoryview of
+    the mapped file: the encoded image, or the pixels of a raw archive.
+    Nothing is read until a record is used, so looking up a frame by number
+    costs the same in an archive of ten frames or of a million. find()
+    gives the number of the frame shown at a source time, frame() a NumPy
+    array of a raw record. Copy records (bytes(record)) to keep them after
+    close().
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            magic, image_format, self.width, self.height, self.channels, _, count, index_offset = (
+                FRAME_ARCHIVE_HEADER.unpack_from(self._map)
+            )
+        except struct.error:
+            magic = None
+        if magic != FRAME_ARCHIVE_MAGIC:
+            self._map.close()
+            raise ValueError(f"not a frame archive: {path}")
+        self.format = image_format.rstrip(b'\0').decode()
+
+        self._view = memoryview(self._map)
+        offsets = self._view[index_offset:index_offset + 8 * (count + 1)]
+        timestamps = self._view[index_offset + 8 * (count + 1):index_offset + 8 * (2 * count + 1)]
+        if sys.byteorder == 'little':
+            self._offsets, self.timestamps = offsets.cast('Q'), timestamps.cast('d')
+        else:
+            self._offsets = struct.unpack(f'<{count + 1}Q', offsets)
+            self.timestamps = struct.unpack(f'<{count}d', timestamps)
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def __getitem__(self, number):
+        number = range(len(self))[number]
+        return self._view[self._offsets[number]:self._offsets[number + 1]]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def find(self, timestamp):
+        """Number of the frame shown at a source time: the last one at or before it, else the first."""
+        if not len(self):
+            raise IndexError('the frame archive is empty')
+        return max(0, bisect.bisect_right(self.timestamps, timestamp + 1e-6) - 1)
+
+    def frame(self, number):
+        """The pixels of frame number as a read-only (height, width[, channels]) uint8 array."""
+        if self.format != 'raw':
+            raise ValueError(f"frames in {os.path.basename(self.path)} are {self.format} images, not raw pixels")
+        np = import_numpy()
+        shape = (self.height, self.width) if self.channels == 1 else (self.height, self.width, self.channels)
+        return np.frombuffer(self[number], dtype=np.uint8).reshape(shape)
+
+    def close(self):
+        for view in (self._offsets, self.timestamps, self._view):
+            if isinstance(view, memoryview):
+                view.release()
+        try:
+            self._map.close()
+        except BufferError:
+            # Records are still in use; the map closes once they are gone
+            pass
+
+
+def export_frames(archive_path, output_dir, numbers=None, start=None, end=None, image_format=None, quality=None,
+                  frame_name='frame-{:04d}'):
+    """Write frames of a packed archive back out as numbered image files with a manifest.json.
+
+    numbers picks frames by number, counted from 1 like the frame files,
+    and start/end by source time; by default every frame is exported.
+    Encoded records are written as they are; raw records are encoded as
+    image_format (default png) unless image_format is 'raw'. Each file is
+    named after its frame number with frame_name, a format string such as
+    'frame-{:04d}'. Returns the paths written.
+    """
+    with FrameArchive(archive_path) as archive:
+        if image_format not in (None, archive.format) and archive.format != 'raw':
+            raise ValueError(f"frames in {os.path.basename(archive_path)} are stored as {archive.format}; "
+                             f"only raw archives can be exported in another format")
+        image_format = image_format or ('png' if archive.format == 'raw' else archive.format)
+        selected = [
+            n for n in (range(1, len(archive) + 1) if numbers is None else sorted(set(numbers)))
+            if 1 <= n <= len(archive)
+            and (start is None or archive.timestamps[n - 1] >= start - 1e-6)
+            and (end is None or archive.timestamps[n - 1] < end - 1e-6)
+        ]
+        os.makedirs(output_dir, exist_ok=True)
+        paths = [os.path.join(output_dir, f"{frame_name.format(n)}.{image_format}") for n in selected]
+
+        if image_format == archive.format:
+            for n, path in zip(selected, paths):
+                with open(path, 'wb') as f:
+                    f.write(archive[n - 1])
+        elif selected:
+            # One encoder for all frames, numbered in order, then renamed after their frame
+            pattern = os.path.join(output_dir, f'.export-%06d.{image_format}')
+            write_frames(((archive.timestamps[n - 1], archive.frame(n - 1)) for n in selected),
+                         pattern, image_encoder_args(image_format, quality))
+            for index, path in enumerate(paths, start=1):
+                os.replace(pattern % index, path)
+
+        manifest = {
+            'archive': str(archive_path),
+            'frames': [
+                {'file': os.path.basename(path), 'frame': n, 'timestamp': archive.timestamps[n - 1]}
+                for n, path in zip(selected, paths)
+            ],
+        }
+        if image_format == 'raw':
+            manifest['pix_fmt'] = 'gray' if archive.channels == 1 else 'rgb24'
+            manifest['width'], manifest['height'] = archive.width, archive.height
+    with open(os.path.join(output_dir, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    return paths
+
+
+def decode_frames(video_path, output_pattern, scale=None, crop=None, image_format='png', quality=None, jobs=1,
+                  frame_store=None, frame_store_size_mb=DEFAULT_FRAME_STORE_SIZE_MB, dedup=None, dropped=None,
+                  frame_shape=None, source=None, **sampling):
+    """Write the frames iter_frames(**sampling) picks as output_pattern images, the fastest way the options allow.
+
+    frame_store reuses frames kept by earlier runs and decodes only the rest
+    (see stored_frames()); otherwise jobs > 1 decodes that many
+    keyframe-aligned segments at once (see extract_frames_parallel()), and
+    anything else takes one decoder. dedup=D drops frames within D hash bits
+    of the last frame kept, appending them to dropped (see dedup_frames()).
+    dedup, raw frames and source (a pipe of the video's bytes, see
+    iter_frames()) rule out the frame store, and dedup and source rule out
+    jobs. frame_shape receives the shape of the decoded frames (see
+    write_frames()). Returns (file times of the frames written, the number
+    reused from the frame store or None when it was not used).
+    """
+    encoder_args = image_encoder_args(image_format, quality)
+    if frame_store and dedup is None and image_format != 'raw' and not source:
+        variant = json.dumps({'format': image_format, 'quality': quality, 'scale': scale, 'crop': crop})
+        return stored_frames(video_path, frame_store, output_pattern, variant, scale, crop, encoder_args,
+                             max_size=frame_store_size_mb * 1024 * 1024, jobs=jobs, **sampling)
+    if jobs > 1 and dedup is None and not source:
+        times = extract_frames_parallel(video_path, output_pattern, jobs, size=scale, crop=crop,
+                                        encoder_args=encoder_args, frame_shape=frame_shape, **sampling)
+        return times, None
+    frames = iter_frames(video_path, size=scale, crop=crop, source=source, **sampling)
+    if dedup is not None:
+        frames = dedup_frames(frames, dedup, dropped)
+    return write_frames(frames, output_pattern, encoder_args, frame_shape), None
+
+
+def describe_frames(manifest, image_format, frame_shape, phases=None, offset=0):
+    """Add to a frame manifest how to read .raw frames and, for smart sampling, the phases (in source time)."""
+    if image_format == 'raw' and frame_shape:
+        # What a reader needs to turn a .raw file back into an image
+        manifest['pix_fmt'] = 'rgb24'
+        manifest['width'], manifest['height'] = frame_shape[1], frame_shape[0]
+    if phases is not None:
+        manifest['sampling'] = 'smart'
+        manifest['phases'] = [
+            {'kind': phase['kind'], 'start': round(offset + phase['start'], 6), 'end': round(offset + phase['end'], 6)}
+            for phase in phases
+        ]
+
+
+def motion_energy(frames, grid=(1, 1), area=None, batch_size=MOTION_BATCH_SIZE):
+    """Measure how much the picture changes between consecutive frames.
+
+    frames are (timestamp, frame) pairs from iter_frames(). Frames are copied
+    into a batch array and differenced with one NumPy operation per batch.
+    Returns (timestamps, energy, region_energy), where energy[i] is the mean
+    absolute difference between frame i and frame i - 1 (0 for the first
+    frame) and region_energy[i] holds the same per cell of a rows x cols grid.
+    area=(left, top, width, height) fractions restricts the measurement.
+    """
+    np = import_numpy()
+    rows, cols = grid
+    timestamps, energy, region_energy = [], [], []
+    batch = None
+    count = 0
+
+    def flush():
+        diffs = np.abs(np.diff(batch[:count], axis=0))
+        height = diffs.shape[1] - diffs.shape[1] % rows
+        width = diffs.shape[2] - diffs.shape[2] % cols
+        cells = diffs[:, :height, :width].reshape(len(diffs), rows, height // rows, cols, width // cols)
+        energy.extend(diffs.mean(axis=(1, 2)).tolist())
+        region_energy.extend(cells.mean(axis=(2, 4)).tolist())
+
+    for timestamp, frame in frames:
+        if area:
+            left, top, width, height = area
+            frame_height, frame_width = frame.shape[:2]
+            frame = frame[
+                int(top * frame_height):int((top + height) * frame_height),
+                int(left * frame_width):int((left + width) * frame_width)
+            ]
+        if batch is None:
+            if frame.shape[0] < rows or frame.shape[1] < cols:
+                raise ValueError(f"a {rows}x{cols} grid needs at least {rows}x{cols} pixels to analyze")
+            batch = np.empty((batch_size + 1, *frame.shape), dtype=np.int16)
+            energy.append(0.0)
+            region_energy.append([[0.0] * cols for _ in range(rows)])
+
+        batch[count] = frame
+        count += 1
+        timestamps.append(timestamp)
+        if count == batch_size + 1:
+            flush()
+            # The last frame is the reference for the next batch
+            batch[0] = batch[count - 1]
+            count = 1
+
+    if count > 1:
+        flush()
+
+    return timestamps, energy, region_energy
+
+
+def noise_threshold(values):
+    """Pick the motion threshold of a motion-energy curve from the noise of its quietest frames."""
+    np = import_numpy()
+    if not len(values):
+        return MIN_MOTION_ENERGY
+    quiet = values[values <= np.percentile(values, QUIET_PERCENTILE)]
+    floor = float(np.median(quiet))
+    # 1.4826 scales the median absolute deviation to a standard deviation
+    spread = 1.4826 * float(np.median(np.abs(quiet - floor)))
+    return floor + max(MIN_MOTION_ENERGY, MOTION_NOISE_SIGMAS * spread)
+
+
+def segment_motion(timestamps, energy, threshold=None, min_hold=DEFAULT_MIN_HOLD, min_motion=DEFAULT_MIN_MOTION):
+    """Split a motion-energy curve into alternating hold and motion phases.
+
+    Frames whose energy is above threshold are moving; by default the
+    threshold sits just above the noise of the quietest frames, which scene
+    cuts and other spikes cannot move. Holds shorter than min_hold seconds
+    between two motion phases are merged into them, then motion shorter than
+    min_motion seconds is treated as noise unless it holds a scene cut.
+    Returns (threshold, phases); each phase is a dict with its kind, first
+    and last frame index, start and end timestamps, peak energy and the
+    timestamps of the scene cuts in it.
+    """
+    np = import_numpy()
+    values = np.asarray(energy, dtype=np.float64)
+    if threshold is None:
+        threshold = noise_threshold(values[1:])
+    cut = values > max(SCENE_CUT_ENERGY, threshold)
+
+    # Runs of consecutive moving or still frames, as [moving, first, last];
+    # the first frame has nothing to compare with and joins the run after it
+    moving = values > threshold
+    if len(moving) > 1:
+        moving[0] = moving[1]
+    bounds = np.flatnonzero(np.diff(moving.astype(np.int8))) + 1
+    runs = [
+        [bool(moving[first]), int(first), int(last) - 1]
+        for first, last in zip([0, *bounds], [*bounds, len(values)])
+    ]
+
+    def duration(run):
+        # Energy i compares frame i - 1 with frame i
+        return timestamps[run[2]] - timestamps[max(run[1] - 1, 0)]
+
+    def merge(runs):
+        merged = []
+        for run in runs:
+            if merged and merged[-1][0] == run[0]:
+                merged[-1][2] = run[2]
+            else:
+                merged.append(run)
+        return merged
+
+    for i in range(1, len(runs) - 1):
+        if not runs[i][0] and duration(runs[i]) < min_hold:
+            runs[i][0] = True
+    runs = merge(runs)
+    for run in runs:
+        if run[0] and duration(run) < min_motion and not cut[run[1]:run[2] + 1].any():
+            run[0] = False
+    runs = merge(runs)
+
+    phases = [
+        {
+            'kind': 'motion' if is_moving else 'hold',
+            'first_frame': first,
+            'last_frame': last,
+            'start': timestamps[max(first - 1, 0)],
+            'end': timestamps[last],
+            'peak_energy': round(float(values[first:last + 1].max()), 3),
+            'cuts': [timestamps[i] for i in range(first, last + 1) if cut[i]],
+        }
+        for is_moving, first, last in runs
+    ]
+    return float(threshold), phases
+
+
+def build_timing(phases, start, end, target_fps=DEFAULT_TARGET_FPS):
+    """Turn motion phases into a Remotion TIMING table in frames at target_fps, counted from start."""
+    timing = {}
+    for number, phase in enumerate((p for p in phases if p['kind'] == 'motion'), start=1):
+        timing[f'PHASE_{number}_START'] = round((phase['start'] - start) * target_fps)
+        timing[f'PHASE_{number}_END'] = round((phase['end'] - start) * target_fps)
+    timing['HOLD_END'] = round((end - start) * target_fps)
+    return timing
+
+
+def format_timing(timing, comment):
+    """Format a TIMING table as a TypeScript constant."""
+    lines = [f"// {comment}", "const TIMING = {"]
+    lines += [f"  {name}: {value}," for name, value in timing.items()]
+    lines.append("};")
+    return '\n'.join(lines)
+
+
+def analyze_motion(video_path, start=None, end=None, target_fps=DEFAULT_TARGET_FPS, width=DEFAULT_ANALYSIS_WIDTH,
+                   grid=(1, 1), area=None, threshold=None, min_hold=DEFAULT_MIN_HOLD, min_motion=DEFAULT_MIN_MOTION):
+    """Find the motion and hold phases of a video and the matching Remotion TIMING table.
+
+    Decodes every source frame as a small grayscale image, so the result
+    is exact to the source frame. Returns a JSON-serializable report.
+    """
+    np = import_numpy()
+    frames = iter_frames(video_path, size=(width, -1), pix_fmt='gray', start=start, end=end)
+    timestamps, energy, region_energy = motion_energy(frames, grid, area)
+    if len(timestamps) < 2:
+        raise ValueError(f"need at least two frames to analyze motion, got {len(timestamps)}")
+
+    used_threshold, phases = segment_motion(timestamps, energy, threshold, min_hold, min_motion)
+
+    # The window ends one source frame after the last decoded frame starts
+    frame_duration = float(np.median(np.diff(timestamps)))
+    window_start = timestamps[0] if start is None else start
+    window_end = timestamps[-1] + frame_duration
+
+    cells = np.asarray(region_energy)
+    for phase in phases:
+        phase['start_frame'] = round((phase['start'] - window_start) * target_fps)
+        phase['end_frame'] = round((phase['end'] - window_start) * target_fps)
+        if grid != (1, 1):
+            # Mean change per grid cell shows where on screen the phase happens
+            phase['regions'] = np.round(cells[phase['first_frame']:phase['last_frame'] + 1].mean(axis=0), 3).tolist()
+
+    return {
+        'video': str(video_path),
+        'start': round(window_start, 6),
+        'end': round(window_end, 6),
+        'source_fps': round(1 / frame_duration, 3) if frame_duration else None,
+        'target_fps': target_fps,
+        'frames_analyzed': len(timestamps),
+        'threshold': round(used_threshold, 3),
+        'phases': phases,
+        'timing': build_timing(phases, window_start, window_end, target_fps),
+    }
+
+
+def window_sums(values, size):
+    """Sum a 2-D array over size x size windows that overlap by half, as ffmpeg's ssim filter places them.
+
+    Each window adds up four (size / 2)-pixel blocks, so every pixel is
+    summed once per block rather than once per window. The blocks are summed
+    from strided slices, which NumPy adds far faster than it reduces a
+    reshaped axis.
+    """
+    half = size // 2
+    height = values.shape[0] - values.shape[0] % half
+    width = values.shape[1] - values.shape[1] % half
+    values = values[:height, :width]
+    columns = sum(values[:, i::half] for i in range(half))
+    blocks = sum(columns[i::half] for i in range(half))
+    return blocks[:-1, :-1] + blocks[1:, :-1] + blocks[:-1, 1:] + blocks[1:, 1:]
+
+
+def frame_scores(reference, render, area=None):
+    """Score an RGB frame against the reference frame of the same shape.
+
+    Returns (psnr, ssim, diff, area_diff): the PSNR over all channels in dB
+    (MAX_PSNR for identical frames), the mean SSIM of the luma over
+    SSIM_WINDOW-pixel windows, and the mean absolute difference (0-255)
+    over the frame and inside area=(left, top, width, height) fractions
+    (None without one).
+    """
+    np = import_numpy()
+    a = reference.astype(np.float32)
+    b = render.astype(np.float32)
+    delta = np.abs(a - b)
+    mse = float(np.vdot(delta, delta)) / delta.size
+    psnr = MAX_PSNR if mse == 0 else min(MAX_PSNR, 10 * math.log10(255 ** 2 / mse))
+
+    area_diff = None
+    if area:
+        left, top, width, height = area
+        frame_height, frame_width = delta.shape[:2]
+        # At least one pixel, however small the frames are scaled
+        y0, x0 = int(top * frame_height), int(left * frame_width)
+        y1 = max(int((top + height) * frame_height), y0 + 1)
+        x1 = max(int((left + width) * frame_width), x0 + 1)
+        area_diff = float(delta[y0:y1, x0:x1].mean(dtype=np.float64))
+
+    luma = np.array([0.299, 0.587, 0.114], dtype=np.float32)
+    x, y = a @ luma, b @ luma
+    count = SSIM_WINDOW * SSIM_WINDOW
+    mean_x, mean_y = window_sums(x, SSIM_WINDOW) / count, window_sums(y, SSIM_WINDOW) / count
+    var_x = window_sums(x * x, SSIM_WINDOW) / count - mean_x * mean_x
+    var_y = window_sums(y * y, SSIM_WINDOW) / count - mean_y * mean_y
+    covariance = window_sums(x * y, SSIM_WINDOW) / count - mean_x * mean_y
+    c1, c2 = (0.01 * 255) ** 2, (0.03 * 255) ** 2
+    ssim = ((2 * mean_x * mean_y + c1) * (2 * covariance + c2)
+            / ((mean_x * mean_x + mean_y * mean_y + c1) * (var_x + var_y + c2)))
+
+    return psnr, float(ssim.mean(dtype=np.float64)), float(delta.mean(dtype=np.float64)), area_diff
+
+
+def compare_videos(reference, render, output_dir, offset=0.0, ratio=1.0, fps=None, width=DEFAULT_COMPARE_WIDTH,
+                   area=None, worst=DEFAULT_WORST_FRAMES):
+    """Score every frame of a render against the reference frame at the same time.
+
+    Both videos are decoded at once through ffmpeg rawvideo pipes, the
+    reference at the size of the render frames (width pixels wide, or the
+    render's own size for None). Render time t is matched with the reference
+    frame nearest to offset + ratio * t, so ratio 0.5 suits a render that
+    plays the animation at half speed, and the two frame rates may differ.
+    fps samples the render (default: every frame).
+
+    The scores of every frame are streamed to output_dir/scores.csv, and
+    the worst frames (lowest SSIM, or largest difference inside area) are
+    saved as reference | render | difference images worst-NN.png. Only the
+    current frames and the worst ones are held in memory. Returns a
+    JSON-serializable report.
+    """
+    np = import_numpy()
+    os.makedirs(output_dir, exist_ok=True)
+    for name in os.listdir(output_dir):
+        if name.startswith('worst-') and name.endswith('.png'):
+            os.remove(os.path.join(output_dir, name))
+
+    # Render frames before the reference starts have nothing to be compared with
+    render_start = max(0.0, -offset / ratio)
+    renders = iter_frames(render, fps=fps, size=(width, -2) if width else None, start=render_start or None)
+    references = None
+    held = held_time = upcoming = size = None
+    step = 0.0
+    ranked = []
+    totals = {'psnr': [], 'ssim': [], 'diff': [], 'area_diff': []}
+    scores_path = os.path.join(output_dir, 'scores.csv')
+
+    try:
+        with open(scores_path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['frame', 'render_time', 'reference_time', 'psnr', 'ssim', 'diff', 'area_diff'])
+            for number, (render_time, frame) in enumerate(renders, start=1):
+                target = offset + ratio * render_time
+                if references is None:
+                    size = [frame.shape[1], frame.shape[0]]
+                    references = iter_frames(reference, size=tuple(size), start=target or None)
+                    upcoming = next(references, None)
+                    if upcoming is None:
+                        break
+                    held_time, held = upcoming[0], upcoming[1].copy()
+                    upcoming = next(references, None)
+                # Keep the last reference frame at or before the target time
+                while upcoming is not None and upcoming[0] <= target + 1e-6:
+                    step = upcoming[0] - held_time
+                    held_time = upcoming[0]
+                    np.copyto(held, upcoming[1])
+                    upcoming = next(references, None)
+                if upcoming is None and target > held_time + step + 1e-6:
+                    # The reference ended
+                    break
+                # and compare with whichever of it and the next one is nearer in time
+                matched_time, matched = held_time, held
+                if upcoming is not None and upcoming[0] - target < target - held_time:
+                    matched_time, matched = upcoming
+
+                psnr, ssim, diff, area_diff = frame_scores(matched, frame, area)
+                writer.writerow([number, f'{render_time:.6f}', f'{matched_time:.6f}', f'{psnr:.3f}', f'{ssim:.5f}',
+                                 f'{diff:.3f}', '' if area_diff is None else f'{area_diff:.3f}'])
+                for key, value in (('psnr', psnr), ('ssim', ssim), ('diff', diff), ('area_diff', area_diff)):
+                    if value is not None:
+                        totals[key].append(value)
+
+                badness = area_diff if area else 1 - ssim
+                if worst and (len(ranked) < worst or badness > ranked[0][0]):
+                    entry = (badness, number, {
+                        'frame': number, 'render_time': round(render_time, 6), 'reference_time': round(matched_time, 6),
+                        'psnr': round(psnr, 3), 'ssim': round(ssim, 5), 'diff': round(diff, 3),
+                        'area_diff': None if area_diff is None else round(area_diff, 3),
+                    }, matched.copy(), frame.copy())
+                    if len(ranked) < worst:
+                        heapq.heappush(ranked, entry)
+                    else:
+                        heapq.heapreplace(ranked, entry)
+    finally:
+        renders.close()
+        if references is not None:
+            references.close()
+
+    if not totals['ssim']:
+        raise ValueError("no frames to compare: check that --offset lies inside the reference")
+
+    ranked.sort(key=lambda entry: (-entry[0], entry[1]))
+    images = []
+    for entry in ranked:
+        _, _, scores, reference_frame, render_frame = entry
+        difference = np.abs(reference_frame.astype(np.int16) - render_frame) * DIFF_GAIN
+        images.append((scores['render_time'], np.concatenate(
+            [reference_frame, render_frame, np.minimum(difference, 255).astype(np.uint8)], axis=1)))
+    write_frames(images, os.path.join(output_dir, 'worst-%02d.png'), image_encoder_args('png'))
+    for rank, entry in enumerate(ranked, start=1):
+        entry[2]['image'] = os.path.join(output_dir, f'worst-{rank:02d}.png')
+
+    def summary(values):
+        return {'mean': round(sum(values) / len(values), 5), 'min': round(min(values), 5),
+                'max': round(max(values), 5)} if values else None
+
+    return {
+        'reference': str(reference),
+        'render': str(render),
+        'offset': offset,
+        'ratio': ratio,
+        'fps': fps,
+        'size': size,
+        'area': area,
+        'frames': len(totals['ssim']),
+        'psnr': summary(totals['psnr']),
+        'ssim': summary(totals['ssim']),
+        'diff': summary(totals['diff']),
+        'area_diff': summary(totals['area_diff']),
+        'scores': scores_path,
+        'worst': [entry[2] for entry in ranked],
+    }
+
+
+def keyframe_index(video_path, start=None, end=None):
+    """List the keyframe timestamps of a video, decoding only its keyframes.
+
+    Returns (timestamps, time_base), time_base being the Fraction of a second
+    the video stream counts its timestamps in, or None when ffmpeg does not
+    report it.
+    """
+    filters = f'{end_filter(start, end)},showinfo' if end is not None else 'showinfo'
+    cmd = ['ffmpeg', '-hide_banner', '-nostdin', '-nostats', '-skip_frame', 'nokey', *seek_args(start, end)]
+    cmd += ['-i', str(video_path), '-vf', filters, '-f', 'null', '-']
+
+    result = run_process(cmd, capture_output=True, text=True)
+    if result.returncode != 0:
+        errors = result.stderr.strip().splitlines()[-1:]
+        raise RuntimeError(f"ffmpeg could not read keyframes of {video_path}: {errors}")
+
+    times = []
+    time_base = None
+    for line in result.stderr.splitlines():
+        time_base, pts_time = parse_showinfo_line(line, time_base)
+        if pts_time is not None:
+            times.append(frame_time(start, pts_time))
+    return times, time_base
+
+
+def keyframe_times(video_path, start=None, end=None):
+    """List the keyframe timestamps of a video, decoding only its keyframes."""
+    return keyframe_index(video_path, start, end)[0]
+
+
+def smart_timestamps(video_path, budget, start=None, end=None):
+    """Pick at most budget timestamps where the picture changes, plus one per hold.
+
+    Each hold gets a single frame, since all of its frames look the same. That
+    frame is a keyframe inside the hold when there is one, so it decodes
+    without seeking back. Each transition gets at least one frame, so does the
+    first frame after each scene cut, and the rest of the budget goes to
+    transitions in proportion to how much the picture changes, cuts aside.
+    Frames are placed at equal steps of accumulated change, so fast changes
+    get more frames than slow ones. When the budget is too small to cover
+    every phase and cut, each still gets its frame.
+    Returns (timestamps, phases), in seconds from the start of the file.
+    """
+    np = import_numpy()
+    frames = iter_frames(video_path, size=(DEFAULT_ANALYSIS_WIDTH, -1), pix_fmt='gray', start=start, end=end)
+    times, energy, _ = motion_energy(frames)
+    if not times:
+        return [], []
+    if len(times) < 2:
+        return times, []
+
+    threshold, phases = segment_motion(times, energy)
+    keyframes = keyframe_times(video_path, start, end)
+    cuts = [cut for phase in phases for cut in phase['cuts']]
+    # A cut's one-frame jump would otherwise draw the frames of its whole transition
+    values = np.asarray(energy)
+    values = np.where(values > max(SCENE_CUT_ENERGY, threshold), 0.0, values)
+    motions = [phase for phase in phases if phase['kind'] == 'motion']
+
+    # Split the frames left after one per phase and cut by each transition's total change
+    change = np.array([values[p['first_frame']:p['last_frame'] + 1].sum() for p in motions])
+    extra = max(0, budget - len(phases) - len(cuts))
+    shares = extra * change / change.sum() if len(motions) and change.sum() > 0 else np.zeros(len(motions))
+    counts = 1 + np.floor(shares).astype(int)
+    for i in np.argsort(np.floor(shares) - shares)[:extra - int(np.floor(shares).sum())]:
+        counts[i] += 1
+
+    picked = set(cuts)
+    for phase in phases:
+        if phase['kind'] == 'hold':
+            middle = (phase['start'] + phase['end']) / 2
+            inside = [k for k in keyframes if phase['start'] <= k <= phase['end']]
+            candidates = inside or times[max(phase['first_frame'] - 1, 0):phase['last_frame'] + 1]
+            picked.add(min(candidates, key=lambda t: abs(t - middle)))
+        else:
+            count = counts[motions.index(phase)]
+            first, last = phase['first_frame'], phase['last_frame']
+            cumulative = np.cumsum(values[first:last + 1])
+            for i in range(count):
+                step = np.searchsorted(cumulative, (i + 0.5) / count * cumulative[-1])
+                picked.add(times[first + min(int(step), last - first)])
+
+    return sorted(picked), phases
+
+
+def open_library_index(index_path):
+    """Open the SQLite index of scanned video files, creating it if needed."""
+    os.makedirs(os.path.dirname(os.path.abspath(index_path)), exist_ok=True)
+    db = sqlite3.connect(index_path, timeout=30)
+    db.executescript(
+        'CREATE TABLE IF NOT EXISTS videos ('
+        'path TEXT PRIMARY KEY, size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL, sha256 TEXT, '
+        'duration REAL, width INTEGER, height INTEGER, codec TEXT, fps REAL, error TEXT, scanned REAL NOT NULL);'
+        'CREATE INDEX IF NOT EXISTS videos_sha256 ON videos (sha256)'
+    )
+    return db
+
+
+def find_videos(root):
+    """List the video files under root, recursively, as sorted (path, size, mtime_ns).
+
+    Hidden files and directories are skipped; symbolic links to files are
+    followed, links to directories are not.
+    """
+    found = []
+    for dirpath, dirnames, filenames in os.walk(os.path.abspath(root)):
+        dirnames[:] = [name for name in dirnames if not name.startswith('.')]
+        for name in filenames:
+            if name.startswith('.') or os.path.splitext(name)[1].lower() not in SUPPORTED_FORMATS:
+                continue
+            path = os.path.join(dirpath, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                # Deleted since the directory was listed, or a dangling link
+                continue
+            found.append((path, stat.st_size, stat.st_mtime_ns))
+    return sorted(found)
+
+
+def query_library(index_path, root=None, filters=()):
+    """Get the index rows under root (default: all) that match every (column, operator, value) filter, as dicts.
+
+    filters come from parse_library_filter(), so only known columns and
+    operators reach the SQL and every value is a bound parameter. The index
+    is opened read-only; a missing or damaged one raises sqlite3.Error.
+    """
+    sql = f"SELECT {', '.join(LIBRARY_COLUMNS)} FROM videos WHERE 1"
+    params = []
+    if root is not None:
+        prefix = os.path.join(os.path.abspath(root), '')
+        sql += ' AND substr(path, 1, ?) = ?'
+        params += [len(prefix), prefix]
+    for column, operator, value in filters:
+        if column not in LIBRARY_COLUMNS or operator not in LIBRARY_OPERATORS:
+            raise ValueError(f"invalid filter: {column} {operator}")
+        if operator == '~':
+            sql += f" AND {column} LIKE ? ESCAPE '\\'"
+            value = '%' + re.sub(r'([%_\\])', r'\\\1', str(value)) + '%'
+        else:
+            sql += f' AND {column} {operator} ?'
+        params.append(value)
+    with closing(sqlite3.connect(f'{Path(os.path.abspath(index_path)).as_uri()}?mode=ro', uri=True)) as db:
+        cursor = db.execute(sql + ' ORDER BY path', params)
+        return [dict(zip(LIBRARY_COLUMNS, row)) for row in cursor]
+
+
+def scan_video(path, refresh=False):
+    """Probe and hash one file for the library index (runs in a worker process).
+
+    Returns (sha256, duration, width, height, codec, fps, error); error is
+    None unless the file could not be read or probed.
+    """
+    try:
+        info = summarize_probe(probe_video(path, refresh))
+        digest = file_sha256(path)
+    except ProbeError:
+        return None, None, None, None, None, None, 'ffprobe could not read the file'
+    except subprocess.TimeoutExpired:
+        return None, None, None, None, None, None, 'ffprobe timed out'
+    except (OSError, json.JSONDecodeError) as e:
+        return None, None, None, None, None, None, str(e)
+
+    if 'width' not in info:
+        return digest, None, None, None, None, None, 'no video stream'
+    return (digest, info.get('duration') or None, info['width'], info['height'], info['video_codec'],
+            parse_frame_rate(info['frame_rate']), None)
+
+
+def scan_library(root, index_path=DEFAULT_LIBRARY_INDEX, jobs=None, rescan=False, show_progress=True):
+    """Probe and hash every video file under root into the SQLite index at index_path.
+
+    Files whose size and mtime still match their index row are skipped
+    unless rescan=True, which also re-runs ffprobe on files whose result
+    is cached. The rows of files that are gone are removed.
+    At most jobs files (default: one per CPU) are probed at once, each in
+    a worker process. Rows are committed as they arrive, so an interrupted
+    scan keeps its progress. Returns (scanned, unchanged, removed, failed).
+    """
+    found = find_videos(root)
+    prefix = os.path.join(os.path.abspath(root), '')
+
+    with closing(open_library_index(index_path)) as db:
+        known = {
+            path: (size, mtime_ns) for path, size, mtime_ns in db.execute(
+                'SELECT path, size, mtime_ns FROM videos WHERE substr(path, 1, ?) = ?', (len(prefix), prefix)
+            )
+        }
+        present = {path for path, _, _ in found}
+        gone = [(path,) for path in known if path not in present]
+        with db:
+            db.executemany('DELETE FROM videos WHERE path = ?', gone)
+
+        todo = [(path, size, mtime_ns) for path, size, mtime_ns in found
+                if rescan or known.get(path) != (size, mtime_ns)]
+        failed = 0
+        if todo:
+            workers = max(1, min(jobs or os.cpu_count() or 1, len(todo)))
+            shared_pool = SHARED_POOL
+            shared = shared_pool is not None and workers <= SHARED_POOL_WORKERS
+            last = time.monotonic()
+            with nullcontext(shared_pool) if shared else ProcessPoolExecutor(max_workers=workers) as pool:
+                futures = {pool.submit(scan_video, path, rescan): (path, size, mtime_ns) for path, size, mtime_ns in todo}
+                try:
+                    for done, future in enumerate(as_completed(futures), start=1):
+                        path, size, mtime_ns = futures[future]
+                        row = future.result()
+                        if row[-1] is not None:
+                            failed += 1
+                        db.execute('INSERT OR REPLACE INTO videos VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                                   (path, size, mtime_ns, *row, time.time()))
+                        if done % SCAN_COMMIT_INTERVAL == 0:
+                            db.commit()
+                        if show_progress and (done == len(todo) or time.monotonic() - last >= PROGRESS_INTERVAL):
+                            last = time.monotonic()
+                            print(f"\rScanned {done}/{len(todo)} files", end='', flush=True)
+                except KeyboardInterrupt:
+                    for future in futures:
+                        future.cancel()
+                    raise
+                finally:
+                    db.commit()
+            if show_progress:
+                print()
+
+    return len(todo), len(found) - len(todo), len(gone), failed
+
+
+def parse_area(value):
+    """Parse LEFT,TOP,WIDTH,HEIGHT fractions of the frame, e.g. '0,0.6,1,0.4'."""
+    try:
+        left, top, width, height = (float(part) for part in value.split(','))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid area: {value!r} (use LEFT,TOP,WIDTH,HEIGHT fractions)")
+    if left < 0 or top < 0 or width <= 0 or height <= 0 or left + width > 1 or top + height > 1:
+        raise argparse.ArgumentTypeError(f"area must lie inside the frame: {value!r}")
+    return left, top, width, height
+
+
+def parse_library_filter(value):
+    """Parse a COLUMN OPERATOR VALUE filter on the library index, e.g. 'height>=1080' or 'codec=h264'.
+
+    The operators are =, !=, <, <=, >, >= and ~ (contains). Values of the
+    numeric columns are parsed as numbers.
+    """
+    match = re.fullmatch(r'\s*(\w+)\s*(!=|<=|>=|=|<|>|~)\s*(.*?)\s*', value)
+    if not match:
+        raise argparse.ArgumentTypeError(f"invalid filter: {value!r} (use COLUMN OPERATOR VALUE, e.g. height>=1080)")
+    column, operator, operand = match.groups()
+    if column not in LIBRARY_COLUMNS:
+        raise argparse.ArgumentTypeError(f"unknown column {column!r} (use one of: {', '.join(LIBRARY_COLUMNS)})")
+    if column in LIBRARY_NUMERIC_COLUMNS and operator != '~':
+        try:
+            operand = float(operand)
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"{column} needs a number: {value!r}")
+    return column, operator, operand
+
+
+def parse_offset(value):
+    """Parse a time offset like parse_time(), which may be negative, e.g. '-0.5' or '00:07'."""
+    if value.startswith('-'):
+        return -parse_time(value[1:])
+    return parse_time(value)
+
+
+def parse_grid(value):
+    """Parse a ROWSxCOLS grid such as '3x3'."""
+    rows, sep, cols = value.lower().partition('x')
+    if not sep or not rows.isdigit() or not cols.isdigit() or int(rows) < 1 or int(cols) < 1:
+        raise argparse.ArgumentTypeError(f"invalid grid: {value!r} (use ROWSxCOLS, e.g. 3x3)")
+    return int(rows), int(cols)
+
+
+def parse_scale(value):
+    """Parse WIDTH[:HEIGHT] such as '640' or '640:360', -1 keeping the aspect ratio."""
+    try:
+        sizes = [int(part) for part in value.split(':')]
+    except ValueError:
+        sizes = []
+    if len(sizes) == 1:
+        sizes.append(-1)
+    if len(sizes) != 2 or sizes == [-1, -1] or any(size == 0 or size < -1 for size in sizes):
+        raise argparse.ArgumentTypeError(f"invalid scale: {value!r} (use WIDTH[:HEIGHT], e.g. 640 or -1:360)")
+    return tuple(sizes)
+
+
+def parse_crop(value):
+    """Parse an X:Y:WIDTH:HEIGHT pixel rectangle such as '0:720:1920:360'."""
+    parts = value.split(':')
+    if len(parts) != 4 or not all(part.isdigit() for part in parts) or int(parts[2]) < 1 or int(parts[3]) < 1:
+        raise argparse.ArgumentTypeError(f"invalid crop: {value!r} (use X:Y:WIDTH:HEIGHT in pixels)")
+    return tuple(int(part) for part in parts)
+
+
+def parse_sha256(value):
+    """Parse a SHA-256 digest given as 64 hex digits."""
+    if not re.fullmatch(r'[0-9a-fA-F]{64}', value):
+        raise argparse.ArgumentTypeError(f"invalid SHA-256: {value!r} (use 64 hex digits)")
+    return value.lower()
+
+
+def parse_frame_numbers(value):
+    """Parse frame numbers and ranges such as '1-10,25' into a list of numbers."""
+    numbers = []
+    for part in value.split(','):
+        first, sep, last = part.strip().partition('-')
+        if not first.isdigit() or (sep and not last.isdigit()) or int(last if sep else first) < int(first):
+            raise argparse.ArgumentTypeError(f"invalid frame numbers: {value!r} (use e.g. 1-10,25)")
+        numbers.extend(range(int(first), int(last if sep else first) + 1))
+    return numbers
+
+
+def parse_tile_layout(value):
+    """Parse a COLSxROWS contact sheet layout such as '4x3'."""
+    cols, sep, rows = value.lower().partition('x')
+    if not sep or not cols.isdigit() or not rows.isdigit() or int(cols) < 1 or int(rows) < 1:
+        raise argparse.ArgumentTypeError(f"invalid layout: {value!r} (use COLSxROWS, e.g. 4x3)")
+    return int(cols), int(rows)
+
+
+def check_frame_options(parser, args):
+    """Reject frame options that only make sense together with others."""
+    if args.contact_sheet and args.dedup is not None:
+        parser.error('--dedup cannot be combined with --contact-sheet')
+    if args.area and not args.contact_sheet:
+        parser.error('--area needs --contact-sheet')
+    if args.tile_width < 16:
+        parser.error('--tile-width must be at least 16')
+    if args.contact_sheet and (args.scale or args.crop):
+        parser.error('--scale and --crop cannot be combined with --contact-sheet (use --tile-width and --area)')
+    if args.contact_sheet and args.format == 'raw':
+        parser.error('contact sheets cannot be written as raw frames')
+    if args.contact_sheet and args.pack:
+        parser.error('--pack cannot be combined with --contact-sheet')
+    if args.quality is not None and not 1 <= args.quality <= 100:
+        parser.error('--quality must be between 1 and 100')
+
+
+def resolve_time_window(parser, args):
+    """Fold --range into --start/--end and check that the window is not empty."""
+    if args.range:
+        if args.start is not None or args.end is not None:
+            parser.error('--range cannot be combined with --start/--end')
+        args.start, args.end = args.range
+    if args.start is not None and args.end is not None and args.end <= args.start:
+        parser.error('--end must be after --start')
+
+
+def read_url_list(source):
+    """Read URLs from a file, or stdin when source is '-', skipping blank lines and # comments."""
+    if source == '-':
+        lines = sys.stdin.read().splitlines()
+    else:
+        with open(source) as f:
+            lines = f.read().splitlines()
+
+    urls = []
+    for line in lines:
+        line = line.strip()
+        if line and not line.startswith('#') and line not in urls:
+            urls.append(line)
+
+    return urls
+
+
+def unique_names(urls):
+    """Pick a distinct output name (without extension) for every URL in a batch."""
+    names = []
+    seen = set()
+    for url in urls:
+        stem = Path(get_filename_from_url(url)).stem
+        name = stem
+        counter = 2
+        while name in seen:
+            name = f"{stem}-{counter}"
+            counter += 1
+        seen.add(name)
+        names.append(name)
+    return names
+
+
+def run_batch(urls, output_dir, process, jobs=DEFAULT_JOBS, max_per_host=DEFAULT_CONNECTIONS_PER_HOST,
+              **download_options):
+    """Download many URLs concurrently, handing each video to process as soon as its download finishes.
+
+    process(video_path) returns (video information, frames) and raises when
+    it fails. download_options go to fetch_video(). Returns one result per
+    URL, in order, with its 'url', 'ok', and 'path', 'info' and 'frames' or
+    'error'.
+    """
+    results = {url: {'url': url, 'ok': False} for url in urls}
+
+    with create_session(max_per_host) as session, \
+            ThreadPoolExecutor(max_workers=jobs) as downloads, \
+            ThreadPoolExecutor(max_workers=jobs) as processing:
+        try:
+            download_futures = {
+                downloads.submit(fetch_video, url, output_dir, name,
+                                 show_progress=False, session=session, **download_options): url
+                for url, name in zip(urls, unique_names(urls))
+            }
+
+            # Start processing each file while the remaining downloads continue
+            process_futures = {}
+            for future in as_completed(download_futures):
+                url = download_futures[future]
+                try:
+                    results[url]['path'] = future.result()
+                except Exception as e:
+                    results[url]['error'] = str(e)
+                    status('error', f"Could not download {url}: {e}")
+                    continue
+                process_futures[processing.submit(process, results[url]['path'])] = url
+
+            for future in as_completed(process_futures):
+                url = process_futures[future]
+                try:
+                    results[url]['info'], results[url]['frames'] = future.result()
+                    results[url]['ok'] = True
+                except Exception as e:
+                    results[url]['error'] = str(e)
+        except KeyboardInterrupt:
+            downloads.shutdown(wait=False, cancel_futures=True)
+            processing.shutdown(wait=False, cancel_futures=True)
+            raise
+
+    return [results[url] for url in urls]
+
+
+class ClientStream:
+    """A text stream that sends every write to a daemon client as a {key: text} JSON line."""
+
+    def __init__(self, wfile, key, lock):
+        self.wfile = wfile
+        self.key = key
+        self.lock = lock
+
+    def write(self, text):
+        if text:
+            with self.lock:
+                self.wfile.write((json.dumps({self.key: text}) + '\n').encode())
+        return len(text)
+
+    def flush(self):
+        pass
+
+    def isatty(self):
+        return False
+
+
+class DaemonHandler(socketserver.StreamRequestHandler):
+    """Run one command line sent by a client in the daemon, streaming its output back."""
+
+    def handle(self):
+        request = json.loads(self.rfile.readline())
+        if request.get('script') != self.server.identity:
+            self.wfile.write(b'{"retry": "the daemon runs a different version of this script"}\n')
+            return
+
+        lock = threading.Lock()
+        cwd, stdin = os.getcwd(), sys.stdin
+        status = 0
+        try:
+            os.chdir(request['cwd'])
+            if 'stdin' in request:
+                sys.stdin = io.StringIO(request['stdin'])
+            with redirect_stdout(ClientStream(self.wfile, 'out', lock)), \
+                    redirect_stderr(ClientStream(self.wfile, 'err', lock)):
+                try:
+                    self.server.main(request['argv'])
+                except SystemExit as e:
+                    if isinstance(e.code, str):
+                        print(e.code, file=sys.stderr)
+                    status = e.code if isinstance(e.code, int) else int(e.code is not None)
+                except Exception:
+                    traceback.print_exc()
+                    status = 1
+        finally:
+            os.chdir(cwd)
+            sys.stdin = stdin
+            TRACE.stop()
+        self.wfile.write((json.dumps({'exit': status}) + '\n').encode())
+
+
+# Windows has no Unix sockets; serve refuses to start there
+class DaemonServer(getattr(socketserver, 'UnixStreamServer', socketserver.TCPServer)):
+    """Serves one command at a time and notes when no command arrived within its timeout."""
+
+    idle = False
+
+    def handle_timeout(self):
+        self.idle = True
+
+    def handle_error(self, request, client_address):
+        if isinstance(sys.exc_info()[1], (BrokenPipeError, ConnectionResetError)):
+            # The client went away, e.g. after Ctrl+C
+            return
+        super().handle_error(request, client_address)
+
+
+def script_identity(script_path):
+    """Identify a copy of a script and this video_common, so a daemon never runs a different or edited one."""
+    paths = [os.path.realpath(script_path), os.path.realpath(__file__)]
+    return [[path, os.stat(path).st_mtime_ns] for path in paths]
+
+
+def forward_to_daemon(argv, script_path, socket_path):
+    """Run a command line of script_path in the serve daemon listening on socket_path, if there is one.
+
+    Returns the exit status of the command, or None when no daemon took it
+    and it should run in this process.
+    """
+    if os.environ.get('VIDEO_NO_DAEMON') or not hasattr(socket, 'AF_UNIX') or not os.path.exists(socket_path):
+        return None
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        client.connect(str(socket_path))
+    except OSError:
+        # A socket left behind by a daemon that did not shut down cleanly
+        client.close()
+        return None
+
+    request = {'script': script_identity(script_path), 'argv': argv, 'cwd': os.getcwd()}
+    if argv[:1] == ['batch'] and '-' in argv[1:]:
+        request['stdin'] = sys.stdin.read()
+    try:
+        with client, client.makefile('rb') as replies:
+            client.sendall((json.dumps(request) + '\n').encode())
+            for line in replies:
+                reply = json.loads(line)
+                if 'exit' in reply:
+                    return reply['exit']
+                if 'retry' in reply:
+                    status('warning', f"Not using the daemon at {socket_path}: {reply['retry']}; restart it",
+                           file=sys.stderr)
+                    return None
+                stream = sys.stdout if 'out' in reply else sys.stderr
+                stream.write(reply.get('out', reply.get('err')))
+                stream.flush()
+    except KeyboardInterrupt:
+        # Closing the connection stops the command at its next message
+        print(file=sys.stderr)
+        status('error', "Cancelled", file=sys.stderr)
+        return 1
+    status('error', "The daemon stopped before the command finished", file=sys.stderr)
+    return 1
+
+
+def serve(socket_path, main, identity, idle_minutes=DEFAULT_DAEMON_IDLE_MINUTES,
+          max_per_host=DEFAULT_CONNECTIONS_PER_HOST, workers=DEFAULT_DAEMON_WORKERS):
+    """Run main(argv) for the command lines clients send to socket_path until idle_minutes pass without one.
+
+    The commands share a keep-alive session of max_per_host connections per
+    host, the ffprobe results and a pool of workers frame extraction
+    processes. Exits with status 1 when another daemon already listens there.
+    """
+    if os.path.exists(socket_path):
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(str(socket_path))
+        except OSError:
+            # Left behind by a daemon that did not shut down cleanly
+            os.remove(socket_path)
+        else:
+            probe.close()
+            status('error', f"A daemon is already listening on {socket_path}")
+            sys.exit(1)
+    os.makedirs(os.path.dirname(os.path.abspath(socket_path)), exist_ok=True)
+
+    global SHARED_SESSION, SHARED_POOL, SHARED_POOL_WORKERS
+    SHARED_SESSION = create_session(max_per_host)
+    SHARED_POOL = ProcessPoolExecutor(max_workers=workers)
+    SHARED_POOL_WORKERS = workers
+    # Start every worker now, before any client connection exists that forked ones could inherit
+    for future in [SHARED_POOL.submit(os.getpid) for _ in range(workers)]:
+        future.result()
+    # Only this user may connect
+    umask = os.umask(0o077)
+    try:
+        server = DaemonServer(str(socket_path), DaemonHandler)
+    finally:
+        os.umask(umask)
+    server.identity = identity
+    server.main = main
+    server.timeout = idle_minutes * 60 or None
+    # kill shuts down as cleanly as Ctrl+C
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+
+    status('ok', f"Serving on {socket_path} (pid {os.getpid()}); stop with Ctrl+C or kill {os.getpid()}")
+    try:
+        while not server.idle:
+            server.handle_request()
+        print(f"No command for {idle_minutes:g} minutes, exiting")
+    except KeyboardInterrupt:
+        print()
+    finally:
+        server.server_close()
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        SHARED_POOL.shutdown()
+        SHARED_SESSION.close()
+        SHARED_SESSION = SHARED_POOL = None
+        SHARED_POOL_WORKERS = 0
@@ -0,0 +1,170 @@
+"""
+Helpers shared by the benchmarks in this directory and the tests
+
+- load_script() imports scripts/download_video.py, or the skill's copy, as
+  a module
+- make_clip() renders a synthetic test clip with ffmpeg's testsrc
+- serve_files() starts a local HTTP server with Range, If-Range, ETag and
+  Last-Modified support, optionally throttled (Throttle) and delayed like a
+  remote host
+"""
+
+import importlib.util
+import re
+import sys
+import subprocess
+import threading
+import time
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+REPO = Path(__file__).resolve().parent.parent
+SCRIPT = REPO / 'scripts' / 'download_video.py'
+SKILL_SCRIPT = REPO / 'claude-skills' / 'video-viewing' / 'scripts' / 'download_video.py'
+
+# Temporal noise keeps testsrc from compressing to almost nothing, so clips reach their bitrate
+NOISE_FILTER = 'noise=alls=12:allf=t'
+CONTENT_TYPES = {'mp4': 'video/mp4', 'webm': 'video/webm'}
+SEND_BLOCK_SIZE = 64 * 1024
+
+
+def load_script(path=SCRIPT, name='download_video'):
+    """Import a download script as a module, registered so that worker processes can find it."""
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def make_clip(path, duration, size, fps, encoder_args=('-pix_fmt', 'yuv420p'), gop=None, bitrate=None):
+    """Render a synthetic testsrc clip, with a keyframe every gop frames when given.
+
+    bitrate adds temporal noise and caps the encoder at that rate, so the
+    clip is about as large as a real video of that bitrate.
+    """
+    cmd = ['ffmpeg', '-v', 'error', '-f', 'lavfi', '-i', f'testsrc=duration={duration}:size={size}:rate={fps}']
+    if bitrate:
+        cmd += ['-vf', NOISE_FILTER]
+    cmd += list(encoder_args)
+    if bitrate:
+        cmd += ['-b:v', bitrate, '-maxrate', bitrate, '-bufsize', bitrate]
+    if gop:
+        cmd += ['-g', str(gop)]
+    subprocess.run([*cmd, '-y', str(path)], check=True)
+
+
+class Throttle:
+    """A token bucket shared by every connection, releasing rate bytes per second (unlimited if 0)."""
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.lock = threading.Lock()
+        self.ready_at = time.monotonic()
+
+    def wait(self, size):
+        """Block until size more bytes may be sent."""
+        if not self.rate:
+            return
+        with self.lock:
+            now = time.monotonic()
+            self.ready_at = max(now, self.ready_at) + size / self.rate
+            delay = self.ready_at - now
+        time.sleep(delay)
+
+
+def directory_files(directory):
+    """Map every file of a directory to its URL path, with an ETag made of its name and size."""
+    return {
+        f'/{path.name}': (path, f'"{path.name}-{path.stat().st_size}"')
+        for path in sorted(Path(directory).iterdir()) if path.is_file()
+    }
+
+
+def make_handler(files, throttle=None, latency=0, ranges=True):
+    """Build a request handler that serves files ({url path: (path, etag)}) with byte-range support.
+
+    With ranges=False it still advertises Accept-Ranges but answers every
+    request with the whole file, like some misconfigured servers do.
+    """
+
+    class FileHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, *args):
+            pass
+
+        def handle(self):
+            try:
+                super().handle()
+            except ConnectionResetError:
+                # A client dropped a kept-alive connection between requests
+                pass
+
+        def send_head(self):
+            if self.path not in files:
+                self.send_error(404)
+                return None
+            path, etag = files[self.path]
+            size = path.stat().st_size
+            start, end = 0, size - 1
+            match = re.fullmatch(r'bytes=(\d+)-(\d*)', self.headers.get('Range', ''))
+            if_range = self.headers.get('If-Range')
+            ranged = ranges and match is not None and if_range in (None, etag)
+            if ranged:
+                start = int(match.group(1))
+                end = min(int(match.group(2)), size - 1) if match.group(2) else size - 1
+                if start >= size:
+                    self.send_response(416)
+                    self.send_header('Content-Range', f'bytes */{size}')
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return None
+
+            if latency:
+                time.sleep(latency)
+            self.send_response(206 if ranged else 200)
+            self.send_header('Content-Type', CONTENT_TYPES.get(path.suffix[1:], 'application/octet-stream'))
+            self.send_header('Accept-Ranges', 'bytes')
+            self.send_header('ETag', etag)
+            self.send_header('Last-Modified', formatdate(path.stat().st_mtime, usegmt=True))
+            self.send_header('Content-Length', str(end - start + 1))
+            if ranged:
+                self.send_header('Content-Range', f'bytes {start}-{end}/{size}')
+            self.end_headers()
+            return path, start, end
+
+        def do_HEAD(self):
+            self.send_head()
+
+        def do_GET(self):
+            head = self.send_head()
+            if head is None:
+                return
+            path, start, end = head
+            with open(path, 'rb') as f:
+                f.seek(start)
+                remaining = end - start + 1
+                try:
+                    while remaining:
+                        block = f.read(min(SEND_BLOCK_SIZE, remaining))
+                        if not block:
+                            break
+                        if throttle:
+                            throttle.wait(len(block))
+                        self.wfile.write(block)
+                        remaining -= len(block)
+                except (BrokenPipeError, ConnectionResetError):
+                    # Clients close a response early, e.g. to switch to byte ranges or once ffprobe has its header
+                    self.close_connection = True
+
+    return FileHandler
+
+
+def serve_files(files, throttle=None, latency=0, ranges=True):
+    """Serve files ({url path: (path, etag)}) from 127.0.0.1 in a background thread; shut the server down after."""
+    server = ThreadingHTTPServer(('127.0.0.1', 0), make_handler(files, throttle, latency, ranges))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Benchmark: download write path throughput against a local HTTP server
+
+Serves a file of random bytes from a local HTTP server with Range, ETag and
+Content-Length support, then downloads it with:
+
+- the old write loop: 8 KiB chunks, a progress line per chunk and a second
+  read of the finished file to hash it, as the cache did
+- fetch_video() from scripts/download_video.py over 1 connection and over
+  --connections, with adaptive chunks, time-limited progress, preallocation
+  and the SHA-256 computed while streaming, checked with expected_sha256
+
+Every download is checked against the served file's SHA-256. Wall time and
+throughput are reported as a Markdown table.
+
+Usage:
+    python experiments/benchmark-download-throughput.py
+    python experiments/benchmark-download-throughput.py --size 1024 --connections 8
+"""
+
+import argparse
+import hashlib
+import os
+import shutil
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+from pathlib import Path
+
+from _bench_common import load_script, serve_files
+
+
+def old_download(requests, url, part_path, total_size):
+    """The write loop before adaptive chunks: 8 KiB reads, a progress line each, then a hashing pass."""
+    with requests.get(url, stream=True, headers={'Accept-Encoding': 'identity'}) as response, \
+            open(part_path, 'wb') as f:
+        downloaded = 0
+        for chunk in response.iter_content(chunk_size=8192):
+            if chunk:
+                f.write(chunk)
+                downloaded += len(chunk)
+                percent = (downloaded / total_size) * 100
+                print(f"\rProgress: {percent:.1f}% ({downloaded}/{total_size} bytes)", end='')
+    # The cache then read the whole file again to hash it
+    digest = hashlib.sha256()
+    with open(part_path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return part_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the download write path against a local server')
+    parser.add_argument('--size', type=int, default=256, help='Size of the served file in MB (default: 256)')
+    parser.add_argument('--connections', type=int, default=4,
+                        help='Connections for the parallel run (default: 4)')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per method; the fastest counts (default: 3)')
+    args = parser.parse_args()
+
+    script = load_script()
+    work_dir = Path(tempfile.mkdtemp(prefix='download-bench-'))
+    failed = False
+    server = None
+
+    try:
+        source = work_dir / 'source.mp4'
+        with open(source, 'wb') as f:
+            for _ in range(args.size):
+                f.write(os.urandom(1024 * 1024))
+        expected = hashlib.sha256(source.read_bytes()).hexdigest()
+        total_size = source.stat().st_size
+
+        server = serve_files({'/video.mp4': (source, f'"{expected[:16]}"')})
+        url = f'http://127.0.0.1:{server.server_port}/video.mp4'
+        print(f"Serving {args.size} MB at {url}\n")
+
+        methods = [
+            ('old loop (8 KiB, hash afterwards)', lambda out: old_download(
+                script.requests, url, out / 'video.mp4', total_size)),
+            ('fetch_video, 1 connection', lambda out: script.fetch_video(
+                url, out, connections=1, expected_sha256=expected)),
+            (f'fetch_video, {args.connections} connections', lambda out: script.fetch_video(
+                url, out, connections=args.connections, expected_sha256=expected)),
+        ]
+
+        print("| method | best wall time (s) | MB/s | SHA-256 matches |")
+        print("|--------|-------------------:|-----:|-----------------|")
+        for name, run in methods:
+            best = None
+            matches = True
+            for attempt in range(args.repeat):
+                out = work_dir / f'run-{attempt}'
+                out.mkdir()
+                started = time.perf_counter()
+                # Silence the progress lines
+                with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+                    path = run(out)
+                elapsed = time.perf_counter() - started
+                matches = matches and script.video_common.file_sha256(path) == expected
+                best = elapsed if best is None else min(best, elapsed)
+                shutil.rmtree(out)
+            failed = failed or not matches
+            print(f"| {name} | {best:.2f} | {args.size / best:.0f} | {'yes' if matches else 'NO'} |")
+    finally:
+        if server:
+            server.shutdown()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Benchmark: loose frame files vs one packed frame archive
+
+Generates a synthetic clip with ffmpeg's testsrc and runs extract_frames()
+from scripts/download_video.py once writing separate files and once with
+pack=True. The packed frames are checked against the loose ones first, by
+exporting the archive again. Then both outputs are timed for what costs the
+most on network filesystems: writing them, listing and copying the output
+directory, and reading frames in random order (by file name, or by number
+through FrameArchive). The results are reported as a Markdown table.
+
+Usage:
+    python experiments/benchmark-frame-archive.py
+    python experiments/benchmark-frame-archive.py --duration 120 --format raw --scale 320
+    python experiments/benchmark-frame-archive.py --work-dir /mnt/network-share/bench
+"""
+
+import argparse
+import filecmp
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+from pathlib import Path
+
+from _bench_common import load_script, make_clip
+
+
+def timed(function, *args):
+    """Run function(*args) and return its wall time in seconds."""
+    started = time.perf_counter()
+    function(*args)
+    return time.perf_counter() - started
+
+
+def read_loose(frames_dir, names, order):
+    """Read frame files in the given order."""
+    for n in order:
+        (frames_dir / names[n]).read_bytes()
+
+
+def read_packed(script, archive_path, order):
+    """Open the archive and read its frames in the given order."""
+    with script.video_common.FrameArchive(archive_path) as archive:
+        for n in order:
+            bytes(archive[n])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare loose frame files with a packed frame archive')
+    parser.add_argument('--duration', type=float, default=30, help='Clip duration in seconds (default: 30)')
+    parser.add_argument('--size', default='640x360', help='Clip resolution (default: 640x360)')
+    parser.add_argument('--fps', type=int, default=30, help='Clip frame rate; every frame is extracted (default: 30)')
+    parser.add_argument('--format', default='jpg', help='Frame format (default: jpg)')
+    parser.add_argument('--scale', type=int, help='Frame width (default: the clip width)')
+    parser.add_argument('--reads', type=int, default=1000, help='Random frame reads to time (default: 1000)')
+    parser.add_argument('--work-dir', type=Path,
+                        help='Directory to benchmark in, e.g. on a network filesystem (default: a temporary one)')
+    args = parser.parse_args()
+
+    script = load_script()
+    work_dir = Path(tempfile.mkdtemp(prefix='archive-bench-', dir=args.work_dir))
+    failed = False
+
+    try:
+        clip = work_dir / 'clip.mp4'
+        print(f"Rendering {args.duration:g}s {args.size}@{args.fps} test clip...")
+        make_clip(clip, args.duration, args.size, args.fps)
+        scale = (args.scale, -1) if args.scale else None
+
+        results = {}
+        for layout in ('loose', 'packed'):
+            run_dir = work_dir / layout
+            run_dir.mkdir()
+            # Silence the progress lines of the script
+            with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+                started = time.perf_counter()
+                frames_dir = script.extract_frames(clip, run_dir, args.fps, scale=scale,
+                                                   image_format=args.format, pack=layout == 'packed')
+                extract = time.perf_counter() - started
+            if frames_dir is None:
+                sys.exit(f"Extraction failed for {layout} frames")
+            results[layout] = {'dir': frames_dir, 'extract': extract}
+
+        loose_dir, packed_dir = results['loose']['dir'], results['packed']['dir']
+        names = sorted(f.name for f in loose_dir.iterdir() if f.name != 'manifest.json')
+        archive_path = packed_dir / script.FRAME_ARCHIVE_NAME
+
+        # The archive must hold exactly the loose frames
+        export_dir = work_dir / 'export'
+        script.export_frames(archive_path, export_dir, image_format=args.format)
+        exported = sorted(f.name for f in export_dir.iterdir() if f.name != 'manifest.json')
+        _, mismatched, errors = filecmp.cmpfiles(loose_dir, export_dir, names, shallow=False)
+        if exported != names or mismatched or errors:
+            print("Packed frames differ from the loose frames")
+            failed = True
+        shutil.rmtree(export_dir)
+
+        order = [random.randrange(len(names)) for _ in range(args.reads)]
+        for layout, frames_dir in (('loose', loose_dir), ('packed', packed_dir)):
+            result = results[layout]
+            result['list'] = timed(lambda: sorted(os.listdir(frames_dir)))
+            result['copy'] = timed(shutil.copytree, frames_dir, work_dir / f'{layout}-copy')
+            if layout == 'loose':
+                result['read'] = timed(read_loose, frames_dir, names, order)
+            else:
+                result['read'] = timed(read_packed, script, archive_path, order)
+            result['files'] = len(os.listdir(frames_dir))
+            result['mb'] = sum(f.stat().st_size for f in frames_dir.iterdir()) / (1024 * 1024)
+
+        print(f"\n{len(names)} {args.format} frames in {work_dir}\n")
+        print(f"| layout | files | MB | extract (s) | list (ms) | copy (s) | {args.reads} random reads (ms) |")
+        print("|--------|------:|---:|------------:|----------:|---------:|--------------------:|")
+        for layout, result in results.items():
+            print(f"| {layout} | {result['files']} | {result['mb']:.1f} | {result['extract']:.2f} | "
+                  f"{result['list'] * 1000:.2f} | {result['copy']:.3f} | {result['read'] * 1000:.1f} |")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Benchmark: single-pass frame extraction vs one ffmpeg process per frame
+
+Generates a synthetic clip with ffmpeg's testsrc and times extract_frames_at()
+from the video-viewing skill against the previous per-timestamp loop
+(`ffmpeg -ss T -i file -vframes 1`) for several frame counts.
+
+Usage:
+    python experiments/benchmark-frame-extraction.py
+    python experiments/benchmark-frame-extraction.py --duration 120 --counts 10 50 200
+"""
+
+import argparse
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+from contextlib import redirect_stdout
+from pathlib import Path
+
+from _bench_common import SKILL_SCRIPT, load_script, make_clip
+
+
+def extract_per_frame(video_path, timestamps, frames_dir):
+    """The previous implementation: one ffmpeg process per timestamp."""
+    for i, timestamp in enumerate(timestamps):
+        subprocess.run([
+            'ffmpeg', '-ss', str(timestamp), '-i', str(video_path),
+            '-vframes', '1', '-q:v', '2', '-y',
+            os.path.join(frames_dir, f"frame_{i + 1:03d}.jpg")
+        ], capture_output=True, timeout=30)
+
+
+def timed(func, *args):
+    """Run func and return its wall time in seconds."""
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark single-pass frame extraction')
+    parser.add_argument('--duration', type=float, default=60, help='Clip duration in seconds (default: 60)')
+    parser.add_argument('--size', default='1280x720', help='Clip resolution (default: 1280x720)')
+    parser.add_argument('--fps', type=int, default=30, help='Clip frame rate (default: 30)')
+    parser.add_argument('--counts', type=int, nargs='+', default=[10, 50, 200],
+                        help='Frame counts to benchmark (default: 10 50 200)')
+    args = parser.parse_args()
+
+    script = load_script(SKILL_SCRIPT)
+    work_dir = Path(tempfile.mkdtemp(prefix='frame-bench-'))
+
+    try:
+        clip = work_dir / 'clip.mp4'
+        print(f"Rendering {args.duration:g}s {args.size}@{args.fps} test clip...")
+        make_clip(clip, args.duration, args.size, args.fps)
+
+        print(f"\n{'frames':>8} {'per-frame (s)':>14} {'single-pass (s)':>16} {'speedup':>8}")
+        for count in args.counts:
+            interval = args.duration / (count + 1)
+            timestamps = [interval * (i + 1) for i in range(count)]
+
+            loop_dir = work_dir / f'loop-{count}'
+            single_dir = work_dir / f'single-{count}'
+            loop_dir.mkdir()
+            single_dir.mkdir()
+
+            loop_time = timed(extract_per_frame, clip, timestamps, str(loop_dir))
+            # Silence the per-frame progress lines of the skill script
+            with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+                single_time = timed(script.extract_frames_at, str(clip), timestamps, str(single_dir), args.fps)
+
+            print(f"{count:>8} {loop_time:>14.2f} {single_time:>16.2f} {loop_time / single_time:>7.1f}x")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Benchmark: frame output formats and decode-time scaling
+
+Generates a synthetic clip with ffmpeg's testsrc and times extract_frames()
+from scripts/download_video.py for every combination of --format and
+--scale, reporting wall time and bytes written as a Markdown table.
+
+Usage:
+    python experiments/benchmark-frame-formats.py
+    python experiments/benchmark-frame-formats.py --size 3840x2160 --scales full 1920 640
+"""
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+from contextlib import redirect_stdout
+from pathlib import Path
+
+from _bench_common import load_script, make_clip
+
+
+def directory_size(path):
+    """Total size of the frame files in a directory, without the manifest."""
+    return sum(f.stat().st_size for f in path.iterdir() if f.name != 'manifest.json')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark frame output formats and scaling')
+    parser.add_argument('--duration', type=float, default=10, help='Clip duration in seconds (default: 10)')
+    parser.add_argument('--size', default='1920x1080', help='Clip resolution (default: 1920x1080)')
+    parser.add_argument('--fps', type=int, default=30, help='Clip frame rate (default: 30)')
+    parser.add_argument('--extract-fps', type=float, default=10, help='Frames extracted per second (default: 10)')
+    parser.add_argument('--formats', nargs='+', default=['png', 'jpg', 'webp', 'raw'],
+                        help='Formats to benchmark (default: png jpg webp raw)')
+    parser.add_argument('--scales', nargs='+', default=['full', '960', '480'],
+                        help="Frame widths to benchmark, 'full' for no scaling (default: full 960 480)")
+    args = parser.parse_args()
+
+    script = load_script()
+    work_dir = Path(tempfile.mkdtemp(prefix='format-bench-'))
+
+    try:
+        clip = work_dir / 'clip.mp4'
+        print(f"Rendering {args.duration:g}s {args.size}@{args.fps} test clip...")
+        make_clip(clip, args.duration, args.size, args.fps)
+
+        print("\n| format | scale | frames | wall time (s) | MB written | MB/frame |")
+        print("|--------|-------|-------:|--------------:|-----------:|---------:|")
+        for image_format in args.formats:
+            for width in args.scales:
+                scale = None if width == 'full' else (int(width), -1)
+                run_dir = work_dir / f'{image_format}-{width}'
+                run_dir.mkdir()
+
+                started = time.perf_counter()
+                # Silence the progress lines of the script
+                with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+                    frames_dir = script.extract_frames(
+                        clip, run_dir, args.extract_fps, scale=scale, image_format=image_format
+                    )
+                elapsed = time.perf_counter() - started
+
+                if frames_dir is None:
+                    print(f"| {image_format} | {width} | failed | | | |")
+                    continue
+                frames = len([f for f in frames_dir.iterdir() if f.name != 'manifest.json'])
+                written = directory_size(frames_dir) / (1024 * 1024)
+                print(f"| {image_format} | {width} | {frames} | {elapsed:.2f} | {written:.1f} | "
+                      f"{written / max(frames, 1):.3f} |")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
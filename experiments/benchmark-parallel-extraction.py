@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Benchmark: parallel segment-based frame extraction
+
+Generates a synthetic clip with ffmpeg's testsrc and runs extract_frames()
+from scripts/download_video.py with --jobs 1, 2, 4 and 8. Every parallel run
+is checked against the sequential one first: the same frame files, byte
+for byte, under the same names, and the same manifest timestamps. Then the
+wall times and speedups are reported as a Markdown table.
+
+Usage:
+    python experiments/benchmark-parallel-extraction.py
+    python experiments/benchmark-parallel-extraction.py --duration 120 --extract-fps 30 --range 7.3-95.1
+"""
+
+import argparse
+import filecmp
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+from pathlib import Path
+
+from _bench_common import load_script, make_clip
+
+
+def compare_runs(reference, candidate):
+    """List the differences between two frame directories, empty when they are identical."""
+    problems = []
+    ref_manifest = json.loads((reference / 'manifest.json').read_text())
+    new_manifest = json.loads((candidate / 'manifest.json').read_text())
+    if ref_manifest['frames'] != new_manifest['frames']:
+        ref_frames, new_frames = ref_manifest['frames'], new_manifest['frames']
+        mismatch = next(
+            (n for n, (a, b) in enumerate(zip(ref_frames, new_frames)) if a != b),
+            min(len(ref_frames), len(new_frames))
+        )
+        problems.append(f"manifest differs at frame {mismatch + 1} "
+                        f"({len(ref_frames)} vs {len(new_frames)} frames)")
+
+    ref_files = sorted(f.name for f in reference.iterdir() if f.name != 'manifest.json')
+    new_files = sorted(f.name for f in candidate.iterdir() if f.name != 'manifest.json')
+    if ref_files != new_files:
+        problems.append(f"file names differ ({len(ref_files)} vs {len(new_files)} files)")
+    _, mismatched, errors = filecmp.cmpfiles(reference, candidate, ref_files, shallow=False)
+    if mismatched or errors:
+        problems.append(f"{len(mismatched) + len(errors)} files differ, first {(mismatched + errors)[0]}")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check and benchmark parallel frame extraction')
+    parser.add_argument('--duration', type=float, default=60, help='Clip duration in seconds (default: 60)')
+    parser.add_argument('--size', default='1280x720', help='Clip resolution (default: 1280x720)')
+    parser.add_argument('--fps', type=int, default=30, help='Clip frame rate (default: 30)')
+    parser.add_argument('--gop', type=int, default=60, help='Frames between keyframes (default: 60)')
+    parser.add_argument('--extract-fps', type=float, default=10, help='Frames extracted per second (default: 10)')
+    parser.add_argument('--range', metavar='START-END',
+                        help='Only extract this window, in seconds (e.g. 7.3-41.9)')
+    parser.add_argument('--format', default='jpg', help='Frame format (default: jpg)')
+    parser.add_argument('--jobs', type=int, nargs='+', default=[1, 2, 4, 8],
+                        help='Job counts to run; the first is the reference (default: 1 2 4 8)')
+    args = parser.parse_args()
+
+    start = end = None
+    if args.range:
+        start, end = (float(part) for part in args.range.split('-'))
+
+    script = load_script()
+    work_dir = Path(tempfile.mkdtemp(prefix='parallel-bench-'))
+    failed = False
+
+    try:
+        clip = work_dir / 'clip.mp4'
+        print(f"Rendering {args.duration:g}s {args.size}@{args.fps} test clip, keyframe every {args.gop} frames...")
+        make_clip(clip, args.duration, args.size, args.fps, gop=args.gop)
+        print(f"{os.cpu_count()} CPUs available\n")
+
+        print("| jobs | frames | wall time (s) | speedup | identical to sequential |")
+        print("|-----:|-------:|--------------:|--------:|-------------------------|")
+        reference = baseline = None
+        for jobs in args.jobs:
+            run_dir = work_dir / f'jobs-{jobs}'
+            run_dir.mkdir()
+
+            started = time.perf_counter()
+            # Silence the progress lines of the script
+            with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+                frames_dir = script.extract_frames(
+                    clip, run_dir, args.extract_fps, start, end, image_format=args.format, jobs=jobs
+                )
+            elapsed = time.perf_counter() - started
+
+            if frames_dir is None:
+                print(f"| {jobs} | failed | | | |")
+                failed = True
+                continue
+            frames = len(json.loads((frames_dir / 'manifest.json').read_text())['frames'])
+            if reference is None:
+                reference, baseline = frames_dir, elapsed
+                verdict = 'reference'
+            else:
+                problems = compare_runs(reference, frames_dir)
+                failed = failed or bool(problems)
+                verdict = 'yes' if not problems else 'NO: ' + '; '.join(problems)
+            print(f"| {jobs} | {frames} | {elapsed:.2f} | {baseline / elapsed:.2f}x | {verdict} |")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Benchmark: frame extraction after the download vs while it downloads (--stream)
+
+Renders the same synthetic clip as a faststart MP4 (moov index first), a
+plain MP4 (moov index last) and a WebM, serves them from a local HTTP server
+throttled to --bandwidth, and runs scripts/download_video.py -f on each, once
+downloading first and once with --stream. The frames directory is polled to
+measure the time to the first frame file next to the total wall time.
+
+The streamed frames must be the same files, with the same timestamps, as the
+frames extracted after the download. The plain MP4 cannot be streamed and
+shows the fallback to the sequential path. Results are reported as a
+Markdown table.
+
+Usage:
+    python experiments/benchmark-streamed-extraction.py
+    python experiments/benchmark-streamed-extraction.py --bandwidth 5 --duration 60 --fps 2
+"""
+
+import argparse
+import filecmp
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from _bench_common import SCRIPT, Throttle, directory_files, make_clip, serve_files
+
+# clip name -> ffmpeg encoder arguments
+CLIPS = {
+    'faststart.mp4': ['-c:v', 'libx264', '-preset', 'veryfast', '-pix_fmt', 'yuv420p', '-movflags', '+faststart'],
+    'moov-last.mp4': ['-c:v', 'libx264', '-preset', 'veryfast', '-pix_fmt', 'yuv420p'],
+    'clip.webm': ['-c:v', 'libvpx-vp9', '-deadline', 'realtime', '-cpu-used', '8', '-pix_fmt', 'yuv420p'],
+}
+POLL_INTERVAL = 0.01
+
+
+def run_extraction(url, out, fps, stream):
+    """Run the script on url, returning (seconds to the first frame file, total seconds, frames dir)."""
+    cmd = [sys.executable, str(SCRIPT), url, '-f', '--fps', str(fps), '-o', str(out), '--no-cache']
+    if stream:
+        cmd.append('--stream')
+    env = {**os.environ, 'VIDEO_NO_DAEMON': '1'}
+    started = time.perf_counter()
+    process = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, env=env)
+    first_frame = None
+    while process.poll() is None:
+        if first_frame is None and any(out.glob('*_frames/frame-*')):
+            first_frame = time.perf_counter() - started
+        time.sleep(POLL_INTERVAL)
+    total = time.perf_counter() - started
+    if process.returncode != 0:
+        raise RuntimeError(f"{' '.join(cmd)} exited with {process.returncode}")
+    frames_dir = next(out.glob('*_frames'))
+    return first_frame or total, total, frames_dir
+
+
+def same_frames(a, b):
+    """Whether two frames directories hold identical frame files with the same timestamps."""
+    manifests = [json.loads((d / 'manifest.json').read_text())['frames'] for d in (a, b)]
+    if manifests[0] != manifests[1]:
+        return False
+    names = [frame['file'] for frame in manifests[0]]
+    _, mismatched, errors = filecmp.cmpfiles(a, b, names, shallow=False)
+    return not mismatched and not errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare frame extraction after and during the download')
+    parser.add_argument('--duration', type=float, default=30, help='Clip duration in seconds (default: 30)')
+    parser.add_argument('--size', default='1280x720', help='Clip resolution (default: 1280x720)')
+    parser.add_argument('--bitrate', default='4M', help='Clip video bitrate (default: 4M)')
+    parser.add_argument('--bandwidth', type=float, default=2,
+                        help='Server bandwidth in MB/s, shared by all connections (default: 2)')
+    parser.add_argument('--fps', type=float, default=1, help='Frames extracted per second (default: 1)')
+    args = parser.parse_args()
+
+    work_dir = Path(tempfile.mkdtemp(prefix='stream-bench-'))
+    clip_dir = work_dir / 'clips'
+    clip_dir.mkdir()
+    failed = False
+    server = None
+
+    try:
+        for name, encoder_args in CLIPS.items():
+            print(f"Rendering {name}...")
+            make_clip(clip_dir / name, args.duration, args.size, 30, encoder_args, gop=60, bitrate=args.bitrate)
+
+        throttle = Throttle(args.bandwidth * 1024 * 1024)
+        server = serve_files(directory_files(clip_dir), throttle)
+        print(f"Serving at {args.bandwidth:g} MB/s from http://127.0.0.1:{server.server_port}\n")
+
+        print("| clip | MB | mode | first frame (s) | total (s) | frames | same frames |")
+        print("|------|---:|------|----------------:|----------:|-------:|-------------|")
+        for name in CLIPS:
+            url = f'http://127.0.0.1:{server.server_port}/{name}'
+            mb = (clip_dir / name).stat().st_size / (1024 * 1024)
+            runs = {}
+            for mode in ('sequential', 'stream'):
+                out = work_dir / mode
+                runs[mode] = run_extraction(url, out, args.fps, mode == 'stream')
+            same = same_frames(runs['sequential'][2], runs['stream'][2])
+            failed = failed or not same
+            for mode, (first_frame, total, frames_dir) in runs.items():
+                count = len(json.loads((frames_dir / 'manifest.json').read_text())['frames'])
+                print(f"| {name} | {mb:.1f} | {mode} | {first_frame:.2f} | {total:.2f} | {count} | "
+                      f"{'yes' if same else 'NO'} |")
+            for mode in runs:
+                shutil.rmtree(work_dir / mode)
+    finally:
+        if server:
+            server.shutdown()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,337 @@
+#!/usr/bin/env python3
+"""
+Benchmark suite: download, probe and extraction over a matrix of synthetic clips
+
+Renders test clips with ffmpeg's testsrc for every combination of --codecs,
+--sizes and --durations, serves them from a local HTTP server with Range,
+ETag and If-Range support, and measures what scripts/download_video.py does
+with them:
+
+- time to first byte of a full GET
+- fetch_video() throughput over each of --connections, checked against the
+  clip's SHA-256
+- probe latency: probe_video() cold and memoized, and probe_url() over HTTP
+- extract_frames() wall time and frames written per second
+
+--bandwidth and --latency throttle the server (a token bucket shared by all
+connections, and a delay before every response) to mimic a remote host
+while staying offline. Everything runs on the CPU with software encoders;
+codecs whose encoder ffmpeg lacks are skipped, as are the probe metrics
+when ffprobe is missing.
+
+The results are printed as a Markdown table and written as JSON together
+with the git commit, so runs on two commits can be compared with --compare.
+
+Usage:
+    python experiments/benchmark-suite.py
+    python experiments/benchmark-suite.py --bandwidth 20 --latency 40 --output before.json
+    python experiments/benchmark-suite.py --codecs h264 hevc --sizes 1920x1080 --durations 60 --clip-dir ~/clips
+    python experiments/benchmark-suite.py --compare before.json after.json
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+from datetime import datetime, timezone
+from pathlib import Path
+
+from _bench_common import REPO, Throttle, load_script, make_clip, serve_files
+
+SCHEMA_VERSION = 1
+
+# codec name -> (ffmpeg encoder, container extension, encoder arguments)
+CODECS = {
+    'h264': ('libx264', 'mp4', ['-preset', 'veryfast', '-pix_fmt', 'yuv420p']),
+    'hevc': ('libx265', 'mp4', ['-preset', 'veryfast', '-pix_fmt', 'yuv420p', '-tag:v', 'hvc1']),
+    'vp9': ('libvpx-vp9', 'webm', ['-deadline', 'realtime', '-cpu-used', '8', '-pix_fmt', 'yuv420p']),
+    'mpeg4': ('mpeg4', 'mp4', []),
+}
+
+
+def available_encoders():
+    """Names of the video encoders this ffmpeg build has."""
+    result = subprocess.run(['ffmpeg', '-hide_banner', '-encoders'], capture_output=True, text=True, check=True)
+    return {line.split()[1] for line in result.stdout.splitlines() if line.startswith(' V')}
+
+
+def file_sha256(path):
+    """SHA-256 of a file, as a hex string."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def git_commit():
+    """The checked-out commit and whether the tree has local changes, or (None, None) outside git."""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=REPO, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        status = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=REPO,
+                                capture_output=True, text=True, check=True).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+    return commit, bool(status.strip())
+
+
+def host_info():
+    """Describe the machine and tools the benchmark ran with."""
+    ffmpeg = subprocess.run(['ffmpeg', '-version'], capture_output=True, text=True).stdout.splitlines()
+    return {
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'python': platform.python_version(),
+        'cpus': os.cpu_count(),
+        'ffmpeg': ffmpeg[0] if ffmpeg else None,
+        'ffprobe': shutil.which('ffprobe') is not None,
+    }
+
+
+def best_of(repeat, run):
+    """Call run() repeat times and return the fastest wall time in seconds, and the last result."""
+    best = result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = run()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def time_to_first_byte(requests, url):
+    """Issue a full GET and read one byte of the body."""
+    with requests.get(url, stream=True, headers={'Accept-Encoding': 'identity'}, timeout=30) as response:
+        response.raise_for_status()
+        response.raw.read(1)
+
+
+def measure_clip(script, clip, url, args, work_dir):
+    """Run every benchmark on one clip, returning (metrics, errors)."""
+    metrics, errors = {}, {}
+    size = clip['path'].stat().st_size
+
+    ttfb, _ = best_of(args.repeat, lambda: time_to_first_byte(script.requests, url))
+    metrics['ttfb_ms'] = ttfb * 1000
+
+    for connections in args.connections:
+        out = work_dir / 'download'
+
+        def run():
+            shutil.rmtree(out, ignore_errors=True)
+            out.mkdir()
+            return script.fetch_video(url, out, connections=connections, show_progress=False,
+                                      expected_sha256=clip['sha256'])
+
+        try:
+            elapsed, _ = best_of(args.repeat, run)
+            metrics[f'download_mb_per_s@{connections}'] = size / (1024 * 1024) / elapsed
+        except Exception as e:
+            errors[f'download@{connections}'] = f'{type(e).__name__}: {e}'
+        shutil.rmtree(out, ignore_errors=True)
+
+    if shutil.which('ffprobe'):
+        probe_cache = work_dir / 'probe-cache'
+        try:
+            cold, _ = best_of(args.repeat, lambda: script.probe_video(clip['path'], refresh=True,
+                                                                      cache_dir=probe_cache))
+            warm, _ = best_of(args.repeat, lambda: script.probe_video(clip['path'], cache_dir=probe_cache))
+            remote, _ = best_of(args.repeat, lambda: script.probe_url(url))
+            metrics.update(probe_cold_ms=cold * 1000, probe_warm_ms=warm * 1000, probe_url_ms=remote * 1000)
+        except (OSError, subprocess.SubprocessError, ValueError) as e:
+            errors['probe'] = f'{type(e).__name__}: {e}'
+        shutil.rmtree(probe_cache, ignore_errors=True)
+    else:
+        errors['probe'] = 'ffprobe not found'
+
+    out = work_dir / 'frames'
+
+    def extract():
+        shutil.rmtree(out, ignore_errors=True)
+        out.mkdir()
+        return script.extract_frames(clip['path'], out, args.extract_fps, image_format=args.format)
+
+    elapsed, frames_dir = best_of(args.repeat, extract)
+    if frames_dir is None:
+        errors['extract'] = 'extract_frames failed'
+    else:
+        frames = len(json.loads((frames_dir / 'manifest.json').read_text())['frames'])
+        metrics.update(extract_seconds=elapsed, extract_frames=frames, extract_fps=frames / elapsed,
+                       extract_realtime=clip['duration'] / elapsed)
+    shutil.rmtree(out, ignore_errors=True)
+
+    return metrics, errors
+
+
+def lower_is_better(metric):
+    """Whether a smaller value of the metric is an improvement."""
+    return metric.endswith(('_ms', '_seconds'))
+
+
+def print_results(results):
+    """Print the metrics of every clip as a Markdown table."""
+    metrics = sorted({name for result in results for name in result['metrics']} - {'extract_frames'})
+    print("\n| clip | MB | " + " | ".join(metrics) + " |")
+    print("|------|---:|" + "".join("-" * (len(name) + 1) + ":|" for name in metrics))
+    for result in results:
+        values = [result['metrics'].get(name) for name in metrics]
+        cells = ["" if value is None else f"{value:.1f}" for value in values]
+        print(f"| {result['clip']['name']} | {result['clip']['bytes'] / (1024 * 1024):.1f} | "
+              + " | ".join(cells) + " |")
+    for result in results:
+        for step, error in result['errors'].items():
+            print(f"{result['clip']['name']}: {step} skipped: {error}")
+
+
+def compare_results(base_path, new_path):
+    """Print the change of every metric the two result files share, per clip."""
+    base, new = (json.loads(Path(path).read_text()) for path in (base_path, new_path))
+    for label, document in (('base', base), ('new', new)):
+        commit = (document.get('commit') or 'unknown')[:12]
+        dirty = ' (with local changes)' if document.get('dirty') else ''
+        print(f"{label}: {commit}{dirty}, {document['created']}, {document['host']['cpus']} CPUs")
+    if base['settings'] != new['settings']:
+        print("Warning: the runs used different settings; the numbers may not be comparable")
+
+    base_results = {result['clip']['name']: result['metrics'] for result in base['results']}
+    print("\n| clip | metric | base | new | change |")
+    print("|------|--------|-----:|----:|-------:|")
+    for result in new['results']:
+        name = result['clip']['name']
+        if name not in base_results:
+            continue
+        for metric, value in sorted(result['metrics'].items()):
+            before = base_results[name].get(metric)
+            if before is None or metric == 'extract_frames':
+                continue
+            change = (value - before) / before * 100 if before else 0.0
+            better = (change < 0) if lower_is_better(metric) else (change > 0)
+            verdict = '' if abs(change) < 1 else (' better' if better else ' worse')
+            print(f"| {name} | {metric} | {before:.1f} | {value:.1f} | {change:+.1f}%{verdict} |")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark downloading, probing and extracting synthetic clips')
+    parser.add_argument('--codecs', nargs='+', choices=sorted(CODECS), default=['h264', 'vp9'],
+                        help='Codecs to render the clips with (default: h264 vp9)')
+    parser.add_argument('--sizes', nargs='+', default=['640x360', '1280x720'],
+                        help='Clip resolutions (default: 640x360 1280x720)')
+    parser.add_argument('--durations', type=float, nargs='+', default=[10, 30],
+                        help='Clip durations in seconds (default: 10 30)')
+    parser.add_argument('--fps', type=int, default=30, help='Clip frame rate (default: 30)')
+    parser.add_argument('--bitrate', default='4M', help='Clip video bitrate (default: 4M)')
+    parser.add_argument('--connections', type=int, nargs='+', default=[1, 4],
+                        help='Connection counts to download with (default: 1 4)')
+    parser.add_argument('--bandwidth', type=float, default=0,
+                        help='Server bandwidth in MB/s shared by all connections (default: unlimited)')
+    parser.add_argument('--latency', type=float, default=0,
+                        help='Delay before every server response in ms (default: 0)')
+    parser.add_argument('--extract-fps', type=float, default=5, help='Frames extracted per second (default: 5)')
+    parser.add_argument('--format', default='jpg', help='Frame format (default: jpg)')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per measurement; the fastest counts (default: 3)')
+    parser.add_argument('--clip-dir', type=Path,
+                        help='Keep rendered clips here and reuse them on later runs (default: render afresh)')
+    parser.add_argument('--output', type=Path,
+                        help='Where to write the JSON results (default: benchmark-<commit>.json)')
+    parser.add_argument('--compare', nargs=2, metavar=('BASE', 'NEW'), type=Path,
+                        help='Compare two result files instead of running the benchmarks')
+    args = parser.parse_args()
+
+    if args.compare:
+        compare_results(*args.compare)
+        return
+
+    encoders = available_encoders()
+    codecs = [codec for codec in args.codecs if CODECS[codec][0] in encoders]
+    for codec in sorted(set(args.codecs) - set(codecs)):
+        print(f"Skipping {codec}: ffmpeg has no {CODECS[codec][0]} encoder")
+    if not codecs:
+        sys.exit("No codec left to benchmark")
+
+    commit, dirty = git_commit()
+    script = load_script()
+    work_dir = Path(tempfile.mkdtemp(prefix='suite-bench-'))
+    clip_dir = args.clip_dir.expanduser() if args.clip_dir else work_dir / 'clips'
+    clip_dir.mkdir(parents=True, exist_ok=True)
+    server = None
+    results = []
+
+    try:
+        clips = []
+        for codec in codecs:
+            for size in args.sizes:
+                for duration in args.durations:
+                    name = f'{codec}-{size}-{duration:g}s-{args.fps}fps-{args.bitrate}'
+                    path = clip_dir / f'{name}.{CODECS[codec][1]}'
+                    if not path.exists():
+                        print(f"Rendering {name}...")
+                        partial = path.with_name('.' + path.name)
+                        encoder, _, encoder_args = CODECS[codec]
+                        make_clip(partial, duration, size, args.fps, ['-c:v', encoder, *encoder_args],
+                                  gop=args.fps * 2, bitrate=args.bitrate)
+                        partial.rename(path)
+                    sha256 = file_sha256(path)
+                    clips.append({'name': name, 'path': path, 'codec': codec, 'size': size, 'duration': duration,
+                                  'fps': args.fps, 'bitrate': args.bitrate, 'sha256': sha256})
+
+        files = {f"/{clip['path'].name}": (clip['path'], f'"{clip["sha256"][:16]}"') for clip in clips}
+        throttle = Throttle(args.bandwidth * 1024 * 1024)
+        server = serve_files(files, throttle, args.latency / 1000)
+        base_url = f'http://127.0.0.1:{server.server_port}'
+        bandwidth = f'{args.bandwidth:g} MB/s' if args.bandwidth else 'unlimited bandwidth'
+        print(f"Serving {len(clips)} clips at {base_url} ({bandwidth}, {args.latency:g} ms latency)")
+
+        for clip in clips:
+            print(f"Benchmarking {clip['name']}...")
+            run_dir = work_dir / 'run'
+            run_dir.mkdir()
+            # Silence the progress lines of the script
+            with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+                metrics, errors = measure_clip(script, clip, f"{base_url}/{clip['path'].name}", args, run_dir)
+            shutil.rmtree(run_dir, ignore_errors=True)
+            results.append({
+                'clip': {**{key: clip[key] for key in ('name', 'codec', 'size', 'duration', 'fps', 'bitrate', 'sha256')},
+                         'bytes': clip['path'].stat().st_size},
+                'metrics': metrics,
+                'errors': errors,
+            })
+    finally:
+        if server:
+            server.shutdown()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    document = {
+        'schema': SCHEMA_VERSION,
+        'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'commit': commit,
+        'dirty': dirty,
+        'host': host_info(),
+        'settings': {
+            'fps': args.fps,
+            'connections': args.connections,
+            'bandwidth_mb_per_s': args.bandwidth,
+            'latency_ms': args.latency,
+            'extract_fps': args.extract_fps,
+            'format': args.format,
+            'repeat': args.repeat,
+        },
+        'results': results,
+    }
+    output = args.output or Path(f"benchmark-{(commit or 'worktree')[:12]}.json")
+    output.write_text(json.dumps(document, indent=2) + '\n')
+
+    print_results(results)
+    print(f"\nResults written to {output}")
+    sys.exit(1 if any('download' in step or step == 'extract' for r in results for step in r['errors']) else 0)
+
+
+if __name__ == '__main__':
+    main()
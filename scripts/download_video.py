@@ -7,18 +7,47 @@ Part of the video-viewing and text-animation-copier skills.
 """
 
 import argparse
+import json
 import os
+import shutil
+import socket
+import sqlite3
 import sys
 import subprocess
+import tempfile
+import time
+from contextlib import redirect_stdout
+from functools import partial
 from pathlib import Path
 from urllib.parse import urlparse
 
-try:
-    import requests
-except ImportError:
-    print("Installing required package: requests")
-    subprocess.check_call([sys.executable, "-m", "pip", "install", "requests"])
-    import requests
+
+# The code this script shares with the video-viewing skill's copy lives in the
+# skill's folder, so that the skill stays self-contained
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'claude-skills' / 'video-viewing' / 'scripts'))
+
+import video_common
+from video_common import (
+    requests, DEFAULT_CONNECTIONS, DEFAULT_CACHE_DIR, DEFAULT_LIBRARY_INDEX, DEFAULT_CACHE_SIZE_MB,
+    DEFAULT_DAEMON_IDLE_MINUTES, DEFAULT_DAEMON_WORKERS, FRAME_FORMATS, DEFAULT_ANALYSIS_WIDTH, DEFAULT_TARGET_FPS,
+    DEFAULT_MIN_HOLD, DEFAULT_MIN_MOTION, DEFAULT_COMPARE_WIDTH, SSIM_WINDOW, DEFAULT_WORST_FRAMES, PHASH_SIZE,
+    DEFAULT_DEDUP_DISTANCE, DEFAULT_FRAME_STORE_SIZE_MB, FRAME_ARCHIVE_NAME, DEFAULT_TILE_WIDTH, DEFAULT_JOBS,
+    DEFAULT_CONNECTIONS_PER_HOST, LIBRARY_COLUMNS, RangeNotSupportedError, ProbeError, TRACE, own_peak_rss,
+    trace_connection, cache_stats, cache_prune, video_filename, fetch_video, fetch_clip, is_streamable, fetch_head,
+    has_pending_download, tee_download, request_first_byte, probe_video, invalidate_probes, prune_probes, probe_url,
+    parse_time, parse_time_range, image_encoder_args, frame_store_prune, write_contact_sheets, write_frame_archive,
+    export_frames, decode_frames, describe_frames, format_timing, analyze_motion, compare_videos, smart_timestamps,
+    query_library, scan_library, parse_area, parse_library_filter, parse_offset, parse_grid, parse_scale, parse_crop,
+    parse_sha256, parse_frame_numbers, parse_tile_layout, check_frame_options, resolve_time_window, read_url_list,
+    run_batch, script_identity, forward_to_daemon, serve,
+)
+
+# Unix socket the serve command listens on
+DEFAULT_DAEMON_SOCKET = Path(os.environ.get('VIDEO_DAEMON_SOCKET', Path(DEFAULT_CACHE_DIR) / 'daemon.sock'))
+
+DEFAULT_FRAME_FORMAT = 'png'
+# Frame budget of --smart sampling
+DEFAULT_SMART_FRAMES = 20
 
 
 def get_output_dir(custom_dir=None):
@@ -33,78 +62,86 @@ def get_output_dir(custom_dir=None):
     return Path.cwd()
 
 
-def download_video(url, output_dir, filename=None):
-    """Download video from URL with progress indication."""
+def download_video(url, output_dir, filename=None, connections=DEFAULT_CONNECTIONS,
+                   cache_dir=None, cache_size_mb=DEFAULT_CACHE_SIZE_MB, expected_size=None, expected_sha256=None,
+                   tee=None):
+    """Download video from URL with progress indication, exiting on failure (see fetch_video())."""
     try:
-        # Get filename from URL if not specified
-        if not filename:
-            parsed_url = urlparse(url)
-            filename = Path(parsed_url.path).name
-            if not filename or '.' not in filename:
-                filename = "video.mp4"
+        return Path(fetch_video(url, output_dir, filename, connections, cache_dir, cache_size_mb,
+                           expected_size=expected_size, expected_sha256=expected_sha256, tee=tee))
+
+    except KeyboardInterrupt:
+        print("\n✗ Download cancelled. Run the same command again to resume.")
+        sys.exit(1)
+    except Exception as e:
+        print(f"\n✗ Error downloading video: {e}")
+        sys.exit(1)
 
-        # Ensure proper extension
-        if not any(filename.endswith(ext) for ext in ['.mp4', '.webm', '.mkv', '.avi', '.mov', '.m4v', '.wmv', '.flv']):
-            filename += '.mp4'
 
-        output_path = output_dir / filename
+def stream_video(url, output_dir, consume, filename=None, cache_dir=None, cache_size_mb=DEFAULT_CACHE_SIZE_MB,
+                 expected_size=None, expected_sha256=None):
+    """Download a video while consume(video_path, source) decodes it, so frames come before the download ends.
 
-        print(f"Downloading video from: {url}")
-        print(f"Saving to: {output_path}")
+    The file is fetched in order over one connection and its bytes are teed
+    into a pipe that consume reads in a worker thread, e.g. by handing it to
+    extract_frames() as source; video_path is where the file will be once it
+    is complete. When the server honours byte ranges, the ffprobe data of
+    the video is read from the URL before the download starts.
 
-        # Download with streaming
-        response = requests.get(url, stream=True)
-        response.raise_for_status()
+    Returns (video_path, ffprobe data or None, consume's result). Returns None
+    without downloading when the file cannot be decoded as it arrives (an MP4
+    with its moov index at the end, another container) or when the cache or
+    an interrupted download already holds it, so the caller downloads and
+    decodes in turn. Raises on download errors like fetch_video().
+    """
+    output_path = output_dir / video_filename(url, filename)
+    if has_pending_download(url, output_path, cache_dir):
+        return None
+    try:
+        head, response = fetch_head(url)
+    except requests.exceptions.RequestException:
+        # The download reports the error
+        return None
+    if not is_streamable(head):
+        print("⚠ Only WebM and MP4 with its index at the start can be decoded while downloading; "
+              "extracting frames afterwards")
+        return None
 
-        total_size = int(response.headers.get('content-length', 0))
-        block_size = 8192
-        downloaded = 0
+    info = None
+    if response.status_code == 206:
+        try:
+            info = probe_url(url)
+            print_probe_info(info)
+        except FileNotFoundError:
+            print("⚠ ffprobe not found. Install ffmpeg to get video information.")
+        except (ProbeError, subprocess.TimeoutExpired, json.JSONDecodeError) as e:
+            print(f"⚠ Could not probe the remote file: {e}")
 
-        with open(output_path, 'wb') as f:
-            for chunk in response.iter_content(chunk_size=block_size):
-                if chunk:
-                    f.write(chunk)
-                    downloaded += len(chunk)
+    video_path, result = tee_download(url, output_dir, lambda source: consume(output_path, source), filename,
+                                      cache_dir, cache_size_mb, expected_size=expected_size,
+                                      expected_sha256=expected_sha256)
+    return Path(video_path), info, result
 
-                    if total_size > 0:
-                        percent = (downloaded / total_size) * 100
-                        print(f"\rProgress: {percent:.1f}% ({downloaded}/{total_size} bytes)", end='')
 
-        print(f"\n✓ Video downloaded successfully: {output_path}")
-        return output_path
+def print_probe_info(data):
+    """Print the main video stream details of ffprobe data."""
+    # Extract video stream info
+    video_stream = next((s for s in data['streams'] if s['codec_type'] == 'video'), None)
 
-    except Exception as e:
-        print(f"✗ Error downloading video: {e}")
-        sys.exit(1)
+    if video_stream:
+        print("\n📹 Video Information:")
+        print(f"  Duration: {float(data['format'].get('duration', 0)):.2f} seconds")
+        print(f"  Resolution: {video_stream.get('width')}x{video_stream.get('height')}")
+        print(f"  Codec: {video_stream.get('codec_name')}")
+        print(f"  Frame Rate: {video_stream.get('r_frame_rate')}")
+        print(f"  File Size: {int(data['format'].get('size', 0)) / (1024*1024):.2f} MB")
 
 
-def get_video_info(video_path):
-    """Get video metadata using ffprobe."""
+def get_video_info(video_path, refresh=False):
+    """Get video metadata using ffprobe (cached while the file is unchanged)."""
     try:
-        cmd = [
-            'ffprobe',
-            '-v', 'quiet',
-            '-print_format', 'json',
-            '-show_format',
-            '-show_streams',
-            str(video_path)
-        ]
-
-        result = subprocess.run(cmd, capture_output=True, text=True, check=True)
-        import json
-        data = json.loads(result.stdout)
-
-        # Extract video stream info
-        video_stream = next((s for s in data['streams'] if s['codec_type'] == 'video'), None)
-
-        if video_stream:
-            print("\n📹 Video Information:")
-            print(f"  Duration: {float(data['format'].get('duration', 0)):.2f} seconds")
-            print(f"  Resolution: {video_stream.get('width')}x{video_stream.get('height')}")
-            print(f"  Codec: {video_stream.get('codec_name')}")
-            print(f"  Frame Rate: {video_stream.get('r_frame_rate')}")
-            print(f"  File Size: {int(data['format'].get('size', 0)) / (1024*1024):.2f} MB")
-
+        data = probe_video(video_path, refresh)
+        print_probe_info(data)
         return data
 
     except FileNotFoundError:
@@ -115,33 +152,181 @@ def get_video_info(video_path):
         return None
 
 
-def extract_frames(video_path, output_dir, fps=1):
-    """Extract frames from video at specified FPS."""
+def print_header_info(url, response):
+    """Print what the response headers tell about a remote file."""
+    content_range = response.headers.get('content-range', '')
+    if response.status_code == 206 and '/' in content_range:
+        size = content_range.rsplit('/', 1)[1]
+    else:
+        size = response.headers.get('content-length')
+
+    print("\n📄 File Information:")
+    print(f"  File: {Path(urlparse(url).path).name or 'unknown'}")
+    print(f"  Type: {response.headers.get('content-type', 'unknown')}")
+    if size and size.isdigit():
+        print(f"  File Size: {int(size) / (1024*1024):.2f} MB")
+    else:
+        print("  File Size: unknown")
+
+
+def get_url_info(url):
+    """Show video metadata for a URL without downloading the file.
+
+    Servers without range support only get the header summary, since ffprobe
+    would otherwise have to read the file up to its index. Raises when the
+    URL cannot be fetched.
+    """
+    print(f"Fetching video information from: {url}")
+
+    trace_connection(url)
+    with TRACE.span('ttfb', 'network', url=url):
+        response = request_first_byte(url)
+
+    if response.status_code == 206:
+        try:
+            data = probe_url(response.url)
+            print_probe_info(data)
+            return data
+        except FileNotFoundError:
+            print("⚠ ffprobe not found. Install ffmpeg to get video information.")
+        except (ProbeError, subprocess.TimeoutExpired, json.JSONDecodeError) as e:
+            print(f"⚠ Could not probe the remote file: {e}")
+    else:
+        print("⚠ Server does not support range requests; showing header information only.")
+
+    print_header_info(url, response)
+    return None
+
+
+def extract_frames(video_path, output_dir, fps=1, start=None, end=None, offset=0, smart=None, dedup=None,
+                   contact_sheet=None, area=None, tile_width=DEFAULT_TILE_WIDTH,
+                   scale=None, crop=None, image_format=DEFAULT_FRAME_FORMAT, quality=None, jobs=1,
+                   frame_store=None, frame_store_size_mb=DEFAULT_FRAME_STORE_SIZE_MB, pack=False, source=None):
+    """Extract frames from video at specified FPS, optionally only between start and end seconds.
+
+    Writes manifest.json next to the frames, mapping each file to its source timestamp.
+    offset is the source time at which video_path begins, for clips cut out of a longer
+    video; start and end are always source times. smart=N replaces fixed-fps sampling
+    with at most N frames placed where the picture changes (see smart_timestamps()).
+    dedup=D drops frames within D hash bits of the last frame written (see dedup_frames());
+    the manifest maps each dropped timestamp to the frame that stands in for it.
+    contact_sheet=(cols, rows) tiles the same frames into sheet-NNN.png mosaics instead
+    (see write_contact_sheets()), optionally cropped to area. scale=(width, height) and
+    crop=(x, y, width, height) are applied while decoding (see iter_frames()), and frames
+    are written as image_format ('png', 'jpg', 'webp' or 'raw') at quality 1-100.
+    jobs > 1 decodes that many keyframe-aligned segments at once in worker processes
+    (see extract_frames_parallel()), with the same files and manifest as one decoder.
+    frame_store is a directory where frames are kept for later runs on the same video;
+    only the frames it lacks are decoded (see stored_frames()). pack=True writes the
+    frames into a single FRAME_ARCHIVE_NAME archive (see write_frame_archive())
+    instead of separate files; they are rendered in a local scratch directory first.
+    source is a pipe of the video's bytes to decode in one pass while video_path is
+    still being downloaded (see stream_video()); it cannot be combined with smart,
+    and it skips the frame store and jobs, which need the whole file.
+    """
+    scratch = None
     try:
         frames_dir = output_dir / f"{video_path.stem}_frames"
         frames_dir.mkdir(exist_ok=True)
+        images_dir = frames_dir
+        if pack:
+            images_dir = scratch = Path(tempfile.mkdtemp(prefix='frames-'))
 
-        print(f"\n🎞️  Extracting frames at {fps} fps...")
+        window = ""
+        if start is not None or end is not None:
+            window = f" from {start or 0:.2f}s to {f'{end:.2f}s' if end is not None else 'end'}"
+        sheets = f" into {contact_sheet[0]}x{contact_sheet[1]} contact sheets" if contact_sheet else ""
+        if smart:
+            print(f"\n🎞️  Extracting up to {smart} frames where the picture changes{window}{sheets}...")
+        else:
+            print(f"\n🎞️  Extracting frames at {fps} fps{window}{sheets}...")
         print(f"  Output directory: {frames_dir}")
 
-        cmd = [
-            'ffmpeg',
-            '-i', str(video_path),
-            '-vf', f'fps={fps}',
-            '-y',  # Overwrite output files
-            str(frames_dir / 'frame-%04d.png')
-        ]
-
-        result = subprocess.run(cmd, capture_output=True, text=True)
-
-        if result.returncode == 0:
-            # Count extracted frames
-            frame_count = len(list(frames_dir.glob('frame-*.png')))
-            print(f"✓ Extracted {frame_count} frames to: {frames_dir}")
-            return frames_dir
+        # Decode in file time; the clip of a longer video begins at offset
+        first = start if start is not None else offset
+        file_end = end - offset if end is not None else None
+        phases = None
+        sampling = {'fps': fps, 'start': first - offset, 'end': file_end}
+        if smart:
+            picked, phases = smart_timestamps(video_path, smart, first - offset, file_end)
+            transitions = sum(phase['kind'] == 'motion' for phase in phases)
+            print(f"  Found {transitions} transitions and {len(phases) - transitions} holds")
+            sampling = {'start': picked[0], 'timestamps': picked} if picked else None
+
+        dropped = []
+        frame_shape = []
+        if contact_sheet:
+            cols, rows = contact_sheet
+            times = write_contact_sheets(
+                video_path, str(frames_dir / f'sheet-%03d.{image_format}'), contact_sheet, area=area,
+                tile_width=tile_width, label_offset=offset, encoder_args=image_encoder_args(image_format, quality),
+                source=source, **sampling
+            ) if sampling else []
+            # Tiles fill each sheet row by row
+            frames = [
+                {
+                    'file': f'sheet-{n // (cols * rows) + 1:03d}.{image_format}',
+                    'tile': n % (cols * rows),
+                    'timestamp': round(offset + timestamp, 6),
+                }
+                for n, timestamp in enumerate(times)
+            ]
+        elif sampling:
+            times, reused = decode_frames(
+                video_path, str(images_dir / f'frame-%04d.{image_format}'), scale, crop, image_format, quality, jobs,
+                frame_store, frame_store_size_mb, dedup, dropped, frame_shape, source, **sampling
+            )
+            if reused is not None:
+                print(f"  Reused {reused} frames from the frame store, decoded {len(times) - reused}")
+            elif jobs > 1 and dedup is None and not source:
+                print(f"  Decoded in up to {jobs} parallel segments")
         else:
-            print(f"✗ Error extracting frames: {result.stderr}")
-            return None
+            times = []
+        if pack:
+            # Frames are numbered from 1 in the manifest, like frame-NNNN files
+            frames = [
+                {'frame': n, 'timestamp': round(offset + timestamp, 6)}
+                for n, timestamp in enumerate(times, start=1)
+            ]
+            write_frame_archive(
+                [images_dir / f'frame-{n:04d}.{image_format}' for n in range(1, len(times) + 1)],
+                [frame['timestamp'] for frame in frames], frames_dir / FRAME_ARCHIVE_NAME, image_format, frame_shape
+            )
+        elif not contact_sheet:
+            frames = [
+                {'file': f'frame-{n:04d}.{image_format}', 'timestamp': round(offset + timestamp, 6)}
+                for n, timestamp in enumerate(times, start=1)
+            ]
+        manifest = {
+            'video': str(video_path),
+            'fps': fps,
+            'start': start,
+            'end': end,
+            'frames': frames,
+        }
+        if contact_sheet:
+            manifest['contact_sheet'] = f'{cols}x{rows}'
+        if pack:
+            manifest['archive'] = FRAME_ARCHIVE_NAME
+            manifest['format'] = image_format
+        describe_frames(manifest, image_format, frame_shape, phases, offset)
+        if dedup is not None:
+            manifest['dedup_distance'] = dedup
+            manifest['duplicates'] = [
+                {'timestamp': round(offset + timestamp, 6), 'same_as': frames[kept]['frame' if pack else 'file']}
+                for timestamp, kept in dropped
+            ]
+            print(f"  Skipped {len(dropped)} frames that repeat the previous frame")
+        (frames_dir / 'manifest.json').write_text(json.dumps(manifest, indent=2))
+
+        if contact_sheet:
+            count = -(-len(frames) // (cols * rows))
+            print(f"✓ Tiled {len(frames)} frames into {count} contact sheets in: {frames_dir}")
+        elif pack:
+            print(f"✓ Packed {len(frames)} frames into: {frames_dir / FRAME_ARCHIVE_NAME}")
+        else:
+            print(f"✓ Extracted {len(frames)} frames to: {frames_dir}")
+        return frames_dir
 
     except FileNotFoundError:
         print("✗ ffmpeg not found. Install ffmpeg to extract frames.")
@@ -151,9 +336,611 @@ def extract_frames(video_path, output_dir, fps=1):
     except Exception as e:
         print(f"✗ Error extracting frames: {e}")
         return None
+    finally:
+        if scratch:
+            shutil.rmtree(scratch, ignore_errors=True)
+
+
+def process_video(video_path, output_dir, frames=False, fps=1, start=None, end=None, smart=None,
+                  refresh_probe=False, dedup=None, **frame_options):
+    """Probe a downloaded video and optionally extract frames (or contact sheets) from it, raising if that fails."""
+    video_path = Path(video_path)
+    info = get_video_info(video_path, refresh_probe)
+    frames_dir = None
+    if frames:
+        frames_dir = extract_frames(video_path, output_dir, fps, start, end, smart=smart, dedup=dedup, **frame_options)
+        if frames_dir is None:
+            raise RuntimeError('frame extraction failed')
+    return info, frames_dir
+
+
+def batch_main(argv):
+    """Download and analyze a list of URLs (`download_video.py batch ...`)."""
+    parser = argparse.ArgumentParser(
+        prog='download_video.py batch',
+        description='Download and analyze many videos concurrently'
+    )
+    parser.add_argument('source', help="File with one URL per line, or '-' to read from stdin")
+    add_download_arguments(parser)
+    parser.add_argument('-j', '--jobs', type=int, default=DEFAULT_JOBS,
+                        help=f'Videos downloaded at the same time (default: {DEFAULT_JOBS})')
+    parser.add_argument('--per-host', type=int, default=DEFAULT_CONNECTIONS_PER_HOST,
+                        help=f'Maximum connections to a single host (default: {DEFAULT_CONNECTIONS_PER_HOST})')
+
+    args = parser.parse_args(argv)
+    resolve_time_window(parser, args)
+    check_frame_options(parser, args)
+
+    urls = read_url_list(args.source)
+    if not urls:
+        print("✗ No URLs given")
+        sys.exit(1)
+
+    output_dir = get_output_dir(args.output)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    print(f"Processing {len(urls)} videos with {args.jobs} parallel jobs...")
+
+    try:
+        process = partial(
+            process_video,
+            output_dir=output_dir,
+            frames=args.frames,
+            fps=args.fps,
+            start=args.start,
+            end=args.end,
+            smart=args.smart,
+            refresh_probe=args.refresh_probe,
+            dedup=args.dedup,
+            **frame_options(args),
+        )
+        results = run_batch(
+            urls, output_dir, process,
+            jobs=max(1, args.jobs),
+            max_per_host=max(1, args.per_host),
+            connections=args.connections,
+            cache_dir=None if args.no_cache else args.cache_dir,
+            cache_size_mb=args.cache_size,
+        )
+    except KeyboardInterrupt:
+        print("\n✗ Batch cancelled. Run the same command again to resume.")
+        sys.exit(1)
+
+    print("\n📋 Batch Summary:")
+    for result in results:
+        if result['ok']:
+            print(f"  ✓ {result['path']}")
+        else:
+            print(f"  ✗ {result['url']}: {result.get('error', 'unknown error')}")
+
+    failed = sum(1 for result in results if not result['ok'])
+    print(f"\n{len(results) - failed} succeeded, {failed} failed")
+    if failed:
+        sys.exit(1)
+
+
+def add_download_arguments(parser):
+    """Add the options shared by single and batch downloads."""
+    parser.add_argument('-o', '--output', help='Output directory (default: /mnt/user-data/outputs or current directory)')
+    parser.add_argument('-f', '--frames', action='store_true', help='Extract frames from video')
+    parser.add_argument('--fps', type=float, default=1.0, help='Frames per second to extract (default: 1)')
+    parser.add_argument('--smart', type=int, nargs='?', const=DEFAULT_SMART_FRAMES, metavar='MAX_FRAMES',
+                        help=f'Instead of --fps, place up to MAX_FRAMES frames where the picture changes '
+                             f'(default: {DEFAULT_SMART_FRAMES})')
+    parser.add_argument('--dedup', type=int, nargs='?', const=DEFAULT_DEDUP_DISTANCE, metavar='MAX_DISTANCE',
+                        help=f'Skip frames that look like the last frame kept, i.e. at most MAX_DISTANCE of '
+                             f'{PHASH_SIZE * PHASH_SIZE} hash bits differ (default: {DEFAULT_DEDUP_DISTANCE})')
+    parser.add_argument('--contact-sheet', type=parse_tile_layout, metavar='COLSxROWS',
+                        help='Tile the frames into labelled contact sheets of COLSxROWS frames each')
+    parser.add_argument('--area', type=parse_area, metavar='LEFT,TOP,WIDTH,HEIGHT',
+                        help='Crop contact sheet tiles to this part of the frame, as fractions '
+                             '(e.g. 0,0.6,1,0.4 for a lower third)')
+    parser.add_argument('--tile-width', type=int, default=DEFAULT_TILE_WIDTH,
+                        help=f'Width of one contact sheet tile in pixels (default: {DEFAULT_TILE_WIDTH})')
+    parser.add_argument('--scale', type=parse_scale, metavar='WIDTH[:HEIGHT]',
+                        help='Scale frames while decoding, -1 keeping the aspect ratio (e.g. 640 or -1:360)')
+    parser.add_argument('--crop', type=parse_crop, metavar='X:Y:WIDTH:HEIGHT',
+                        help='Crop frames to this rectangle of the source, in pixels, before scaling')
+    parser.add_argument('--format', choices=FRAME_FORMATS, default=DEFAULT_FRAME_FORMAT,
+                        help=f"Image format of the frames; 'raw' writes RGB pixels without encoding "
+                             f"(default: {DEFAULT_FRAME_FORMAT})")
+    parser.add_argument('--quality', type=int,
+                        help='Image quality from 1 to 100 for jpg/webp; for png, compression effort (lower is faster)')
+    parser.add_argument('--pack', action='store_true',
+                        help=f'Write the frames into one {FRAME_ARCHIVE_NAME} archive instead of separate files '
+                             f'(see the export command)')
+    parser.add_argument('--start', type=parse_time, help='Extract frames from this time (seconds, MM:SS or HH:MM:SS)')
+    parser.add_argument('--end', type=parse_time, help='Extract frames up to this time')
+    parser.add_argument('--range', type=parse_time_range, metavar='START-END',
+                        help='Shorthand for --start/--end, e.g. 00:07-00:13')
+    parser.add_argument('--connections', type=int, default=DEFAULT_CONNECTIONS,
+                        help=f'Parallel connections when the server supports byte ranges '
+                             f'(default: {DEFAULT_CONNECTIONS}, 1 disables)')
+    parser.add_argument('--no-cache', action='store_true', help='Always download, bypassing the local cache')
+    parser.add_argument('--cache-dir', type=Path, default=DEFAULT_CACHE_DIR,
+                        help=f'Download cache directory (default: {DEFAULT_CACHE_DIR})')
+    parser.add_argument('--cache-size', type=int, default=DEFAULT_CACHE_SIZE_MB,
+                        help=f'Download cache size limit in MB (default: {DEFAULT_CACHE_SIZE_MB})')
+    parser.add_argument('--refresh-probe', action='store_true',
+                        help='Re-run ffprobe instead of using cached video information')
+    parser.add_argument('--frame-store', action='store_true',
+                        help='Keep extracted frames in the frames directory of --cache-dir and reuse them when '
+                             'later runs ask for the same frames of the same video (default: always decode)')
+    parser.add_argument('--frame-store-size', type=int, default=DEFAULT_FRAME_STORE_SIZE_MB,
+                        help=f'Frame store size limit in MB (default: {DEFAULT_FRAME_STORE_SIZE_MB})')
+
+
+def frame_options(args):
+    """Collect the contact sheet, output format, frame store and archive options for extract_frames()."""
+    return {
+        'contact_sheet': args.contact_sheet,
+        'area': args.area,
+        'tile_width': args.tile_width,
+        'scale': args.scale,
+        'crop': args.crop,
+        'image_format': args.format,
+        'quality': args.quality,
+        'frame_store': args.cache_dir / 'frames' if args.frame_store else None,
+        'frame_store_size_mb': args.frame_store_size,
+        'pack': args.pack,
+    }
+
+
+def analyze_main(argv):
+    """Detect animation phases and print a Remotion TIMING table (`download_video.py analyze-motion ...`)."""
+    parser = argparse.ArgumentParser(
+        prog='download_video.py analyze-motion',
+        description='Detect motion and hold phases in a video and print them as a Remotion TIMING table',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  %(prog)s video.mp4 --range 00:07-00:13
+  %(prog)s "https://example.com/video.mp4" --area 0,0.6,1,0.4 --target-fps 60
+  %(prog)s video.mp4 --grid 3x3 --json -o timing.json
+        """
+    )
+    parser.add_argument('video', help='Video file or direct URL to analyze')
+    parser.add_argument('--start', type=parse_time, help='Analyze from this time (seconds, MM:SS or HH:MM:SS)')
+    parser.add_argument('--end', type=parse_time, help='Analyze up to this time')
+    parser.add_argument('--range', type=parse_time_range, metavar='START-END',
+                        help='Shorthand for --start/--end, e.g. 00:07-00:13')
+    parser.add_argument('--target-fps', type=int, default=DEFAULT_TARGET_FPS,
+                        help=f'Frame rate of the TIMING table (default: {DEFAULT_TARGET_FPS})')
+    parser.add_argument('--width', type=int, default=DEFAULT_ANALYSIS_WIDTH,
+                        help=f'Width frames are scaled to for analysis (default: {DEFAULT_ANALYSIS_WIDTH})')
+    parser.add_argument('--area', type=parse_area, metavar='LEFT,TOP,WIDTH,HEIGHT',
+                        help='Only measure this part of the frame, as fractions (e.g. 0,0.6,1,0.4 for the bottom 40%%)')
+    parser.add_argument('--grid', type=parse_grid, default=(1, 1), metavar='ROWSxCOLS',
+                        help='Also report motion per cell of this grid (e.g. 3x3)')
+    parser.add_argument('--threshold', type=float,
+                        help='Mean pixel change (0-255) that counts as motion (default: set from the noise floor)')
+    parser.add_argument('--min-hold', type=float, default=DEFAULT_MIN_HOLD,
+                        help=f'Shorter pauses inside an animation are ignored, '
+                             f'in seconds (default: {DEFAULT_MIN_HOLD})')
+    parser.add_argument('--min-motion', type=float, default=DEFAULT_MIN_MOTION,
+                        help=f'Shorter motion is treated as noise unless it is a scene cut, '
+                             f'in seconds (default: {DEFAULT_MIN_MOTION})')
+    parser.add_argument('--json', action='store_true', help='Print the full analysis as JSON')
+    parser.add_argument('-o', '--output', help='Write the result to this file instead of printing it')
+
+    args = parser.parse_args(argv)
+    resolve_time_window(parser, args)
+    if args.width < 1:
+        parser.error('--width must be at least 1')
+
+    # With --json, stdout carries nothing but the analysis
+    with redirect_stdout(sys.stderr if args.json else sys.stdout):
+        video_path = Path(args.video)
+        if args.video.startswith(('http://', 'https://')):
+            output_dir = get_output_dir()
+            output_dir.mkdir(parents=True, exist_ok=True)
+            video_path = download_video(args.video, output_dir, cache_dir=DEFAULT_CACHE_DIR)
+
+        print(f"\n📈 Analyzing motion in: {video_path}")
+        started = time.monotonic()
+        try:
+            report = analyze_motion(
+                video_path, args.start, args.end, args.target_fps, args.width,
+                args.grid, args.area, args.threshold, args.min_hold, args.min_motion,
+            )
+        except FileNotFoundError:
+            print("✗ ffmpeg not found. Install ffmpeg to analyze motion.")
+            sys.exit(1)
+        except (RuntimeError, ValueError) as e:
+            print(f"✗ Error analyzing motion: {e}")
+            sys.exit(1)
+        elapsed = time.monotonic() - started
+
+        seconds = report['end'] - report['start']
+        print(f"✓ Analyzed {report['frames_analyzed']} frames ({seconds:.2f}s of video) in {elapsed:.2f}s "
+              f"({seconds / elapsed:.1f}x realtime)")
+        for phase in report['phases']:
+            print(f"  {phase['kind']:<6} {phase['start']:7.2f}s - {phase['end']:7.2f}s  "
+                  f"frames {phase['start_frame']}-{phase['end_frame']}  peak {phase['peak_energy']}"
+                  + ''.join(f"  cut at {cut:.2f}s" for cut in phase['cuts']))
+
+    if args.json:
+        result = json.dumps(report, indent=2)
+    else:
+        result = format_timing(report['timing'], (
+            f"Detected in {video_path.name} "
+            f"({report['start']:.2f}s-{report['end']:.2f}s), in frames at {args.target_fps}fps"
+        ))
+
+    if args.output:
+        Path(args.output).write_text(result + '\n')
+        print(f"\n✓ Saved to: {args.output}")
+    else:
+        if not args.json:
+            print()
+        print(result)
+
+
+def compare_main(argv):
+    """Score a Remotion render against the reference video frame by frame (`download_video.py compare ...`)."""
+    parser = argparse.ArgumentParser(
+        prog='download_video.py compare',
+        description='Decode a reference video and a render side by side, score every render frame against '
+                    'the reference frame shown at the same time (PSNR, SSIM, difference inside an area), and '
+                    'save the score curve and the worst-matching frames',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  %(prog)s reference.mp4 out/lower-third-1.mp4 --offset 00:07
+  %(prog)s reference.mp4 out/text-animation-2.mp4 --offset 7.2 --area 0,0.6,1,0.4 --min-ssim 0.9
+  %(prog)s "https://example.com/video.mp4" out/text-animation-1.mp4 --ratio 0.5 --json
+        """
+    )
+    parser.add_argument('reference', help='Reference video file or direct URL')
+    parser.add_argument('render', help='Rendered video file')
+    parser.add_argument('--offset', type=parse_offset, default=0.0,
+                        help='Reference time the render starts at (seconds, MM:SS or HH:MM:SS, negative if '
+                             'the render starts earlier; default: 0)')
+    parser.add_argument('--ratio', type=float, default=1.0,
+                        help='Reference seconds per render second, e.g. 0.5 if the render plays the animation '
+                             'at half speed (default: 1)')
+    parser.add_argument('--fps', type=float, help='Compare this many render frames per second (default: every frame)')
+    parser.add_argument('--width', type=int, default=DEFAULT_COMPARE_WIDTH,
+                        help=f'Width both videos are scaled to, 0 for the render\'s own (default: {DEFAULT_COMPARE_WIDTH})')
+    parser.add_argument('--area', type=parse_area, metavar='LEFT,TOP,WIDTH,HEIGHT',
+                        help='Also measure the difference inside this part of the frame, as fractions '
+                             '(e.g. 0,0.6,1,0.4 for a lower third), and rank the worst frames by it')
+    parser.add_argument('--worst', type=int, default=DEFAULT_WORST_FRAMES,
+                        help=f'Worst-matching frames to save (default: {DEFAULT_WORST_FRAMES})')
+    parser.add_argument('-o', '--output',
+                        help='Directory for scores.csv and the worst frames (default: <render>_compare '
+                             'in the output directory)')
+    parser.add_argument('--min-ssim', type=float, metavar='SSIM',
+                        help='Exit with status 1 if the mean SSIM is below this (0-1)')
+    parser.add_argument('--json', action='store_true',
+                        help='Print the report as JSON on stdout; messages go to stderr')
+
+    args = parser.parse_args(argv)
+    if args.ratio <= 0:
+        parser.error('--ratio must be positive')
+    if args.fps is not None and args.fps <= 0:
+        parser.error('--fps must be positive')
+    if args.width < 0 or 0 < args.width < SSIM_WINDOW:
+        parser.error(f'--width must be 0 or at least {SSIM_WINDOW}')
+    if args.worst < 0:
+        parser.error('--worst must not be negative')
+
+    # With --json, stdout carries nothing but the report
+    with redirect_stdout(sys.stderr if args.json else sys.stdout):
+        reference = Path(args.reference)
+        if args.reference.startswith(('http://', 'https://')):
+            output_dir = get_output_dir()
+            output_dir.mkdir(parents=True, exist_ok=True)
+            reference = download_video(args.reference, output_dir, cache_dir=DEFAULT_CACHE_DIR)
+        render = Path(args.render)
+        output_dir = Path(args.output) if args.output else get_output_dir() / f'{render.stem}_compare'
+
+        print(f"\n🔬 Comparing {render} with {reference} (offset {args.offset:g}s, ratio {args.ratio:g})")
+        started = time.monotonic()
+        try:
+            report = compare_videos(reference, render, output_dir, args.offset, args.ratio, args.fps,
+                                    args.width or None, args.area, args.worst)
+        except FileNotFoundError:
+            print("✗ ffmpeg not found. Install ffmpeg to compare videos.")
+            sys.exit(1)
+        except (RuntimeError, ValueError) as e:
+            print(f"✗ Error comparing videos: {e}")
+            sys.exit(1)
+        elapsed = time.monotonic() - started
+
+        print(f"✓ Compared {report['frames']} frames in {elapsed:.2f}s ({report['frames'] / elapsed:.1f} frames/s)")
+        print(f"  PSNR: mean {report['psnr']['mean']:.2f} dB, min {report['psnr']['min']:.2f} dB")
+        print(f"  SSIM: mean {report['ssim']['mean']:.4f}, min {report['ssim']['min']:.4f}")
+        if report['area_diff']:
+            print(f"  Area difference: mean {report['area_diff']['mean']:.2f}, max {report['area_diff']['max']:.2f}")
+        if report['worst']:
+            print("  Worst frames (reference | render | difference):")
+        for frame in report['worst']:
+            detail = f", area difference {frame['area_diff']:.2f}" if frame['area_diff'] is not None else ''
+            print(f"    frame {frame['frame']} at {frame['render_time']:.2f}s (reference {frame['reference_time']:.2f}s): "
+                  f"SSIM {frame['ssim']:.4f}, PSNR {frame['psnr']:.2f} dB{detail} -> {frame['image']}")
+        print(f"✓ Scores saved to: {report['scores']}")
+
+        passed = args.min_ssim is None or report['ssim']['mean'] >= args.min_ssim
+        if not passed:
+            print(f"✗ Mean SSIM {report['ssim']['mean']:.4f} is below --min-ssim {args.min_ssim:g}")
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    if not passed:
+        sys.exit(1)
+
+
+def export_main(argv):
+    """Write frames of a packed frame archive out as images (`download_video.py export ...`)."""
+    parser = argparse.ArgumentParser(
+        prog='download_video.py export',
+        description=f'Write frames of a {FRAME_ARCHIVE_NAME} archive made with --pack out as image files',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog=f"""
+Examples:
+  %(prog)s video_frames/{FRAME_ARCHIVE_NAME} -o frames
+  %(prog)s video_frames/{FRAME_ARCHIVE_NAME} -o frames --frames 1-10,25
+  %(prog)s video_frames/{FRAME_ARCHIVE_NAME} -o frames --range 00:07-00:13 --format jpg
+"""
+    )
+    parser.add_argument('archive', type=Path, help=f'{FRAME_ARCHIVE_NAME} archive written by --pack')
+    parser.add_argument('-o', '--output', type=Path, required=True, help='Directory for the images')
+    parser.add_argument('--frames', type=parse_frame_numbers, metavar='N[-M],...',
+                        help='Export only these frames, numbered from 1 (e.g. 1-10,25)')
+    parser.add_argument('--start', type=parse_time, help='Export frames from this source time')
+    parser.add_argument('--end', type=parse_time, help='Export frames before this source time')
+    parser.add_argument('--range', type=parse_time_range, metavar='START-END',
+                        help='Shorthand for --start/--end, e.g. 00:07-00:13')
+    parser.add_argument('--format', choices=FRAME_FORMATS,
+                        help='Image format for frames of a raw archive (default: png); '
+                             'encoded frames are written as stored')
+    parser.add_argument('--quality', type=int, help='Image quality from 1 to 100 when encoding raw frames')
+    args = parser.parse_args(argv)
+    resolve_time_window(parser, args)
+    if args.quality is not None and not 1 <= args.quality <= 100:
+        parser.error('--quality must be between 1 and 100')
+
+    try:
+        paths = export_frames(args.archive, args.output, args.frames, args.start, args.end, args.format, args.quality)
+    except (OSError, ValueError, RuntimeError) as e:
+        print(f"✗ Error exporting frames: {e}")
+        sys.exit(1)
+    print(f"✓ Exported {len(paths)} frames to: {args.output}")
+
+
+def cache_main(argv):
+    """Inspect or prune the download cache (`download_video.py cache ...`)."""
+    parser = argparse.ArgumentParser(
+        prog='download_video.py cache',
+        description='Manage the local download cache'
+    )
+    parser.add_argument('--cache-dir', type=Path, default=DEFAULT_CACHE_DIR,
+                        help=f'Cache directory (default: {DEFAULT_CACHE_DIR})')
+    subparsers = parser.add_subparsers(dest='action', required=True)
+    subparsers.add_parser('stats', help='Show cache size and entry count')
+    prune_parser = subparsers.add_parser('prune', help='Evict least recently used videos')
+    prune_parser.add_argument('--max-size', type=int, default=DEFAULT_CACHE_SIZE_MB,
+                              help=f'Size to shrink the cache to, in MB (default: {DEFAULT_CACHE_SIZE_MB})')
+    prune_parser.add_argument('--frame-store-size', type=int, default=DEFAULT_FRAME_STORE_SIZE_MB,
+                              help=f'Size to shrink the frame store to, in MB (default: {DEFAULT_FRAME_STORE_SIZE_MB})')
+    prune_parser.add_argument('--all', action='store_true',
+                              help='Remove every cached video, stored frame and all cached video information')
+
+    args = parser.parse_args(argv)
+
+    if args.action == 'stats':
+        stats = cache_stats(args.cache_dir)
+        print("\n💾 Download Cache:")
+        print(f"  Directory: {stats['cache_dir']}")
+        print(f"  URLs: {stats['entries']}")
+        print(f"  Files: {stats['objects']}")
+        print(f"  Size: {stats['total_size'] / (1024*1024):.2f} MB (limit {DEFAULT_CACHE_SIZE_MB} MB)")
+        print(f"  Probed files: {stats['probes']}")
+        print(f"  Stored frames: {stats['frames']} from {stats['frame_videos']} videos, "
+              f"{stats['frames_size'] / (1024*1024):.2f} MB (limit {DEFAULT_FRAME_STORE_SIZE_MB} MB)")
+    else:
+        max_size = 0 if args.all else args.max_size * 1024 * 1024
+        removed, freed = cache_prune(args.cache_dir, max_size)
+        print(f"✓ Removed {removed} cached files ({freed / (1024*1024):.2f} MB freed)")
+        probes = invalidate_probes(args.cache_dir) if args.all else prune_probes(args.cache_dir)
+        print(f"✓ Removed {probes} cached video information entries")
+        max_frames = 0 if args.all else args.frame_store_size * 1024 * 1024
+        removed, freed = frame_store_prune(args.cache_dir / 'frames', max_frames)
+        print(f"✓ Removed {removed} stored frames ({freed / (1024*1024):.2f} MB freed)")
 
 
-def main():
+def scan_main(argv):
+    """Probe and index the video files under a directory (`download_video.py scan ...`)."""
+    parser = argparse.ArgumentParser(
+        prog='download_video.py scan',
+        description='Find the video files under a directory, probe and hash them in parallel, and keep the '
+                    'results in a SQLite index; files unchanged since the last scan are skipped',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  %(prog)s ~/Videos
+  %(prog)s ~/Videos --list --where "height>=1080" --where codec=h264
+  %(prog)s ~/Videos --list --json > library.json
+  sqlite3 ~/.cache/video-viewing/library.sqlite "SELECT path FROM videos WHERE duration > 600"
+        """
+    )
+    parser.add_argument('directory', help='Directory to scan, recursively')
+    parser.add_argument('--index', type=Path, default=DEFAULT_LIBRARY_INDEX,
+                        help=f'SQLite index to update (default: {DEFAULT_LIBRARY_INDEX})')
+    parser.add_argument('-j', '--jobs', type=int,
+                        help='Files probed and hashed at the same time, one ffprobe each (default: one per CPU)')
+    parser.add_argument('--rescan', action='store_true', help='Probe and hash every file again, even unchanged ones')
+    parser.add_argument('--list', action='store_true', help='Print the indexed videos under the directory')
+    parser.add_argument('--where', type=parse_library_filter, action='append', default=[],
+                        metavar='COLUMN OP VALUE',
+                        help=f'With --list, only the videos where a column ({", ".join(LIBRARY_COLUMNS)}) compares '
+                             f'to a value with =, !=, <, <=, >, >= or ~ (contains), e.g. "height>=1080"; '
+                             f'repeat to combine')
+    parser.add_argument('--json', action='store_true', help='With --list, print the videos as JSON')
+
+    args = parser.parse_args(argv)
+    if args.jobs is not None and args.jobs < 1:
+        parser.error('--jobs must be at least 1')
+    if (args.where or args.json) and not args.list:
+        parser.error('--where and --json need --list')
+    if not os.path.isdir(args.directory):
+        print(f"✗ Not a directory: {args.directory}")
+        sys.exit(1)
+    if not shutil.which('ffprobe'):
+        print("✗ ffprobe not found. Install ffmpeg to scan videos.")
+        sys.exit(1)
+
+    # With --json, stdout carries nothing but the video list
+    with redirect_stdout(sys.stderr if args.json else sys.stdout):
+        print(f"🔍 Scanning {args.directory}...")
+        try:
+            scanned, unchanged, removed, failed = scan_library(args.directory, args.index, args.jobs, args.rescan)
+        except KeyboardInterrupt:
+            print("\n✗ Scan cancelled. Run the same command again to continue.")
+            sys.exit(1)
+        print(f"✓ Indexed {scanned} files ({unchanged} unchanged, {removed} removed, {failed} unreadable) "
+              f"in {args.index}")
+
+    if not args.list:
+        return
+    try:
+        videos = query_library(args.index, args.directory, args.where)
+    except sqlite3.Error as e:
+        print(f"✗ Could not read the index {args.index}: {e}")
+        sys.exit(1)
+    if args.json:
+        print(json.dumps(videos, indent=2))
+        return
+    for video in videos:
+        if video['error']:
+            print(f"  ✗ {video['path']}: {video['error']}")
+            continue
+        fps = f"{video['fps']:.3f}".rstrip('0').rstrip('.') if video['fps'] else '?'
+        print(f"  {video['path']}  {video['duration'] or 0:.2f}s  {video['width']}x{video['height']}  "
+              f"{video['codec']}  {fps} fps  {video['size'] / (1024 * 1024):.1f} MB")
+    print(f"{len(videos)} videos")
+
+
+def serve_main(argv):
+    """Keep a warm process that runs the commands of later invocations (`download_video.py serve`)."""
+
+    parser = argparse.ArgumentParser(
+        prog='download_video.py serve',
+        description='Run commands sent by later invocations of this script in one warm process: they share '
+                    'a keep-alive HTTP session, the ffprobe results and a pool of frame extraction processes'
+    )
+    parser.add_argument('--socket', type=Path, default=DEFAULT_DAEMON_SOCKET,
+                        help=f'Unix socket to listen on (default: {DEFAULT_DAEMON_SOCKET}, or $VIDEO_DAEMON_SOCKET)')
+    parser.add_argument('--idle-timeout', type=float, default=DEFAULT_DAEMON_IDLE_MINUTES,
+                        help=f'Exit after this many minutes without a command, 0 for never '
+                             f'(default: {DEFAULT_DAEMON_IDLE_MINUTES})')
+    parser.add_argument('--max-per-host', type=int, default=DEFAULT_CONNECTIONS_PER_HOST,
+                        help=f'Connections kept open to each host (default: {DEFAULT_CONNECTIONS_PER_HOST})')
+    parser.add_argument('--workers', type=int, default=max(os.cpu_count() or 1, DEFAULT_DAEMON_WORKERS),
+                        help='Frame extraction processes kept running; commands with a larger --jobs start their '
+                             f'own (default: the CPU count, at least {DEFAULT_DAEMON_WORKERS})')
+    args = parser.parse_args(argv)
+    if args.workers < 1:
+        parser.error('--workers must be at least 1')
+
+    if not hasattr(socket, 'AF_UNIX'):
+        parser.error('serve needs Unix domain sockets, which this platform lacks')
+    serve(args.socket, main, script_identity(__file__), args.idle_timeout, args.max_per_host, args.workers)
+
+
+# Subcommands that replace the single-URL command line
+COMMANDS = {
+    'analyze-motion': analyze_main,
+    'batch': batch_main,
+    'cache': cache_main,
+    'compare': compare_main,
+    'export': export_main,
+    'scan': scan_main,
+    'serve': serve_main,
+}
+
+
+def run_pipeline(args, cache_dir, result):
+    """Download, probe and extract frames as the command line asks, filling in result for --json.
+
+    Raises on download errors like fetch_video(); returns False when frame extraction failed.
+    """
+    # Handle info-only mode
+    if args.info:
+        with TRACE.span('probe', 'stage'):
+            result['info'] = get_url_info(args.url)
+        return True
+
+    # Prepare output directory
+    output_dir = get_output_dir(args.output)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    def extract(video_path, source=None):
+        with TRACE.span('extract', 'stage'):
+            return extract_frames(
+                video_path, output_dir, args.fps, args.start, args.end, offset, args.smart, args.dedup,
+                jobs=args.jobs, source=source, **frame_options(args)
+            )
+
+    # Download only the requested window, or the whole video, extracting frames
+    # from its bytes as they arrive with --stream
+    video_path = None
+    info = None
+    frames_dir = None
+    offset = 0
+    with TRACE.span('download', 'stage'):
+        if args.partial:
+            try:
+                video_path, offset = fetch_clip(args.url, output_dir, args.start, args.end, args.name)
+                video_path = Path(video_path)
+            except RangeNotSupportedError:
+                print("⚠ Server does not support range requests; downloading the whole video instead.")
+        elif args.stream:
+            streamed = stream_video(args.url, output_dir, extract, args.name, cache_dir, args.cache_size,
+                                    args.expected_size, args.expected_sha256)
+            if streamed:
+                video_path, info, frames_dir = streamed
+                if frames_dir is None:
+                    print("⚠ Extracting frames from the downloaded file instead")
+        if video_path is None:
+            video_path = Path(fetch_video(args.url, output_dir, args.name, args.connections, cache_dir,
+                                          args.cache_size, expected_size=args.expected_size,
+                                          expected_sha256=args.expected_sha256))
+    result['video'] = {'path': str(video_path), 'size': video_path.stat().st_size}
+
+    # Get video info, unless it was read from the URL before a streamed download
+    if info is None:
+        with TRACE.span('probe', 'stage'):
+            info = get_video_info(video_path, args.refresh_probe)
+    result['info'] = info
+
+    # Extract frames if requested
+    if args.frames:
+        if frames_dir is None:
+            frames_dir = extract(video_path)
+        if frames_dir is None:
+            return False
+        manifest_path = frames_dir / 'manifest.json'
+        result['frames'] = {
+            'dir': str(frames_dir),
+            'manifest': str(manifest_path),
+            'count': len(json.loads(manifest_path.read_text())['frames']),
+        }
+    return True
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    # Hand the command to a warm daemon when one is running; a daemon never forwards to itself
+    if argv[:1] != ['serve'] and video_common.SHARED_SESSION is None:
+        code = forward_to_daemon(argv, __file__, DEFAULT_DAEMON_SOCKET)
+        if code is not None:
+            sys.exit(code)
+
+    if argv and argv[0] in COMMANDS:
+        COMMANDS[argv[0]](argv[1:])
+        return
+
     parser = argparse.ArgumentParser(
         description='Download and analyze video files from direct URLs',
         formatter_class=argparse.RawDescriptionHelpFormatter,
@@ -170,39 +957,142 @@ Examples:
 
   # Custom output directory and filename
   %(prog)s "https://example.com/video.mp4" -o /tmp -n my_video
+
+  # Download over 8 parallel connections
+  %(prog)s "https://example.com/video.mp4" --connections 8
+
+  # Fail unless the download has this SHA-256
+  %(prog)s "https://example.com/video.mp4" --expected-sha256 9f86d081884c7d65...
+
+  # Print a JSON result for a job runner and write a trace of where the time went
+  %(prog)s "https://example.com/video.mp4" -f --json --trace trace.json
+
+  # Bypass the download cache, or inspect and prune it
+  %(prog)s "https://example.com/video.mp4" --no-cache
+  %(prog)s cache stats
+  %(prog)s cache prune --max-size 500
+
+  # Extract 2 frames per second from 00:07 to 00:13 only
+  %(prog)s "https://example.com/video.mp4" -f --fps 2 --range 00:07-00:13
+
+  # Same, but download only that part of the video
+  %(prog)s "https://example.com/video.mp4" -f --fps 2 --range 00:07-00:13 --partial
+
+  # Start extracting frames while the video is still downloading
+  %(prog)s "https://example.com/video.webm" -f --stream
+
+  # Extract up to 20 frames around the transitions instead of 1 per second
+  %(prog)s "https://example.com/video.mp4" -f --smart 20
+
+  # Extract at the source frame rate, skipping frames that repeat the previous one
+  %(prog)s "https://example.com/video.mp4" -f --fps 30 --dedup
+
+  # Review the lower third at 4 fps on 6x4 contact sheets instead of separate frames
+  %(prog)s "https://example.com/video.mp4" -f --fps 4 --contact-sheet 6x4 --area 0,0.6,1,0.4
+
+  # Write 640px-wide JPEG frames instead of full-resolution PNG
+  %(prog)s "https://example.com/video.mp4" -f --scale 640 --format jpg --quality 85
+
+  # Extract every source frame of a long video with 4 decoder processes
+  %(prog)s "https://example.com/video.mp4" -f --fps 30 --jobs 4
+
+  # Pack every source frame into one archive, then export frames 1-10 as images
+  %(prog)s "https://example.com/video.mp4" -f --fps 30 --pack
+  %(prog)s export video_frames/frames.pack -o frames --frames 1-10
+
+  # Download and analyze every URL listed in a file (or '-' for stdin)
+  %(prog)s batch urls.txt -f -j 8
+
+  # Detect animation phases and print a Remotion TIMING table
+  %(prog)s analyze-motion video.mp4 --range 00:07-00:13
+
+  # Score a render against the reference clip it recreates
+  %(prog)s compare reference.mp4 out/lower-third-1.mp4 --offset 00:07 --area 0,0.6,1,0.4
+
+  # Probe and index every video under a directory, then query the index
+  %(prog)s scan ~/Videos --list --where "height >= 1080"
+
+  # Keep a warm daemon; later invocations hand their commands to it
+  %(prog)s serve &
         '''
     )
 
     parser.add_argument('url', help='Direct URL to video file')
-    parser.add_argument('-o', '--output', help='Output directory (default: /mnt/user-data/outputs or current directory)')
     parser.add_argument('-n', '--name', help='Custom filename (without extension)')
-    parser.add_argument('-f', '--frames', action='store_true', help='Extract frames from video')
     parser.add_argument('-i', '--info', action='store_true', help='Get video information only (no download)')
-    parser.add_argument('--fps', type=float, default=1.0, help='Frames per second to extract (default: 1)')
+    parser.add_argument('--partial', action='store_true',
+                        help='Download only the --start/--end window as a small clip (needs server range support)')
+    parser.add_argument('--stream', action='store_true',
+                        help='Extract frames while the video downloads, over one connection, when its container '
+                             'allows (WebM, or MP4 with the index at the start); otherwise one after the other')
+    parser.add_argument('--jobs', type=int, default=1,
+                        help='Extract frames in this many keyframe-aligned segments at once, one process each '
+                             '(default: 1)')
+    parser.add_argument('--expected-sha256', type=parse_sha256, metavar='HEX',
+                        help='Fail unless the downloaded file has this SHA-256')
+    parser.add_argument('--expected-size', type=int, metavar='BYTES',
+                        help='Fail, as soon as the server or the data shows otherwise, unless the file has this size')
+    parser.add_argument('--json', action='store_true',
+                        help='Print a JSON result document with per-stage timings on stdout; messages go to stderr')
+    parser.add_argument('--trace', type=Path, metavar='FILE',
+                        help='Write the DNS, connect, transfer, write and ffmpeg/ffprobe spans of the run to FILE '
+                             'as Chrome trace-event JSON (chrome://tracing, ui.perfetto.dev)')
+    add_download_arguments(parser)
 
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
+    resolve_time_window(parser, args)
+    check_frame_options(parser, args)
+    if args.partial and args.start is None and args.end is None:
+        parser.error('--partial needs --start/--end or --range')
+    if args.partial and (args.expected_sha256 or args.expected_size is not None):
+        parser.error('--expected-sha256 and --expected-size cannot be combined with --partial')
+    if args.jobs < 1:
+        parser.error('--jobs must be at least 1')
+    if args.jobs > 1 and (args.dedup is not None or args.contact_sheet):
+        parser.error('--jobs cannot be combined with --dedup or --contact-sheet')
+    if args.stream and not args.frames:
+        parser.error('--stream needs -f')
+    if args.stream and (args.partial or args.smart or args.jobs > 1):
+        parser.error('--stream cannot be combined with --partial, --smart or --jobs')
+    cache_dir = None if args.no_cache else args.cache_dir
+    if args.json or args.trace:
+        TRACE.start()
 
-    # Prepare output directory
-    output_dir = get_output_dir(args.output)
-    output_dir.mkdir(parents=True, exist_ok=True)
-
-    # Handle info-only mode
-    if args.info:
-        # For info mode, we need to download temporarily
-        print("Fetching video information...")
-        temp_path = download_video(args.url, output_dir, args.name)
-        get_video_info(temp_path)
-        return
+    result = {'url': args.url}
+    completed = False
+    error = None
+    # With --json, stdout carries nothing but the result document
+    with redirect_stdout(sys.stderr if args.json else sys.stdout):
+        try:
+            completed = run_pipeline(args, cache_dir, result)
+        except KeyboardInterrupt:
+            error = "Download cancelled. Run the same command again to resume."
+        except requests.exceptions.RequestException as e:
+            action = 'fetching video information' if args.info else 'downloading video'
+            error = f"Error {action}: {e}"
+        except Exception as e:
+            error = f"Error: {e}"
+        if error:
+            print(f"\n✗ {error}")
+        if args.trace:
+            args.trace.write_text(json.dumps(TRACE.chrome_trace()))
+            print(f"Trace written to: {args.trace}")
 
-    # Download video
-    video_path = download_video(args.url, output_dir, args.name)
-
-    # Get video info
-    get_video_info(video_path)
-
-    # Extract frames if requested
-    if args.frames:
-        extract_frames(video_path, output_dir, args.fps)
+    if args.json:
+        ok = completed and error is None
+        document = {
+            'ok': ok,
+            'error': None if ok else error or 'Frames could not be extracted',
+            **result,
+            'seconds': time.perf_counter() - TRACE.origin,
+            'stages': TRACE.totals(),
+            'processes': TRACE.processes(),
+            'peak_rss': own_peak_rss(),
+        }
+        print(json.dumps(document, indent=2))
+        sys.exit(0 if ok else 1)
+    if error:
+        sys.exit(1)
 
 
 if __name__ == '__main__':
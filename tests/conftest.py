@@ -0,0 +1,48 @@
+"""Fixtures for the tests of scripts/download_video.py and the video-viewing skill's copy."""
+
+import shutil
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'experiments'))
+
+from _bench_common import SCRIPT, SKILL_SCRIPT, directory_files, load_script, make_clip, serve_files  # noqa: E402
+
+
+@pytest.fixture(scope='session')
+def script():
+    """scripts/download_video.py, registered as download_video so worker processes can find it."""
+    return load_script(SCRIPT)
+
+
+@pytest.fixture(scope='session')
+def skill_script():
+    """The video-viewing skill's download_video.py."""
+    return load_script(SKILL_SCRIPT, 'skill_download_video')
+
+
+@pytest.fixture(scope='session')
+def clip(tmp_path_factory):
+    """A 4-second 320x240 H.264 clip at 25 fps with a keyframe every second."""
+    if not (shutil.which('ffmpeg') and shutil.which('ffprobe')):
+        pytest.skip('needs ffmpeg and ffprobe')
+    path = tmp_path_factory.mktemp('clip') / 'clip.mp4'
+    make_clip(path, 4, '320x240', 25, gop=25)
+    return path
+
+
+@pytest.fixture
+def serve():
+    """Serve the files of a directory over local HTTP, returning the base URL; ranges=False ignores Range headers."""
+    servers = []
+
+    def start(directory, ranges=True):
+        server = serve_files(directory_files(directory), ranges=ranges)
+        servers.append(server)
+        return f'http://127.0.0.1:{server.server_port}'
+
+    yield start
+    for server in servers:
+        server.shutdown()
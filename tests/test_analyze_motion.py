@@ -0,0 +1,20 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from _bench_common import SCRIPT, SKILL_SCRIPT
+
+
+@pytest.mark.parametrize('path', [SCRIPT, SKILL_SCRIPT], ids=['scripts', 'skill'])
+def test_json_output_is_only_the_analysis(path, clip):
+    result = subprocess.run(
+        [sys.executable, str(path), 'analyze-motion', str(clip), '--json'],
+        capture_output=True, text=True, check=True, env={**os.environ, 'VIDEO_NO_DAEMON': '1'},
+    )
+
+    report = json.loads(result.stdout)
+    assert report['frames_analyzed'] > 0
+    assert 'Analyz' in result.stderr
@@ -0,0 +1,74 @@
+import csv
+import os
+import subprocess
+import sys
+
+import pytest
+
+from _bench_common import SCRIPT
+
+# The bottom 40% of the frame, where the altered render draws its box
+LOWER_AREA = (0.0, 0.6, 1.0, 0.4)
+
+
+def render(clip, path, start=0, filters='null'):
+    """Re-encode clip from start seconds through filters at near-lossless quality, like a Remotion render."""
+    subprocess.run(['ffmpeg', '-v', 'error', '-ss', str(start), '-i', str(clip), '-vf', filters,
+                    '-c:v', 'libx264', '-crf', '12', '-pix_fmt', 'yuv420p', '-y', str(path)], check=True)
+    return path
+
+
+def altered_render(clip, path):
+    """Render clip with a red box over its lower part."""
+    return render(clip, path, filters='drawbox=x=40:y=180:w=240:h=40:color=red:t=fill')
+
+
+def test_clip_matches_itself(script, clip, tmp_path):
+    report = script.video_common.compare_videos(clip, clip, tmp_path / 'compare', width=None)
+
+    assert report['frames'] == 100
+    assert report['psnr']['min'] >= 99
+    assert report['ssim']['min'] == pytest.approx(1.0)
+    with open(report['scores']) as f:
+        assert len(list(csv.DictReader(f))) == 100
+
+
+def test_shifted_render_is_flagged_until_offset(script, clip, tmp_path):
+    # Starts one second into the clip, like a render of an animation that begins there
+    shifted = render(clip, tmp_path / 'shifted.mp4', start=1)
+
+    aligned = script.video_common.compare_videos(clip, shifted, tmp_path / 'aligned', offset=1.0, width=None)
+    misaligned = script.video_common.compare_videos(clip, shifted, tmp_path / 'misaligned', width=None)
+
+    assert aligned['ssim']['min'] > 0.95
+    assert misaligned['ssim']['mean'] < 0.95
+    assert misaligned['psnr']['mean'] < aligned['psnr']['mean'] - 10
+
+
+def test_altered_render_is_flagged_inside_area(script, clip, tmp_path):
+    altered = altered_render(clip, tmp_path / 'altered.mp4')
+
+    report = script.video_common.compare_videos(clip, altered, tmp_path / 'compare', width=None, area=LOWER_AREA,
+                                                worst=3)
+
+    assert report['ssim']['mean'] < 0.99
+    assert report['area_diff']['min'] > 10
+    assert len(report['worst']) == 3
+    assert all(os.path.exists(frame['image']) for frame in report['worst'])
+
+
+def test_min_ssim_fails_the_command(clip, tmp_path):
+    altered = altered_render(clip, tmp_path / 'altered.mp4')
+
+    def compare(candidate):
+        return subprocess.run(
+            [sys.executable, str(SCRIPT), 'compare', str(clip), str(candidate), '-o', str(tmp_path / 'compare'),
+             '--min-ssim', '0.99'],
+            capture_output=True, text=True, env={**os.environ, 'VIDEO_NO_DAEMON': '1'},
+        )
+
+    same, different = compare(clip), compare(altered)
+
+    assert same.returncode == 0, same.stdout + same.stderr
+    assert different.returncode == 1
+    assert 'below --min-ssim' in different.stdout
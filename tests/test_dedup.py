@@ -0,0 +1,53 @@
+import json
+import os
+import shutil
+import subprocess
+
+import pytest
+
+
+@pytest.fixture(scope='module')
+def static_clip(tmp_path_factory):
+    """A 320x240 clip at 25 fps that holds red for 2 seconds, then blue for 1."""
+    if not (shutil.which('ffmpeg') and shutil.which('ffprobe')):
+        pytest.skip('needs ffmpeg and ffprobe')
+    path = tmp_path_factory.mktemp('dedup') / 'static.mp4'
+    subprocess.run([
+        'ffmpeg', '-v', 'error', '-f', 'lavfi', '-i', 'color=c=red:s=320x240:r=25:d=2',
+        '-f', 'lavfi', '-i', 'color=c=blue:s=320x240:r=25:d=1',
+        '-filter_complex', '[0][1]concat=n=2:v=1,format=yuv420p', '-y', str(path),
+    ], check=True)
+    return path
+
+
+def test_duplicates_collapse(script, static_clip, tmp_path):
+    frames_dir = script.extract_frames(static_clip, tmp_path, fps=2, dedup=script.DEFAULT_DEDUP_DISTANCE,
+                                       frame_store=None)
+
+    with open(frames_dir / 'manifest.json') as f:
+        manifest = json.load(f)
+    # One red and one blue frame stand in for all six samples
+    assert [frame['timestamp'] for frame in manifest['frames']] == [0.0, 2.0]
+    assert sorted(name for name in os.listdir(frames_dir) if name != 'manifest.json') == [
+        frame['file'] for frame in manifest['frames']
+    ]
+    assert manifest['dedup_distance'] == script.DEFAULT_DEDUP_DISTANCE
+    # Each 1/2 s slot keeps its first frame, e.g. 0.52 s for the slot at 0.5 s
+    duplicates = manifest['duplicates']
+    assert [duplicate['timestamp'] for duplicate in duplicates] == pytest.approx([0.5, 1.0, 1.5, 2.5], abs=0.04)
+    assert [duplicate['same_as'] for duplicate in duplicates] == ['frame-0001.png'] * 3 + ['frame-0002.png']
+
+
+def test_skill_duplicates_collapse(skill_script, static_clip, tmp_path):
+    paths = skill_script.extract_frames(str(static_clip), str(tmp_path), num_frames=6,
+                                        dedup=skill_script.DEFAULT_DEDUP_DISTANCE, frame_store=None)
+
+    with open(os.path.join(os.path.dirname(paths[0]), 'manifest.json')) as f:
+        manifest = json.load(f)
+    assert len(paths) == len(manifest['frames']) == 2
+    kept = [os.path.basename(path) for path in paths]
+    assert len(manifest['duplicates']) == 4
+    assert {duplicate['same_as'] for duplicate in manifest['duplicates']} == set(kept)
+    # Every sample is either kept or recorded as a duplicate
+    assert len({frame['timestamp'] for frame in manifest['frames']}
+               | {duplicate['timestamp'] for duplicate in manifest['duplicates']}) == 6
@@ -0,0 +1,34 @@
+import os
+from pathlib import Path
+
+
+def serve_random_file(tmp_path, serve, size=3 * 1024 * 1024):
+    """Serve size random bytes as video.mp4, returning its URL."""
+    served = tmp_path / 'served'
+    served.mkdir()
+    (served / 'video.mp4').write_bytes(os.urandom(size))
+    return f'{serve(served)}/video.mp4'
+
+
+def test_repeat_cached_download_leaves_no_temporary_file(script, tmp_path, serve):
+    url = serve_random_file(tmp_path, serve)
+    output_dir = tmp_path / 'out'
+    output_dir.mkdir()
+
+    for _ in range(2):
+        path = script.fetch_video(url, output_dir, cache_dir=tmp_path / 'cache', show_progress=False)
+
+    assert sorted(os.listdir(output_dir)) == ['video.mp4']
+    assert Path(path).read_bytes() == (tmp_path / 'served' / 'video.mp4').read_bytes()
+
+
+def test_skill_repeat_cached_download_leaves_no_temporary_file(skill_script, tmp_path, serve):
+    url = serve_random_file(tmp_path, serve)
+    output_dir = str(tmp_path / 'out')
+
+    for _ in range(2):
+        path = skill_script.fetch_video(url, output_dir, show_progress=False, cache_dir=str(tmp_path / 'cache'))
+
+    assert sorted(os.listdir(output_dir)) == ['video.mp4']
+    with open(path, 'rb') as f:
+        assert f.read() == (tmp_path / 'served' / 'video.mp4').read_bytes()
@@ -0,0 +1,33 @@
+import os
+
+import pytest
+import requests
+
+
+class RecordingSession(requests.Session):
+    """A session that remembers the keyword arguments of every GET."""
+
+    def __init__(self):
+        super().__init__()
+        self.calls = []
+
+    def get(self, url, **kwargs):
+        self.calls.append(kwargs)
+        return super().get(url, **kwargs)
+
+
+@pytest.mark.parametrize('connections', [1, 4])
+def test_every_request_has_a_timeout(script, tmp_path, serve, connections):
+    served = tmp_path / 'served'
+    served.mkdir()
+    # Large enough to be split into byte ranges
+    (served / 'video.mp4').write_bytes(os.urandom(script.video_common.MIN_SEGMENT_SIZE + 1024 * 1024))
+    output_dir = tmp_path / 'out'
+    output_dir.mkdir()
+    session = RecordingSession()
+
+    script.fetch_video(f"{serve(served)}/video.mp4", output_dir, connections=connections, show_progress=False,
+                       session=session)
+
+    assert len(session.calls) > (1 if connections > 1 else 0)
+    assert all(call.get('timeout') for call in session.calls)
@@ -0,0 +1,58 @@
+import hashlib
+import os
+import subprocess
+import sys
+
+import pytest
+
+from _bench_common import SCRIPT, SKILL_SCRIPT
+
+
+def serve_random_file(tmp_path, serve, size):
+    """Serve size random bytes as video.mp4, returning its URL and the bytes."""
+    served = tmp_path / 'served'
+    served.mkdir()
+    data = os.urandom(size)
+    (served / 'video.mp4').write_bytes(data)
+    return f'{serve(served)}/video.mp4', data
+
+
+# Small files come over one stream, large ones as parallel byte ranges
+@pytest.mark.parametrize('size', [256 * 1024, 9 * 1024 * 1024], ids=['stream', 'ranges'])
+def test_wrong_sha256_deletes_the_download(script, tmp_path, serve, size):
+    url, data = serve_random_file(tmp_path, serve, size)
+    output_dir = tmp_path / 'out'
+
+    with pytest.raises(script.video_common.VerificationError, match='SHA-256'):
+        script.fetch_video(url, output_dir, show_progress=False, cache_dir=tmp_path / 'cache',
+                           expected_sha256='0' * 64)
+
+    assert os.listdir(output_dir) == []
+    # Nothing was cached either
+    assert script.video_common.cache_lookup(tmp_path / 'cache', url) is None
+
+
+def test_right_sha256_and_size_pass(script, tmp_path, serve):
+    url, data = serve_random_file(tmp_path, serve, 256 * 1024)
+
+    path = script.fetch_video(url, tmp_path / 'out', show_progress=False, expected_size=len(data),
+                              expected_sha256=hashlib.sha256(data).hexdigest().upper())
+
+    with open(path, 'rb') as f:
+        assert f.read() == data
+
+
+@pytest.mark.parametrize('path', [SCRIPT, SKILL_SCRIPT], ids=['scripts', 'skill'])
+@pytest.mark.parametrize('option, value', [('--expected-size', '1000'), ('--expected-sha256', 'ab' * 32)])
+def test_mismatch_fails_the_command(path, tmp_path, serve, option, value):
+    url, _ = serve_random_file(tmp_path, serve, 256 * 1024)
+    output_dir = tmp_path / 'out'
+
+    result = subprocess.run(
+        [sys.executable, str(path), url, '-o', str(output_dir), option, value, '--no-cache'],
+        capture_output=True, text=True, env={**os.environ, 'VIDEO_NO_DAEMON': '1'},
+    )
+
+    assert result.returncode == 1
+    assert 'expected' in result.stdout + result.stderr
+    assert not output_dir.exists() or os.listdir(output_dir) == []
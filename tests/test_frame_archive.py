@@ -0,0 +1,49 @@
+import json
+import os
+
+import pytest
+
+
+def frame_files(frames_dir):
+    """Return the manifest timestamps of a frames directory and the bytes of its frame files."""
+    with open(os.path.join(frames_dir, 'manifest.json')) as f:
+        frames = json.load(f)['frames']
+    images = []
+    for frame in frames:
+        with open(os.path.join(frames_dir, frame['file']), 'rb') as f:
+            images.append(f.read())
+    return [frame['timestamp'] for frame in frames], images
+
+
+@pytest.mark.parametrize('image_format', ['png', 'raw'])
+def test_pack_then_export_gives_the_same_pngs(script, clip, tmp_path, image_format):
+    (tmp_path / 'files').mkdir()
+    (tmp_path / 'packed').mkdir()
+    files_dir = script.extract_frames(clip, tmp_path / 'files', fps=2, frame_store=None)
+    packed_dir = script.extract_frames(clip, tmp_path / 'packed', fps=2, image_format=image_format, pack=True,
+                                       frame_store=None)
+    archive_path = packed_dir / script.FRAME_ARCHIVE_NAME
+    assert sorted(os.listdir(packed_dir)) == sorted([script.FRAME_ARCHIVE_NAME, 'manifest.json'])
+
+    # Raw frames are encoded as PNG on the way out
+    paths = script.video_common.export_frames(archive_path, tmp_path / 'exported')
+
+    assert [os.path.basename(path) for path in paths] == sorted(
+        name for name in os.listdir(files_dir) if name != 'manifest.json'
+    )
+    assert frame_files(tmp_path / 'exported') == frame_files(files_dir)
+
+
+def test_export_picks_frames_by_number_and_time(script, clip, tmp_path):
+    (tmp_path / 'packed').mkdir()
+    packed_dir = script.extract_frames(clip, tmp_path / 'packed', fps=2, pack=True, frame_store=None)
+    archive_path = packed_dir / script.FRAME_ARCHIVE_NAME
+
+    by_number = script.video_common.export_frames(archive_path, tmp_path / 'numbers', numbers=[2, 5, 99])
+    by_time = script.video_common.export_frames(archive_path, tmp_path / 'times', start=1.0, end=2.0)
+
+    assert [os.path.basename(path) for path in by_number] == ['frame-0002.png', 'frame-0005.png']
+    assert [os.path.basename(path) for path in by_time] == ['frame-0003.png', 'frame-0004.png']
+    assert frame_files(tmp_path / 'times')[0] == pytest.approx([1.0, 1.5], abs=0.04)
+    with script.video_common.FrameArchive(archive_path) as archive, open(by_number[1], 'rb') as f:
+        assert f.read() == archive[4]
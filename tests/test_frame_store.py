@@ -0,0 +1,28 @@
+import os
+
+
+def test_rerun_into_same_directory_reuses_frames_without_leftovers(script, clip, tmp_path):
+    store = tmp_path / 'store'
+    (tmp_path / 'out').mkdir()
+    first = script.extract_frames(clip, tmp_path / 'out', fps=2, frame_store=store)
+    assert first is not None
+    files = sorted(os.listdir(first))
+
+    second = script.extract_frames(clip, tmp_path / 'out', fps=2, frame_store=store)
+
+    assert second == first
+    assert sorted(os.listdir(second)) == files
+    assert not [name for name in files if name.endswith('.tmp')]
+
+
+def test_skill_rerun_into_same_directory_reuses_frames_without_leftovers(skill_script, clip, tmp_path):
+    store = str(tmp_path / 'store')
+    first = skill_script.extract_frames(str(clip), str(tmp_path / 'out'), num_frames=6, frame_store=store)
+    assert len(first) == 6
+
+    second = skill_script.extract_frames(str(clip), str(tmp_path / 'out'), num_frames=6, frame_store=store)
+
+    assert second == first
+    assert sorted(os.listdir(tmp_path / 'out' / 'clip_frames')) == sorted(
+        [os.path.basename(path) for path in first] + ['manifest.json']
+    )
@@ -0,0 +1,43 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from _bench_common import SCRIPT, SKILL_SCRIPT
+
+
+def run_json(path, *args):
+    """Run a script with --json, returning (exit code, result document, stderr)."""
+    result = subprocess.run(
+        [sys.executable, str(path), *args, '--json', '--no-cache'],
+        capture_output=True, text=True, env={**os.environ, 'VIDEO_NO_DAEMON': '1'},
+    )
+    return result.returncode, json.loads(result.stdout), result.stderr
+
+
+@pytest.mark.parametrize('path', [SCRIPT, SKILL_SCRIPT], ids=['scripts', 'skill'])
+def test_error_comes_from_the_failure(path, tmp_path, serve):
+    served = tmp_path / 'served'
+    served.mkdir()
+
+    code, document, _ = run_json(path, f'{serve(served)}/missing.mp4', '-o', str(tmp_path / 'out'))
+
+    assert code == 1
+    assert document['ok'] is False
+    assert '404' in document['error']
+
+
+@pytest.mark.parametrize('path', [SCRIPT, SKILL_SCRIPT], ids=['scripts', 'skill'])
+def test_successful_download_has_no_error(path, tmp_path, serve):
+    served = tmp_path / 'served'
+    served.mkdir()
+    (served / 'video.mp4').write_bytes(os.urandom(64 * 1024))
+
+    code, document, stderr = run_json(path, f'{serve(served)}/video.mp4', '-o', str(tmp_path / 'out'))
+
+    assert code == 0
+    assert document['ok'] is True
+    assert document['error'] is None
+    assert 'video.mp4' in stderr
@@ -0,0 +1,68 @@
+import argparse
+import os
+import shutil
+import sqlite3
+
+import pytest
+
+
+@pytest.fixture
+def library(script, clip, tmp_path):
+    """A directory with two copies of the clip, scanned into an index; returns (directory, index path)."""
+    if not shutil.which('ffprobe'):
+        pytest.skip('needs ffprobe')
+    videos = tmp_path / 'videos'
+    videos.mkdir()
+    shutil.copy(clip, videos / 'a.mp4')
+    shutil.copy(clip, videos / 'b.mp4')
+    index = tmp_path / 'library.sqlite'
+    assert script.video_common.scan_library(videos, index, jobs=2, show_progress=False) == (2, 0, 0, 0)
+    return videos, index
+
+
+def test_rescan_skips_unchanged_files(script, library):
+    videos, index = library
+    common = script.video_common
+
+    assert common.scan_library(videos, index, show_progress=False) == (0, 2, 0, 0)
+
+    # A changed file is scanned again, a deleted one loses its row
+    with open(videos / 'a.mp4', 'ab') as f:
+        f.write(b'\0' * 16)
+    os.remove(videos / 'b.mp4')
+    assert common.scan_library(videos, index, show_progress=False) == (1, 0, 1, 0)
+    assert [row['path'] for row in common.query_library(index)] == [str(videos / 'a.mp4')]
+
+    assert common.scan_library(videos, index, rescan=True, show_progress=False) == (1, 0, 0, 0)
+
+
+def test_filters_select_rows(script, library):
+    videos, index = library
+    common = script.video_common
+
+    def query(*filters):
+        return [os.path.basename(row['path'])
+                for row in common.query_library(index, videos, [common.parse_library_filter(f) for f in filters])]
+
+    assert query() == ['a.mp4', 'b.mp4']
+    assert query('width=320', 'height >= 240', 'codec=h264') == ['a.mp4', 'b.mp4']
+    assert query('path~b.mp') == ['b.mp4']
+    assert query('duration<1') == []
+    # Values are bound parameters, never SQL
+    assert query("codec=h264' OR 1=1 --") == []
+    assert query('path~%') == []
+
+
+@pytest.mark.parametrize('value', ['height', 'height>=tall', 'rowid=1', 'height=1; DROP TABLE videos'])
+def test_invalid_filters_are_rejected(script, value):
+    with pytest.raises(argparse.ArgumentTypeError):
+        script.video_common.parse_library_filter(value)
+
+
+def test_query_does_not_create_an_index(script, tmp_path):
+    index = tmp_path / 'missing.sqlite'
+
+    with pytest.raises(sqlite3.Error):
+        script.video_common.query_library(index)
+
+    assert not index.exists()
@@ -0,0 +1,79 @@
+import json
+import os
+import shutil
+import subprocess
+
+import pytest
+
+# Red hold, testsrc motion, blue hold, mandelbrot motion, 1.5 s each at 25 fps: every change of scene is a cut
+SCENES = ['color=c=red', 'testsrc', 'color=c=blue', 'mandelbrot']
+CUTS = [1.52, 3.04, 4.56]
+
+
+def render_scenes(path, scenes, duration=1.5):
+    """Join lavfi sources of duration seconds each into one 320x240 H.264 clip."""
+    cmd = ['ffmpeg', '-v', 'error']
+    for scene in scenes:
+        cmd += ['-f', 'lavfi', '-i', f'{scene}{":" if "=" in scene else "="}s=320x240:r=25']
+    trims = ''.join(f'[{i}]trim=duration={duration},setpts=PTS-STARTPTS[s{i}];' for i in range(len(scenes)))
+    joined = ''.join(f'[s{i}]' for i in range(len(scenes)))
+    cmd += ['-filter_complex', f'{trims}{joined}concat=n={len(scenes)}:v=1,format=yuv420p', '-y', str(path)]
+    subprocess.run(cmd, check=True)
+
+
+@pytest.fixture(scope='module')
+def scenes_clip(tmp_path_factory):
+    if not (shutil.which('ffmpeg') and shutil.which('ffprobe')):
+        pytest.skip('needs ffmpeg and ffprobe')
+    path = tmp_path_factory.mktemp('motion') / 'scenes.mp4'
+    render_scenes(path, SCENES)
+    return path
+
+
+def test_cuts_bound_phases(script, scenes_clip):
+    report = script.analyze_motion(scenes_clip)
+
+    phases = [(phase['kind'], phase['start'], phase['end']) for phase in report['phases']]
+    assert [kind for kind, _, _ in phases] == ['hold', 'motion', 'hold', 'motion']
+    boundaries = [end for _, _, end in phases[:-1]]
+    assert boundaries == pytest.approx([CUTS[0] - 0.04, CUTS[1], CUTS[2] - 0.04], abs=0.05)
+    assert [cut for phase in report['phases'] for cut in phase['cuts']] == pytest.approx(CUTS)
+    # Spikes must not lift the threshold above the testsrc motion
+    assert report['threshold'] < 0.4
+
+
+def test_cut_between_holds_is_kept(script, tmp_path):
+    if not (shutil.which('ffmpeg') and shutil.which('ffprobe')):
+        pytest.skip('needs ffmpeg and ffprobe')
+    clip = tmp_path / 'cut.mp4'
+    render_scenes(clip, ['color=c=red', 'color=c=blue'], duration=1)
+
+    kinds = [phase['kind'] for phase in script.analyze_motion(clip)['phases']]
+
+    assert kinds == ['hold', 'motion', 'hold']
+
+
+@pytest.mark.parametrize('budget', [4, 8])
+def test_smart_sampling_covers_every_transition(script, scenes_clip, budget):
+    timestamps, phases = script.smart_timestamps(scenes_clip, budget)
+
+    assert len(timestamps) <= max(budget, 7)
+    for cut in CUTS:
+        assert any(abs(timestamp - cut) <= 0.04 for timestamp in timestamps), (cut, timestamps)
+    for phase in phases:
+        assert any(phase['start'] <= timestamp <= phase['end'] for timestamp in timestamps), (phase, timestamps)
+
+
+def test_smart_extraction_samples_each_transition(script, skill_script, scenes_clip, tmp_path):
+    output_dir = tmp_path / 'script'
+    output_dir.mkdir()
+    frames_dir = script.extract_frames(scenes_clip, output_dir, smart=8, frame_store=None)
+    skill_frames = skill_script.extract_frames(str(scenes_clip), str(tmp_path / 'skill'), num_frames=8, smart=True,
+                                               frame_store=None)
+
+    for manifest in (frames_dir / 'manifest.json', os.path.join(os.path.dirname(skill_frames[0]), 'manifest.json')):
+        with open(manifest) as f:
+            times = [frame['timestamp'] for frame in json.load(f)['frames']]
+        assert len(times) == 8
+        for cut in CUTS:
+            assert any(abs(timestamp - cut) <= 0.04 for timestamp in times), (cut, times)
@@ -0,0 +1,69 @@
+import hashlib
+import json
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+
+
+def frame_hashes(frames_dir):
+    """Map every frame in the manifest to (timestamp, SHA-256 of its file)."""
+    with open(os.path.join(frames_dir, 'manifest.json')) as f:
+        manifest = json.load(f)
+    hashes = {}
+    for frame in manifest['frames']:
+        with open(os.path.join(frames_dir, frame['file']), 'rb') as f:
+            hashes[frame['file']] = (frame['timestamp'], hashlib.sha256(f.read()).hexdigest())
+    return hashes
+
+
+def test_parallel_extraction_matches_sequential(script, clip, tmp_path):
+    runs = {}
+    for jobs in (1, 3):
+        output_dir = tmp_path / f'jobs-{jobs}'
+        output_dir.mkdir()
+        runs[jobs] = frame_hashes(script.extract_frames(clip, output_dir, fps=5, jobs=jobs, image_format='png'))
+
+    assert len(runs[1]) == 20
+    assert runs[3] == runs[1]
+
+
+def test_parallel_window_extraction_matches_sequential(script, clip, tmp_path):
+    runs = {}
+    for jobs in (1, 2):
+        output_dir = tmp_path / f'jobs-{jobs}'
+        output_dir.mkdir()
+        runs[jobs] = frame_hashes(script.extract_frames(clip, output_dir, fps=3, start=0.7, end=3.3, jobs=jobs))
+
+    assert runs[1]
+    assert runs[2] == runs[1]
+
+
+def test_skill_parallel_extraction_matches_sequential(skill_script, clip, tmp_path):
+    runs = {}
+    for jobs in (1, 3):
+        frames = skill_script.extract_frames(str(clip), str(tmp_path / f'jobs-{jobs}'), num_frames=12, jobs=jobs)
+        runs[jobs] = frame_hashes(os.path.dirname(frames[0]))
+
+    assert len(runs[1]) == 12
+    assert runs[3] == runs[1]
+
+
+def test_shared_pool_gets_absolute_paths(script, clip, tmp_path, monkeypatch):
+    # Like under serve: the pool's workers start in one directory, the request runs in another
+    daemon_dir = tmp_path / 'daemon'
+    client_dir = tmp_path / 'client'
+    daemon_dir.mkdir()
+    (client_dir / 'frames').mkdir(parents=True)
+    shutil.copy(clip, client_dir / 'clip.mp4')
+
+    monkeypatch.chdir(daemon_dir)
+    with ProcessPoolExecutor(max_workers=2) as pool:
+        for future in [pool.submit(os.getpid) for _ in range(2)]:
+            future.result()
+        monkeypatch.setattr(script.video_common, 'SHARED_POOL', pool)
+        monkeypatch.setattr(script.video_common, 'SHARED_POOL_WORKERS', 2)
+        monkeypatch.chdir(client_dir)
+        times = script.video_common.extract_frames_parallel('clip.mp4', 'frames/frame-%04d.png', 2, fps=5)
+
+    assert len(times) == 20
+    assert sorted(os.listdir(client_dir / 'frames')) == [f'frame-{n:04d}.png' for n in range(1, 21)]
@@ -0,0 +1,45 @@
+import json
+import os
+import shutil
+import subprocess
+import sys
+
+import pytest
+
+from _bench_common import SCRIPT, make_clip
+
+
+def frames_of(url, output_dir, *args):
+    """Download url with frames at 5 fps from 2.3-3.3s, returning [(timestamp, image bytes)] from its manifest."""
+    result = subprocess.run(
+        [sys.executable, str(SCRIPT), url, '-o', str(output_dir), '--start', '2.3', '--end', '3.3', '-f', '--fps', '5',
+         *args, '--json', '--no-cache'],
+        capture_output=True, text=True, env={**os.environ, 'VIDEO_NO_DAEMON': '1'},
+    )
+    assert result.returncode == 0, result.stderr
+    manifest = json.loads(result.stdout)['frames']['manifest']
+    with open(manifest) as f:
+        frames = json.load(f)['frames']
+    frames_dir = os.path.dirname(manifest)
+    return [(frame['timestamp'], open(os.path.join(frames_dir, frame['file']), 'rb').read()) for frame in frames]
+
+
+# WebM cannot hide the frames before the window start, so its clip begins at the keyframe instead
+@pytest.mark.parametrize('name, encoder_args', [
+    ('video.mp4', ('-pix_fmt', 'yuv420p')),
+    ('video.webm', ('-c:v', 'libvpx', '-b:v', '1M')),
+], ids=['mp4', 'webm'])
+def test_partial_frames_match_full_download(tmp_path, serve, name, encoder_args):
+    if not (shutil.which('ffmpeg') and shutil.which('ffprobe')):
+        pytest.skip('needs ffmpeg and ffprobe')
+    served = tmp_path / 'served'
+    served.mkdir()
+    make_clip(served / name, 4, '320x240', 30, encoder_args, gop=60)
+    url = f'{serve(served)}/{name}'
+
+    partial = frames_of(url, tmp_path / 'partial', '--partial')
+    full = frames_of(url, tmp_path / 'full')
+
+    assert [timestamp for timestamp, _ in partial] == pytest.approx([2.3, 2.5, 2.7, 2.9, 3.1])
+    assert [timestamp for timestamp, _ in partial] == [timestamp for timestamp, _ in full]
+    assert [image for _, image in partial] == [image for _, image in full]
@@ -0,0 +1,60 @@
+import os
+
+import pytest
+
+
+def serve_random_file(tmp_path, serve, size, ranges=True):
+    """Serve size random bytes as video.mp4, returning its URL and the bytes."""
+    served = tmp_path / 'served'
+    served.mkdir()
+    data = os.urandom(size)
+    (served / 'video.mp4').write_bytes(data)
+    return f'{serve(served, ranges)}/video.mp4', data
+
+
+def test_segments_are_written_at_their_offsets(script, tmp_path, serve):
+    url, data = serve_random_file(tmp_path, serve, 1024 * 1024)
+    part_path = tmp_path / 'video.mp4.part'
+    part_path.write_bytes(bytes(len(data)))
+    # The second segment has its first bytes already, as after an interruption
+    segments = [[0, 299_999, 0], [300_000, 799_999, 1000], [800_000, len(data) - 1, 0]]
+    with open(part_path, 'r+b') as f:
+        f.seek(300_000)
+        f.write(data[300_000:301_000])
+
+    for segment in segments:
+        script.video_common.download_segment(url, str(part_path), segment)
+
+    assert [written for _, _, written in segments] == [300_000, 500_000, len(data) - 800_000]
+    assert part_path.read_bytes() == data
+
+
+def test_segment_refuses_a_server_that_ignores_ranges(script, tmp_path, serve):
+    url, data = serve_random_file(tmp_path, serve, 64 * 1024, ranges=False)
+    part_path = tmp_path / 'video.mp4.part'
+    part_path.write_bytes(bytes(len(data)))
+
+    with pytest.raises(script.video_common.RangeNotSupportedError):
+        script.video_common.download_segment(url, str(part_path), [1024, len(data) - 1, 0])
+
+
+def test_parallel_download_is_identical(script, tmp_path, serve, capsys):
+    url, data = serve_random_file(tmp_path, serve, 4 * script.video_common.MIN_SEGMENT_SIZE + 12345)
+
+    path = script.fetch_video(url, tmp_path / 'out', connections=4, show_progress=False)
+
+    assert 'Using 4 parallel connections' in capsys.readouterr().out
+    assert sorted(os.listdir(tmp_path / 'out')) == ['video.mp4']
+    with open(path, 'rb') as f:
+        assert f.read() == data
+
+
+def test_ignored_ranges_fall_back_to_one_stream(script, tmp_path, serve, capsys):
+    url, data = serve_random_file(tmp_path, serve, 2 * script.video_common.MIN_SEGMENT_SIZE, ranges=False)
+
+    path = script.fetch_video(url, tmp_path / 'out', connections=4, show_progress=False)
+
+    assert 'restarting over a single connection' in capsys.readouterr().out
+    assert sorted(os.listdir(tmp_path / 'out')) == ['video.mp4']
+    with open(path, 'rb') as f:
+        assert f.read() == data
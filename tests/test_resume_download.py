@@ -0,0 +1,88 @@
+import json
+import os
+
+import requests
+
+DONE = 1024 * 1024
+
+
+class RecordingSession(requests.Session):
+    """A session that remembers the Range header of every GET (None when there is none)."""
+
+    def __init__(self):
+        super().__init__()
+        self.ranges = []
+
+    def get(self, url, **kwargs):
+        self.ranges.append((kwargs.get('headers') or {}).get('Range'))
+        return super().get(url, **kwargs)
+
+
+def interrupted_download(script, tmp_path, serve, stale=False):
+    """Serve random bytes as video.mp4 and leave a .part/.part.json pair with DONE bytes of its first segment.
+
+    stale writes bytes that do not match the served file, as if it had
+    changed since. Returns the URL, the served bytes and the output directory.
+    """
+    common = script.video_common
+    served = tmp_path / 'served'
+    served.mkdir()
+    data = os.urandom(2 * common.MIN_SEGMENT_SIZE)
+    (served / 'video.mp4').write_bytes(data)
+    url = f'{serve(served)}/video.mp4'
+
+    with requests.get(url, stream=True, timeout=10) as response:
+        validators = common.get_validators(response)
+    state = common.new_resume_state(url, len(data), validators, 2)
+    state['segments'][0][2] = state['bytes_written'] = DONE
+    output_dir = tmp_path / 'out'
+    output_dir.mkdir()
+    written = b'\xff' * DONE if stale else data[:DONE]
+    (output_dir / 'video.mp4.part').write_bytes(written + bytes(len(data) - DONE))
+    common.save_resume_state(str(output_dir / 'video.mp4.part.json'), state)
+    return url, data, output_dir
+
+
+def test_interrupted_download_resumes(script, tmp_path, serve, capsys):
+    url, data, output_dir = interrupted_download(script, tmp_path, serve)
+    session = RecordingSession()
+
+    path = script.fetch_video(url, output_dir, connections=2, show_progress=False, session=session)
+
+    assert 'Resuming download at 1.0 MB' in capsys.readouterr().out
+    # The first segment continues where it stopped; nothing is fetched twice
+    assert f'bytes={DONE}-{script.video_common.MIN_SEGMENT_SIZE - 1}' in session.ranges
+    assert not any(r and r.startswith('bytes=0-') for r in session.ranges)
+    assert sorted(os.listdir(output_dir)) == ['video.mp4']
+    with open(path, 'rb') as f:
+        assert f.read() == data
+
+
+def test_changed_etag_discards_the_partial_file(script, tmp_path, serve, capsys):
+    url, data, output_dir = interrupted_download(script, tmp_path, serve, stale=True)
+    state_path = output_dir / 'video.mp4.part.json'
+    state = json.loads(state_path.read_text())
+    state['etag'] = '"an-older-version"'
+    state_path.write_text(json.dumps(state))
+
+    path = script.fetch_video(url, output_dir, connections=2, show_progress=False)
+
+    assert 'Resuming' not in capsys.readouterr().out
+    assert sorted(os.listdir(output_dir)) == ['video.mp4']
+    with open(path, 'rb') as f:
+        assert f.read() == data
+
+
+def test_changed_last_modified_discards_the_partial_file(script, tmp_path, serve, capsys):
+    url, data, output_dir = interrupted_download(script, tmp_path, serve, stale=True)
+    # Same ETag, but the file on the server was modified since
+    served = tmp_path / 'served' / 'video.mp4'
+    mtime = served.stat().st_mtime + 3600
+    os.utime(served, (mtime, mtime))
+
+    path = script.fetch_video(url, output_dir, connections=2, show_progress=False)
+
+    assert 'Resuming' not in capsys.readouterr().out
+    assert sorted(os.listdir(output_dir)) == ['video.mp4']
+    with open(path, 'rb') as f:
+        assert f.read() == data
@@ -0,0 +1,82 @@
+import json
+import os
+import shutil
+import subprocess
+import sys
+import time
+
+import pytest
+
+from _bench_common import SCRIPT, Throttle, directory_files, make_clip, serve_files
+
+ENCODER_ARGS = ('-c:v', 'libx264', '-preset', 'veryfast', '-pix_fmt', 'yuv420p')
+# About 0.75 MB, so the throttled download takes about 3 seconds
+CLIP_BITRATE = '1M'
+BANDWIDTH = 256 * 1024
+POLL_INTERVAL = 0.01
+
+
+@pytest.fixture(scope='module')
+def served_clips(tmp_path_factory):
+    """Serve a faststart MP4 and one with its moov index last, throttled to BANDWIDTH; returns the base URL."""
+    if not (shutil.which('ffmpeg') and shutil.which('ffprobe')):
+        pytest.skip('needs ffmpeg and ffprobe')
+    clips = tmp_path_factory.mktemp('stream')
+    make_clip(clips / 'faststart.mp4', 6, '320x240', 30, (*ENCODER_ARGS, '-movflags', '+faststart'), gop=60,
+              bitrate=CLIP_BITRATE)
+    make_clip(clips / 'moov-last.mp4', 6, '320x240', 30, ENCODER_ARGS, gop=60, bitrate=CLIP_BITRATE)
+    server = serve_files(directory_files(clips), Throttle(BANDWIDTH))
+    yield f'http://127.0.0.1:{server.server_port}'
+    server.shutdown()
+
+
+def run_script(url, out, *args, poll=None):
+    """Run the script extracting 2 frames per second from url into out, returning (exit code, its output).
+
+    poll() is called every POLL_INTERVAL while the script runs.
+    """
+    log_path = out.with_suffix('.log')
+    with open(log_path, 'w') as log:
+        process = subprocess.Popen(
+            [sys.executable, str(SCRIPT), url, '-f', '--fps', '2', '-o', str(out), '--no-cache', *args],
+            stdout=log, stderr=subprocess.STDOUT, env={**os.environ, 'VIDEO_NO_DAEMON': '1'},
+        )
+        while process.poll() is None:
+            if poll:
+                poll()
+            time.sleep(POLL_INTERVAL)
+    return process.returncode, log_path.read_text()
+
+
+def frames_of(frames_dir):
+    """Return the manifest entries of a frames directory and the bytes of its frame files."""
+    with open(frames_dir / 'manifest.json') as f:
+        frames = json.load(f)['frames']
+    return frames, [(frames_dir / frame['file']).read_bytes() for frame in frames]
+
+
+def test_frames_appear_before_the_download_finishes(served_clips, tmp_path):
+    out = tmp_path / 'stream'
+    downloaded_at_first_frame = []
+
+    def poll():
+        if not downloaded_at_first_frame and any(out.glob('faststart_frames/frame-*')):
+            downloaded_at_first_frame.append((out / 'faststart.mp4').exists())
+
+    code, output = run_script(f'{served_clips}/faststart.mp4', out, '--stream', poll=poll)
+
+    assert code == 0, output
+    assert downloaded_at_first_frame == [False]
+    # The same frames as extracting after the download
+    code, output = run_script(f'{served_clips}/faststart.mp4', tmp_path / 'after')
+    assert code == 0, output
+    assert frames_of(out / 'faststart_frames') == frames_of(tmp_path / 'after' / 'faststart_frames')
+
+
+def test_moov_at_end_falls_back_to_extracting_after_the_download(served_clips, tmp_path):
+    code, output = run_script(f'{served_clips}/moov-last.mp4', tmp_path / 'out', '--stream')
+
+    assert code == 0, output
+    assert 'extracting frames afterwards' in output
+    frames, _ = frames_of(tmp_path / 'out' / 'moov-last_frames')
+    assert len(frames) == 12